@@ -0,0 +1 @@
+"""Python tooling for the MapServer GFS performance lab."""
@@ -0,0 +1,91 @@
+"""Streaming reader for the nginx ``wms_json`` access log.
+
+Records are read one line at a time, so captures of any size can be
+replayed or analyzed without loading them into memory. Plain and gzipped
+JSONL files are supported, and ``-`` reads from stdin.
+"""
+
+import datetime
+import gzip
+import json
+import sys
+from urllib.parse import parse_qsl, urlsplit
+
+TIME_LOCAL_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+
+
+def open_log(path):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt")
+    return open(path)
+
+
+def iter_records(path):
+    """Yield one dict per valid JSON line, skipping blank and corrupt lines"""
+    f = open_log(path)
+    try:
+        for line in f:
+            line = line.strip()
+            if not line.startswith("{"):
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def parse_time_local(value):
+    return datetime.datetime.strptime(value, TIME_LOCAL_FORMAT).timestamp()
+
+
+def request_time(record):
+    try:
+        return float(record.get("request_time") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def start_time(record):
+    """Epoch seconds at which the request arrived.
+
+    nginx logs when the response completes, so the request duration is
+    subtracted. ``msec`` (millisecond resolution) is preferred over
+    ``time_local`` (second resolution) when the log has it. None when the
+    record has neither, or they do not parse (a truncated line).
+    """
+    try:
+        if record.get("msec"):
+            end = float(record["msec"])
+        elif record.get("time_local"):
+            end = parse_time_local(record["time_local"])
+        else:
+            return None
+    except (TypeError, ValueError):
+        return None
+    return end - request_time(record)
+
+
+def request_uri(record):
+    """Request path and query string, e.g. ``/cgi-bin/mapserv?MAP=GFS&...``"""
+    request = record.get("request")
+    if request:
+        parts = request.split(" ")
+        if len(parts) >= 2:
+            return parts[1]
+    return record.get("uri") or record.get("path")
+
+
+def request_method(record):
+    request = record.get("request") or ""
+    return request.split(" ", 1)[0] or "GET"
+
+
+def query_params(record):
+    """Query parameters of the logged request with upper-cased keys"""
+    uri = request_uri(record) or ""
+    return {k.upper(): v for k, v in parse_qsl(urlsplit(uri).query, True)}
@@ -0,0 +1,287 @@
+"""Decoded raster bands shared by every render process of a host.
+
+Each GDAL process keeps its own block cache (``GDAL_CACHEMAX``). With N
+render workers the same COG or GRIB2 band is decoded N times and cached N
+times, and a freshly started worker pays the decode on its first requests.
+``BandCache`` decodes each (file, band) once per data version into raw,
+uncompressed arrays under a shared directory (``/dev/shm`` by default):
+
+    /dev/shm/perflab-bands/<source hash>-b580/<version>/
+        0.npy 1.npy ...   full resolution and each overview, as .npy
+        band.vrt          VRTRawRasterBand over 0.npy, overviews over 1.npy...
+
+GDAL (MapServer in perflab.renderer, perflab.native) opens ``band.vrt``.
+Raw reads are plain copies out of the page cache, which all processes
+share, so no worker decodes and memory stops growing with the worker
+count.
+
+The version is the source's mtime, size and inode. When new data lands,
+the next lookup decodes it under a file lock (one decoder per host), the
+new version directory is renamed into place and older versions are
+deleted. Processes still reading an old version keep their open files
+until they move on. Warm and prune ahead of traffic::
+
+    python -m perflab.bandcache --maps gfs.map mrms.map goes.map
+"""
+
+import argparse
+import fcntl
+import glob
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from perflab import mapfile, metrics
+
+log = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DIR = "/dev/shm/perflab-bands"
+VRT_NAME = "band.vrt"
+
+LOOKUPS = metrics.counter(
+    "perflab_bandcache_lookups_total",
+    "Band cache lookups, by outcome (hit, shared, decoded)",
+    ["outcome"],
+)
+DECODE_SECONDS = metrics.histogram(
+    "perflab_bandcache_decode_seconds",
+    "Time to decode a band version into the shared cache",
+    buckets=[0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30],
+)
+
+
+# GDAL data type name -> little-endian NumPy dtype
+DTYPES = {
+    "Byte": "u1",
+    "Int8": "i1",
+    "UInt16": "<u2",
+    "Int16": "<i2",
+    "UInt32": "<u4",
+    "Int32": "<i4",
+    "Float32": "<f4",
+    "Float64": "<f8",
+}
+
+
+def source_version(path):
+    """Version of a data file: changes whenever it is rewritten or replaced"""
+    st = os.stat(path)
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}-{st.st_ino:x}"
+
+
+def _raster_band(dtype_name, nodata, filename, offset, width, itemsize, overviews):
+    lines = [
+        f'  <VRTRasterBand dataType="{dtype_name}" band="1" '
+        'subClass="VRTRawRasterBand">'
+    ]
+    if nodata is not None:
+        lines.append(f"    <NoDataValue>{nodata!r}</NoDataValue>")
+    lines += [
+        f'    <SourceFilename relativeToVRT="1">{filename}</SourceFilename>',
+        f"    <ImageOffset>{offset}</ImageOffset>",
+        f"    <PixelOffset>{itemsize}</PixelOffset>",
+        f"    <LineOffset>{width * itemsize}</LineOffset>",
+        "    <ByteOrder>LSB</ByteOrder>",
+    ]
+    for overview in overviews:
+        lines += [
+            "    <Overview>",
+            f'      <SourceFilename relativeToVRT="1">{overview}</SourceFilename>',
+            "      <SourceBand>1</SourceBand>",
+            "    </Overview>",
+        ]
+    lines.append("  </VRTRasterBand>")
+    return lines
+
+
+def write_vrt(path, levels, srs, geotransform, dtype_name, nodata):
+    """VRT over the raw ``levels`` [(npy file, header bytes, width, height)]"""
+    directory = os.path.dirname(path)
+    full_width, full_height = levels[0][2:]
+    for i, (filename, offset, width, height) in enumerate(levels):
+        x_scale, y_scale = full_width / width, full_height / height
+        gt = list(geotransform)
+        gt[1], gt[4] = gt[1] * x_scale, gt[4] * x_scale
+        gt[2], gt[5] = gt[2] * y_scale, gt[5] * y_scale
+        itemsize = np.dtype(DTYPES[dtype_name]).itemsize
+        overviews = [f"{j}.vrt" for j in range(1, len(levels))] if i == 0 else []
+        lines = [
+            f'<VRTDataset rasterXSize="{width}" rasterYSize="{height}">',
+            f"  <SRS>{escape(srs)}</SRS>",
+            f"  <GeoTransform>{', '.join(repr(v) for v in gt)}</GeoTransform>",
+            *_raster_band(
+                dtype_name, nodata, filename, offset, width, itemsize, overviews
+            ),
+            "</VRTDataset>",
+        ]
+        name = path if i == 0 else os.path.join(directory, f"{i}.vrt")
+        with open(name, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+class BandCache:
+    def __init__(self, directory=DEFAULT_DIR):
+        from osgeo import gdal
+
+        gdal.UseExceptions()
+        self.gdal = gdal
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # (source, band) -> (version, VRT path), this process's view
+        self._known = {}
+        self._lock = threading.Lock()
+
+    def entry_dir(self, source, band):
+        digest = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{digest}-b{band}")
+
+    def path(self, source, band=1):
+        """VRT of the current version of ``band`` of ``source``, decoding if needed"""
+        version = source_version(source)
+        known = self._known.get((source, band))
+        if known and known[0] == version:
+            LOOKUPS.labels("hit").inc()
+            return known[1]
+        entry = self.entry_dir(source, band)
+        vrt = os.path.join(entry, version, VRT_NAME)
+        if os.path.exists(vrt):
+            LOOKUPS.labels("shared").inc()
+        else:
+            os.makedirs(entry, exist_ok=True)
+            with open(os.path.join(entry, ".lock"), "w") as lock:
+                # One process decodes; the others wait and then find the result
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if os.path.exists(vrt):
+                    LOOKUPS.labels("shared").inc()
+                else:
+                    self._decode(source, band, entry, version)
+                    LOOKUPS.labels("decoded").inc()
+        with self._lock:
+            self._known[(source, band)] = (version, vrt)
+        return vrt
+
+    def _decode(self, source, band_number, entry, version):
+        start = time.time()
+        dataset = self.gdal.Open(source)
+        band = dataset.GetRasterBand(band_number)
+        dtype_name = self.gdal.GetDataTypeName(band.DataType)
+        if dtype_name not in DTYPES:
+            raise ValueError(f"{source} band {band_number}: {dtype_name} not cached")
+        levels = [band] + [band.GetOverview(i) for i in range(band.GetOverviewCount())]
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=entry)
+        try:
+            written = []
+            for i, level in enumerate(levels):
+                values = level.ReadAsArray().astype(DTYPES[dtype_name], copy=False)
+                filename = f"{i}.npy"
+                np.save(os.path.join(tmp, filename), values)
+                header = np.load(os.path.join(tmp, filename), "r").offset
+                written.append((filename, header, level.XSize, level.YSize))
+            write_vrt(
+                os.path.join(tmp, VRT_NAME),
+                written,
+                dataset.GetProjection(),
+                dataset.GetGeoTransform(),
+                dtype_name,
+                band.GetNoDataValue(),
+            )
+            os.chmod(tmp, 0o755)
+            os.rename(tmp, os.path.join(entry, version))
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        finally:
+            dataset = None
+        removed = self._evict(entry, keep=version)
+        seconds = time.time() - start
+        DECODE_SECONDS.observe(seconds)
+        log.info(
+            "Decoded %s band %d (%d levels) in %.2fs, evicted %d old version(s)",
+            source,
+            band_number,
+            len(written),
+            seconds,
+            removed,
+        )
+
+    def _evict(self, entry, keep):
+        removed = 0
+        for name in os.listdir(entry):
+            if name != keep and not name.startswith("."):
+                shutil.rmtree(os.path.join(entry, name), ignore_errors=True)
+                removed += 1
+        return removed
+
+    def prune(self, sources):
+        """Drop cached bands whose (source, band) is not in ``sources``"""
+        live = {os.path.basename(self.entry_dir(s, b)) for s, b in sources}
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name not in live:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+                removed += 1
+        return removed
+
+    def size(self):
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+        return total
+
+
+def map_bands(map_paths):
+    """``{(file, band)}`` read by the plain-file raster layers of the mapfiles,
+    including their EPSG:3857 copies (band 1 of ``perflab_3857_data``)"""
+    bands = set()
+    for path in map_paths:
+        for layer in mapfile.layers(mapfile.load(path)):
+            data = layer.get("DATA")
+            band = layer.processing().get("BANDS", "1")
+            if (
+                (layer.get("TYPE") or "").upper() == "RASTER"
+                and not layer.get("TILEINDEX")
+                and data
+                and os.path.isfile(data)
+                and band.isdigit()
+            ):
+                bands.add((data, int(band)))
+            webmerc = layer.metadata().get("perflab_3857_data")
+            if webmerc and os.path.isfile(webmerc):
+                bands.add((webmerc, 1))
+    return bands
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--maps",
+        nargs="+",
+        default=sorted(glob.glob(os.path.join(REPO_DIR, "*.map"))),
+    )
+    parser.add_argument("--dir", default=DEFAULT_DIR)
+    parser.add_argument(
+        "--no-prune", action="store_true", help="Keep bands the mapfiles do not use"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    cache = BandCache(args.dir)
+    bands = map_bands(args.maps)
+    for source, band in sorted(bands):
+        cache.path(source, band)
+    if not args.no_prune:
+        cache.prune(bands)
+    log.info("%d bands, %.1f MiB in %s", len(bands), cache.size() / 2**20, args.dir)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
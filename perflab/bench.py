@@ -0,0 +1,317 @@
+"""Benchmark regression suite: repeated seeded Locust runs against baselines.
+
+Each user class of the suite runs headless for ``--iterations`` rounds
+(after one unmeasured warm-up round). Round i of every benchmark uses
+PERFLAB_SEED ``<seed>-<i>``, so baseline and candidate send the same
+request sequences. The Aggregated row of each round gives p50/p95/p99,
+requests/s and the failure ratio. Results are summarized as means with 95%
+confidence intervals and written as versioned JSON to benchmarks/NAME.json.
+
+``--baseline NAME`` compares against a stored result. A metric regresses
+when it moved in the bad direction by more than ``--threshold`` and the
+95% confidence interval of the difference (Welch) excludes zero. Any
+regression makes the exit status 1. Judging a mapfile or GDAL change
+(``GDAL_CACHEMAX 512``, say) looks like this::
+
+    python -m perflab.bench --save main
+    # edit gfs.map, docker compose up -d --build mapserver
+    python -m perflab.bench --baseline main --save gdal-cache-512
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import logging
+import math
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+log = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(REPO_DIR, "benchmarks")
+FORMAT_VERSION = 1
+DEFAULT_CLASSES = [
+    "StyleComparisonUser",
+    "TileUser",
+    "GfsWmsUser",
+    "MrmsWmsUser",
+    "GoesWmsUser",
+    "MixedDataUser",
+]
+# metric -> (Aggregated CSV column, lower is better)
+METRICS = {
+    "p50": ("50%", True),
+    "p95": ("95%", True),
+    "p99": ("99%", True),
+    "rps": ("Requests/s", False),
+    "failures": (None, True),
+}
+# Two-sided 95% Student t quantiles by degrees of freedom
+T_95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]  # fmt: skip
+
+
+def t_quantile(df):
+    """95% two-sided t quantile, rounding df down (conservative)"""
+    if df < 1:
+        return math.inf
+    return T_95[int(df) - 1] if df < len(T_95) + 1 else 1.96
+
+
+def summarize(values):
+    """``{mean, ci, n}`` with the 95% confidence half-width of the mean"""
+    n = len(values)
+    mean = statistics.fmean(values)
+    ci = t_quantile(n - 1) * statistics.stdev(values) / math.sqrt(n) if n > 1 else None
+    return {"mean": mean, "ci": ci, "n": n}
+
+
+def compare(baseline, candidate, lower_is_better=True, threshold=0.05):
+    """``(relative change, verdict)``; verdict is ok, regression or improvement"""
+    mean_b, mean_c = statistics.fmean(baseline), statistics.fmean(candidate)
+    diff = mean_c - mean_b
+    relative = diff / mean_b if mean_b else (math.inf if diff else 0.0)
+    if len(baseline) < 2 or len(candidate) < 2:
+        return relative, "ok"
+    var_b = statistics.variance(baseline) / len(baseline)
+    var_c = statistics.variance(candidate) / len(candidate)
+    se = math.sqrt(var_b + var_c)
+    if se:
+        # Welch-Satterthwaite degrees of freedom
+        df = (var_b + var_c) ** 2 / (
+            var_b**2 / (len(baseline) - 1) + var_c**2 / (len(candidate) - 1)
+        )
+        significant = abs(diff) > t_quantile(df) * se
+    else:
+        significant = diff != 0
+    if not significant or abs(relative) <= threshold:
+        return relative, "ok"
+    worse = diff > 0 if lower_is_better else diff < 0
+    return relative, "regression" if worse else "improvement"
+
+
+def read_aggregated(stats_csv):
+    """Metrics of the Aggregated row of a Locust ``*_stats.csv``
+
+    Locust writes ``N/A`` for percentiles it has no samples for. Those
+    metrics are left out and the round counts as failed (failures 1.0).
+    """
+    with open(stats_csv, newline="") as f:
+        for row in csv.DictReader(f):
+            if row["Name"] != "Aggregated":
+                continue
+            count = int(row["Request Count"])
+            result = {}
+            for name, (column, _) in METRICS.items():
+                if column and row[column] not in ("N/A", ""):
+                    result[name] = float(row[column])
+            if len(result) < len(METRICS) - 1:
+                result["failures"] = 1.0
+            else:
+                result["failures"] = int(row["Failure Count"]) / count if count else 0.0
+            return result
+    raise ValueError(f"No Aggregated row in {stats_csv}")
+
+
+def run_locust(user_class, args, seed, run_time):
+    """One headless Locust run; metrics of its Aggregated row"""
+    with tempfile.TemporaryDirectory(prefix="perflab-bench-") as tmp:
+        prefix = os.path.join(tmp, "run")
+        command = [
+            "locust",
+            "-f",
+            args.locustfile,
+            "--headless",
+            "--only-summary",
+            "--loglevel",
+            "WARNING",
+            "--users",
+            str(args.users),
+            "--spawn-rate",
+            str(args.spawn_rate),
+            "--run-time",
+            f"{run_time}s",
+            "--host",
+            args.host,
+            "--csv",
+            prefix,
+            user_class,
+        ]
+        env = dict(os.environ, PERFLAB_SEED=seed)
+        # Locust exits 1 when any request failed; failures are a metric here
+        completed = subprocess.run(command, env=env, cwd=REPO_DIR)
+        if completed.returncode not in (0, 1):
+            raise RuntimeError(f"locust exited with {completed.returncode}")
+        return read_aggregated(f"{prefix}_stats.csv")
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args):
+    config = {
+        "users": args.users,
+        "spawn_rate": args.spawn_rate,
+        "run_time": args.run_time,
+        "iterations": args.iterations,
+        "host": args.host,
+        "seed": args.seed,
+    }
+    results = {}
+    for user_class in args.classes:
+        if args.warmup:
+            log.info("%s: warm-up (%ds)", user_class, args.warmup)
+            run_locust(user_class, args, f"{args.seed}-warmup", args.warmup)
+        results[user_class] = {name: [] for name in METRICS}
+        for i in range(args.iterations):
+            metrics = run_locust(user_class, args, f"{args.seed}-{i}", args.run_time)
+            for name, value in metrics.items():
+                results[user_class][name].append(value)
+            missing = sorted(set(METRICS) - set(metrics))
+            if missing:
+                log.warning(
+                    "%s: round %d/%d failed, no %s",
+                    user_class,
+                    i + 1,
+                    args.iterations,
+                    ", ".join(missing),
+                )
+                continue
+            log.info(
+                "%s: round %d/%d p50=%.0f p95=%.0f p99=%.0f rps=%.1f",
+                user_class,
+                i + 1,
+                args.iterations,
+                metrics["p50"],
+                metrics["p95"],
+                metrics["p99"],
+                metrics["rps"],
+            )
+    return {
+        "version": FORMAT_VERSION,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git": git_revision(),
+        "note": args.note,
+        "config": config,
+        "results": results,
+    }
+
+
+def result_path(name):
+    """A stored result by name (benchmarks/NAME.json) or by path"""
+    if os.sep in name or name.endswith(".json"):
+        return name
+    return os.path.join(BENCH_DIR, f"{name}.json")
+
+
+def load_result(name):
+    with open(result_path(name)) as f:
+        result = json.load(f)
+    if result.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{name}: unsupported format version {result.get('version')}")
+    return result
+
+
+def save_result(result, name):
+    path = result_path(name)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(result, f, indent=1)
+    os.replace(tmp, path)
+    log.info("Saved %s", path)
+
+
+def _format(summary):
+    if summary["ci"] is None:
+        return f"{summary['mean']:.1f}"
+    return f"{summary['mean']:.1f} ±{summary['ci']:.1f}"
+
+
+def report(result, baseline=None, threshold=0.05, out=sys.stdout):
+    """Print the summary table; returns the number of regressions"""
+    if baseline and baseline["config"] != result["config"]:
+        print(
+            f"warning: configs differ: {baseline['config']} vs {result['config']}",
+            file=out,
+        )
+    regressions = 0
+    for user_class, metrics in result["results"].items():
+        base_metrics = (baseline or {}).get("results", {}).get(user_class)
+        print(user_class, file=out)
+        for name, values in metrics.items():
+            if not values:
+                print(f"  {name:9} {'n/a':>18}", file=out)
+                continue
+            line = f"  {name:9} {_format(summarize(values)):>18}"
+            if base_metrics and base_metrics.get(name):
+                base = base_metrics[name]
+                relative, verdict = compare(base, values, METRICS[name][1], threshold)
+                regressions += verdict == "regression"
+                line += (
+                    f"  baseline {_format(summarize(base)):>18}"
+                    f"  {relative:+7.1%}  {verdict}"
+                )
+            print(line, file=out)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--classes", nargs="+", default=DEFAULT_CLASSES)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--spawn-rate", type=float, default=5)
+    parser.add_argument("--run-time", type=int, default=60, help="Seconds per round")
+    parser.add_argument(
+        "--warmup", type=int, default=15, help="Unmeasured first round (0 = none)"
+    )
+    parser.add_argument("--host", default="http://nginx")
+    parser.add_argument("--seed", default="1")
+    parser.add_argument("--locustfile", default=os.path.join(REPO_DIR, "locustfile.py"))
+    parser.add_argument("--note", help="What changed, e.g. 'GDAL_CACHEMAX 512'")
+    parser.add_argument("--save", metavar="NAME", help="Store as benchmarks/NAME.json")
+    parser.add_argument("--baseline", metavar="NAME", help="Compare against NAME")
+    parser.add_argument(
+        "--results", metavar="NAME", help="Report a stored result instead of running"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.05,
+        help="Smallest relative change that counts as a regression",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    baseline = load_result(args.baseline) if args.baseline else None
+    result = load_result(args.results) if args.results else run_suite(args)
+    if args.save:
+        save_result(result, args.save)
+    regressions = report(result, baseline, args.threshold)
+    if regressions:
+        log.error("%d significant regression(s)", regressions)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,213 @@
+"""Compiled layer catalog of gfs.map, mrms.map and goes.map.
+
+The mapfiles are the only source of truth for layer names. ``load`` parses
+them once into a list of compact ``Layer`` records (map, name, style, data
+files, band, classes, contour interval, ...) and keeps a JSON copy keyed
+by the mapfiles' mtimes and sizes, so later processes start from the
+cache in milliseconds instead of re-parsing. Scenario files reference the
+catalog as ``"@layers:GFS"`` or ``"@layers:GFS:contour"``.
+
+PERFLAB_MAPS (a glob) selects other mapfiles, PERFLAB_CATALOG_CACHE moves
+the cache file. List the catalog::
+
+    python -m perflab.catalog --map MRMS --style gradient
+"""
+
+import argparse
+import collections
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from perflab import mapfile
+
+log = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_VERSION = 2
+
+Layer = collections.namedtuple(
+    "Layer",
+    "map name group type style base title source band files tileindex classes "
+    "contour_interval",
+)
+
+_catalog_cache = {}
+
+
+def map_files():
+    """Mapfiles to catalog, overridable with PERFLAB_MAPS"""
+    pattern = os.environ.get("PERFLAB_MAPS", os.path.join(REPO_DIR, "*.map"))
+    return sorted(glob.glob(pattern))
+
+
+def cache_file(map_paths):
+    key = hashlib.sha1("\n".join(map_paths).encode()).hexdigest()[:12]
+    return os.environ.get(
+        "PERFLAB_CATALOG_CACHE",
+        os.path.join(tempfile.gettempdir(), f"perflab-catalog-{key}.json"),
+    )
+
+
+def layer_style(layer):
+    """``gradient``, ``contour`` or ``numbers`` (METADATA wms_style wins)"""
+    style = layer.metadata().get("wms_style")
+    if style:
+        return style
+    contour = (
+        layer.get("CONNECTIONTYPE", "").upper() == "CONTOUR"
+        or "perflab_contour_data" in layer.metadata()
+    )
+    if not contour:
+        return "gradient"
+    labelled = any(cls.blocks("LABEL") for cls in layer.blocks("CLASS"))
+    return "numbers" if labelled else "contour"
+
+
+def compile_layer(map_name, layer):
+    metadata = layer.metadata()
+    name = layer.get("NAME")
+    style = layer_style(layer)
+    suffix = "_" + style
+    base = name[: -len(suffix)] if name.endswith(suffix) else name
+    band = metadata.get("perflab_band") or layer.processing().get("BANDS")
+    interval = layer.processing().get("CONTOUR_INTERVAL")
+    return Layer(
+        map=map_name,
+        name=name,
+        group=layer.get("GROUP"),
+        type=(layer.get("TYPE") or "").upper(),
+        style=style,
+        base=base,
+        title=metadata.get("wms_title", name),
+        source=metadata.get("perflab_source") or layer.get("DATA"),
+        band=int(band) if band and band.isdigit() else None,
+        files=mapfile.data_files(layer),
+        tileindex=layer.get("TILEINDEX"),
+        classes=[
+            [cls.get("NAME"), cls.get("EXPRESSION")] for cls in layer.blocks("CLASS")
+        ],
+        contour_interval=float(interval) if interval else None,
+    )
+
+
+class Catalog:
+    def __init__(self, layers):
+        self.layers = layers
+        self._by_key = {(layer.map, layer.name): layer for layer in layers}
+
+    def __iter__(self):
+        return iter(self.layers)
+
+    def __len__(self):
+        return len(self.layers)
+
+    def maps(self):
+        return sorted({layer.map for layer in self.layers})
+
+    def get(self, map_name, name):
+        return self._by_key.get((map_name.upper(), name))
+
+    def select(self, map_name=None, style=None, type=None):
+        """Layers in mapfile order, optionally filtered"""
+        return [
+            layer
+            for layer in self.layers
+            if (map_name is None or layer.map == map_name.upper())
+            and (style is None or layer.style == style)
+            and (type is None or layer.type == type.upper())
+        ]
+
+    def names(self, map_name=None, style=None):
+        return [layer.name for layer in self.select(map_name, style)]
+
+    def reference(self, ref):
+        """Layer names for a scenario reference such as ``GFS:contour``"""
+        map_name, _, style = ref.partition(":")
+        names = self.names(map_name or None, style or None)
+        if not names:
+            raise KeyError(f"No layers match @layers:{ref}")
+        return names
+
+
+def build(map_paths):
+    layers = []
+    for path in map_paths:
+        map_block = mapfile.load(path)
+        map_name = (map_block.get("NAME") or "").upper()
+        layers.extend(
+            compile_layer(map_name, layer) for layer in mapfile.layers(map_block)
+        )
+    return Catalog(layers)
+
+
+def _signature(map_paths):
+    result = []
+    for path in map_paths:
+        st = os.stat(path)
+        result.append([path, st.st_mtime_ns, st.st_size])
+    return result
+
+
+def load(map_paths=None, cache_path=None):
+    """Catalog of ``map_paths`` (default ``map_files()``), cached in memory and on disk"""
+    map_paths = list(map_paths or map_files())
+    key = tuple(map_paths)
+    signature = _signature(map_paths)
+    cached = _catalog_cache.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    cache_path = cache_path or cache_file(map_paths)
+    catalog = None
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if cached["version"] == CACHE_VERSION and cached["maps"] == signature:
+            catalog = Catalog([Layer(*fields) for fields in cached["layers"]])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    if catalog is None:
+        catalog = build(map_paths)
+        data = {
+            "version": CACHE_VERSION,
+            "maps": signature,
+            "layers": [list(layer) for layer in catalog],
+        }
+        tmp = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, cache_path)
+        except OSError as e:
+            log.debug("Cannot write catalog cache %s: %s", cache_path, e)
+    _catalog_cache[key] = (signature, catalog)
+    return catalog
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--maps", nargs="+", help="Default: PERFLAB_MAPS or *.map")
+    parser.add_argument("--map", help="Only this MAP, e.g. GFS")
+    parser.add_argument("--style", help="gradient, contour or numbers")
+    parser.add_argument("--json", action="store_true", help="Dump the records")
+    args = parser.parse_args(argv)
+
+    layers = load(args.maps).select(args.map, args.style)
+    if args.json:
+        print(json.dumps([layer._asdict() for layer in layers], indent=1))
+        return 0
+    for layer in layers:
+        interval = layer.contour_interval
+        print(
+            f"{layer.map:5} {layer.name:20} {layer.style:9} {layer.type:7} "
+            f"band={layer.band or '-':<4} classes={len(layer.classes):<2} "
+            f"interval={interval if interval is not None else '-'}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
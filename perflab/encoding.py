@@ -0,0 +1,240 @@
+"""Output encodings and the encoding policy for images rendered in Python.
+
+The proxy and the native renderer encode GetMap answers themselves. With
+``FORMATS`` they can answer the same FORMATs as the ``png8`` and ``webp``
+OUTPUTFORMATs of the mapfiles:
+
+- ``image/png``: truecolor PNG at the zlib level of the layer's style
+- ``image/png; mode=8bit``: palette PNG, quantized to 256 colors
+- ``image/webp``: lossy WebP (``image/webp; mode=lossless`` for lossless)
+- ``image/jpeg``
+
+The policy gives every render style (gradient, contour, numbers) a zlib
+level and a palette mode. With ``exact``, an ``image/png`` answer whose
+image has at most 256 colors becomes a palette PNG. The classed contour and
+numbers layers always qualify, and the pixels stay identical. Overrides
+come from PERFLAB_PNG_POLICY or ``--png-policy``, for example
+``gradient=1,contour=6:exact``.
+
+``python -m perflab.encoding`` compares encode time against bytes for
+every format and zlib level on real GetMap images::
+
+    python -m perflab.encoding --layers GFS:t2m GFS:t2m_contour GOES:ir_color
+"""
+
+import argparse
+import io
+import logging
+import os
+import statistics
+import time
+from urllib.parse import urlencode
+
+import numpy as np
+from PIL import Image
+
+log = logging.getLogger(__name__)
+
+# FORMAT -> (encoder, response Content-Type)
+FORMATS = {
+    "image/png": ("png", "image/png"),
+    "image/png; mode=8bit": ("png8", "image/png"),
+    "image/webp": ("webp", "image/webp"),
+    "image/webp; mode=lossless": ("webp-lossless", "image/webp"),
+    "image/jpeg": ("jpeg", "image/jpeg"),
+}
+ALIASES = {"image/png8": "image/png; mode=8bit", "image/jpg": "image/jpeg"}
+# style -> (zlib level, palette mode "never" or "exact")
+DEFAULT_POLICY = {
+    "gradient": (1, "never"),
+    "contour": (6, "exact"),
+    "numbers": (6, "exact"),
+}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+
+def normalize(value):
+    """Canonical FORMAT, e.g. ``image/png;mode=8bit`` -> ``image/png; mode=8bit``"""
+    value = "; ".join(part.strip() for part in (value or "").lower().split(";"))
+    return ALIASES.get(value, value)
+
+
+def supported(value):
+    return normalize(value) in FORMATS
+
+
+def content_type(value):
+    return FORMATS[normalize(value)][1]
+
+
+def parse_policy(spec):
+    """``gradient=1,contour=6:exact`` -> policy dict (defaults for the rest)"""
+    policy = dict(DEFAULT_POLICY)
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        style, _, setting = item.partition("=")
+        level, _, palette = setting.partition(":")
+        default_level, default_palette = policy.get(style.strip(), (6, "never"))
+        level = int(level) if level.strip() else default_level
+        palette = palette.strip() or default_palette
+        if not 0 <= level <= 9 or palette not in ("never", "exact"):
+            raise ValueError(f"Bad PNG policy {item!r}")
+        policy[style.strip()] = (level, palette)
+    return policy
+
+
+def exact_palette(image):
+    """Palette image with the same pixels, or None above 256 colors"""
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    colors = image.getcolors(256)
+    if colors is None:
+        return None
+    # Pack RGBA into uint32 so every pixel is one lookup in the sorted palette
+    palette = np.array([c for _, c in colors], np.uint8).view(np.uint32)[:, 0]
+    palette.sort()
+    packed = np.asarray(image).view(np.uint32).ravel()
+    index = np.searchsorted(palette, packed).astype(np.uint8)
+    rgba = palette.view(np.uint8).reshape(-1, 4)
+    result = Image.fromarray(index.reshape(image.height, image.width), "P")
+    result.putpalette(rgba[:, :3].tobytes())
+    if (rgba[:, 3] < 255).any():
+        result.info["transparency"] = rgba[:, 3].tobytes()
+    return result
+
+
+def quantize(image):
+    """256-color palette image (lossy above 256 colors)"""
+    palette = exact_palette(image)
+    if palette is not None:
+        return palette
+    return image.convert("RGBA").quantize(
+        256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE
+    )
+
+
+class Policy:
+    def __init__(self, spec=None):
+        self.styles = parse_policy(
+            spec if spec is not None else os.environ.get("PERFLAB_PNG_POLICY")
+        )
+
+    def encode(self, image, fmt, style="gradient", transparent=True):
+        """Encode ``image`` (RGBA) as FORMAT ``fmt``"""
+        encoder = FORMATS[normalize(fmt)][0]
+        level, palette = self.styles.get(style, (6, "never"))
+        out = io.BytesIO()
+        if encoder == "jpeg" or not transparent:
+            image = image.convert("RGB")
+        if encoder == "jpeg":
+            image.save(out, "JPEG", quality=JPEG_QUALITY)
+        elif encoder.startswith("webp"):
+            lossless = encoder == "webp-lossless"
+            image.save(out, "WEBP", quality=WEBP_QUALITY, lossless=lossless, method=2)
+        else:
+            if encoder == "png8":
+                image = quantize(image)
+            elif palette == "exact":
+                image = exact_palette(image) or image
+            image.save(out, "PNG", compress_level=level)
+        return out.getvalue()
+
+
+DEFAULT = Policy()
+
+
+def encode(image, fmt, style="gradient", transparent=True):
+    return DEFAULT.encode(image, fmt, style, transparent)
+
+
+def variants():
+    """Benchmark variants: (label, FORMAT, policy spec)"""
+    for level in (0, 1, 3, 6, 9):
+        yield f"png z{level}", "image/png", f"bench={level}:never"
+        yield f"png z{level} exact", "image/png", f"bench={level}:exact"
+    yield "png8 z6", "image/png; mode=8bit", "bench=6:never"
+    yield "webp q80", "image/webp", ""
+    yield "webp lossless", "image/webp; mode=lossless", ""
+    yield "jpeg q85", "image/jpeg", ""
+
+
+def benchmark(image, repeat=3):
+    """``[(label, median encode seconds, bytes)]`` for every variant"""
+    rows = []
+    for label, fmt, spec in variants():
+        policy = Policy(spec)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = policy.encode(image, fmt, "bench")
+            times.append(time.perf_counter() - start)
+        rows.append((label, statistics.median(times), len(body)))
+    return rows
+
+
+def main(argv=None):
+    from perflab.upstream import Upstream
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--upstream", default="http://nginx/cgi-bin/mapserv-direct")
+    parser.add_argument(
+        "--layers",
+        nargs="+",
+        default=["GFS:t2m", "GFS:t2m_contour", "GFS:t2m_numbers", "GOES:ir_color"],
+        help="MAP:LAYER",
+    )
+    parser.add_argument("--bbox", default="-180,-90,180,90")
+    parser.add_argument("--size", default="2048x1024")
+    parser.add_argument("--images", nargs="+", help="Benchmark local images instead")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    images = []
+    if args.images:
+        for path in args.images:
+            with Image.open(path) as image:
+                images.append((os.path.basename(path), image.convert("RGBA")))
+    else:
+        upstream = Upstream(args.upstream)
+        width, height = args.size.lower().split("x")
+        for ref in args.layers:
+            map_name, _, layer = ref.partition(":")
+            query = {
+                "MAP": map_name,
+                "SERVICE": "WMS",
+                "VERSION": "1.1.1",
+                "REQUEST": "GetMap",
+                "LAYERS": layer,
+                "STYLES": "",
+                "SRS": "EPSG:4326",
+                "BBOX": args.bbox,
+                "WIDTH": width,
+                "HEIGHT": height,
+                "FORMAT": "image/png",
+                "TRANSPARENT": "TRUE",
+            }
+            response = upstream.get("?" + urlencode(query))
+            if response.status != 200 or not response.headers.get(
+                "Content-Type", ""
+            ).startswith("image/"):
+                log.warning("%s: upstream answered %s", ref, response.status)
+                continue
+            with Image.open(io.BytesIO(response.body)) as image:
+                images.append((ref, image.convert("RGBA")))
+
+    for name, image in images:
+        colors = image.getcolors(256)
+        print(
+            f"{name} {image.width}x{image.height}, "
+            f"{len(colors) if colors else '>256'} colors"
+        )
+        for label, seconds, size in benchmark(image, args.repeat):
+            print(f"  {label:18} {seconds * 1000:8.1f} ms {size / 1024:9.1f} KiB")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1 @@
+"""Preprocessing steps that run after the download scripts."""
@@ -0,0 +1,43 @@
+"""Run every ingest step in order: GOES, COGs, 3857 copies, time indexes, contours.
+
+Example::
+
+    python -m perflab.ingest [--force]
+"""
+
+import argparse
+import glob
+import logging
+import os
+
+from perflab.ingest import cog, contours, goes, timeindex, webmerc
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--maps",
+        nargs="+",
+        default=sorted(glob.glob(os.path.join(cog.REPO_DIR, "*.map"))),
+    )
+    parser.add_argument("--goes-dir", default=goes.DEFAULT_GOES_DIR)
+    parser.add_argument("--cog-dir", default=cog.DEFAULT_COG_DIR)
+    parser.add_argument("--webmerc-dir", default=webmerc.DEFAULT_WEBMERC_DIR)
+    parser.add_argument("--index-dir", default=timeindex.DEFAULT_INDEX_DIR)
+    parser.add_argument("--contour-dir", default=contours.DEFAULT_CONTOUR_DIR)
+    parser.add_argument("--force", action="store_true", help="Rebuild current outputs")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    goes.ingest(goes.plan(args.goes_dir), force=args.force)
+    cog.ingest(cog.plan(args.maps, args.cog_dir), force=args.force)
+    webmerc.ingest(webmerc.plan(args.maps, args.webmerc_dir), force=args.force)
+    timeindex.ingest(
+        timeindex.plan(args.maps, args.index_dir, args.cog_dir), force=args.force
+    )
+    contours.ingest(contours.plan(args.maps, args.contour_dir), force=args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,347 @@
+"""Extract the GRIB2 bands the mapfiles use into Cloud-Optimized GeoTIFFs.
+
+Every raster and contour layer of gfs.map used to read one band out of the
+full GFS GRIB2 file, so each GetMap paid for GRIB decoding and a band seek.
+This step writes each referenced (file, band) pair once to a tiled,
+DEFLATE-compressed COG with internal overviews under ``/data/cog``:
+
+    /data/gfs.t12z.pgrb2.0p25.f000.grb2 band 580
+        -> /data/cog/gfs.t12z.pgrb2.0p25.f000/band580.tif
+    /data/mrms/MergedReflectivityQCComposite.grib2 band 1
+        -> /data/cog/mrms/MergedReflectivityQCComposite/band1.tif
+
+Sources in subdirectories keep them under the COG directory; sources
+outside its parent go under a hash of their directory, so equal file names
+never share a COG. COGs are written to a temporary file and renamed into
+place, so MapServer and perflab.watcher never see a half-written file.
+Each COG records the size and mtime of the source it was built from, and
+is skipped while both still match.
+
+``--rewrite`` points the layers' DATA at the COGs, drops the now
+meaningless ``BANDS`` processing option and records the original source in
+the layer METADATA (``perflab_source``/``perflab_band``), which is where
+later runs read it from. ``--revert`` restores the GRIB2 paths. Example::
+
+    python -m perflab.ingest.cog --maps gfs.map mrms.map
+"""
+
+import argparse
+import collections
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+
+from perflab import mapfile
+
+log = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+GRIB_EXTENSIONS = (".grb2", ".grib2", ".grb", ".grib")
+DEFAULT_COG_DIR = "/data/cog"
+# Band map of files written by perflab.ingest.subset
+BANDS_SUFFIX = ".bands.json"
+
+CREATION_OPTIONS = [
+    "COMPRESS=DEFLATE",
+    "PREDICTOR=YES",
+    "BLOCKSIZE=512",
+    "OVERVIEWS=AUTO",
+    "RESAMPLING=AVERAGE",
+    "NUM_THREADS=ALL_CPUS",
+    "BIGTIFF=IF_SAFER",
+]
+
+# COG metadata items recording the source a COG was built from
+SOURCE_KEYS = ("PERFLAB_SOURCE_SIZE", "PERFLAB_SOURCE_MTIME_NS")
+
+CogTarget = collections.namedtuple("CogTarget", "source band path layers")
+
+
+def output_dir(out_dir, source, roots=None):
+    """Directory under ``out_dir`` for files derived from ``source``
+
+    It is the source's directory relative to the first of ``roots`` (default
+    ``out_dir``'s parent) that holds it, or a hash of the directory for
+    sources outside them all, so equal file names never collide.
+    """
+    directory = os.path.dirname(os.path.abspath(source))
+    for root in roots or [os.path.dirname(os.path.abspath(out_dir))]:
+        relative = os.path.relpath(directory, os.path.abspath(root))
+        if relative == os.curdir:
+            return out_dir
+        if relative.split(os.sep)[0] != os.pardir:
+            return os.path.join(out_dir, relative)
+    return os.path.join(
+        out_dir, "_" + hashlib.sha1(directory.encode()).hexdigest()[:12]
+    )
+
+
+def cog_path(cog_dir, source, band):
+    stem, _ = os.path.splitext(os.path.basename(source))
+    return os.path.join(output_dir(cog_dir, source), stem, f"band{band}.tif")
+
+
+def layer_source(layer):
+    """``(GRIB2 path, band)`` a layer renders, or None for non-GRIB layers"""
+    metadata = layer.metadata()
+    source = metadata.get("perflab_source") or layer.get("DATA")
+    band = metadata.get("perflab_band") or layer.processing().get("BANDS", "1")
+    if not source or not source.lower().endswith(GRIB_EXTENSIONS):
+        return None
+    if "," in band:
+        raise mapfile.MapfileError(
+            f"layer {layer.get('NAME')}: multi-band BANDS={band} is not supported"
+        )
+    return source, int(band)
+
+
+def bands_path(path):
+    return path + BANDS_SUFFIX
+
+
+def read_bands(path):
+    """Sidecar of a GRIB2 file subset by perflab.ingest.subset, or None"""
+    try:
+        with open(bands_path(path)) as f:
+            sidecar = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if sidecar.get("size") != os.path.getsize(path):
+        # Replaced since, e.g. by a whole-file download
+        return None
+    return sidecar
+
+
+def file_band(path, band):
+    """Band of ``path`` that holds original band ``band`` (the same for whole files)"""
+    sidecar = read_bands(path) if os.path.exists(path) else None
+    if sidecar is None:
+        return band
+    try:
+        return sidecar["bands"][str(band)]
+    except KeyError:
+        raise ValueError(f"{path} was subset without band {band}") from None
+
+
+def original_band(path, band):
+    """Inverse of ``file_band``: original number of band ``band`` of ``path``"""
+    sidecar = read_bands(path) if os.path.exists(path) else None
+    if sidecar is None:
+        return band
+    for original, number in sidecar["bands"].items():
+        if number == band:
+            return int(original)
+    raise ValueError(f"{path} has no band {band}")
+
+
+def plan(map_paths, cog_dir=DEFAULT_COG_DIR):
+    """One CogTarget per distinct (source, band) referenced by the mapfiles"""
+    layers = collections.defaultdict(list)
+    for path in map_paths:
+        map_block = mapfile.load(path)
+        for layer in mapfile.layers(map_block):
+            source = layer_source(layer)
+            if source:
+                layers[source].append(f"{map_block.get('NAME')}/{layer.get('NAME')}")
+    # COG paths keep the mapfile's band number when the GRIB2 file is a subset
+    return [
+        CogTarget(
+            source, file_band(source, band), cog_path(cog_dir, source, band), names
+        )
+        for (source, band), names in sorted(layers.items())
+    ]
+
+
+def source_signature(path):
+    """``{SOURCE_KEYS: value}`` of a source file as it is now"""
+    st = os.stat(path)
+    return dict(zip(SOURCE_KEYS, (str(st.st_size), str(st.st_mtime_ns))))
+
+
+def source_metadata(path):
+    """GDAL ``metadataOptions`` recording ``source_signature(path)``"""
+    return [f"{key}={value}" for key, value in source_signature(path).items()]
+
+
+def built_from(path, source):
+    """Whether raster ``path`` records ``source``'s current size and mtime"""
+    from osgeo import gdal
+
+    if not os.path.exists(path):
+        return False
+    try:
+        signature = source_signature(source)
+        dataset = gdal.Open(path)
+    except (OSError, RuntimeError):
+        return False
+    if dataset is None:
+        return False
+    metadata = dataset.GetMetadata()
+    return all(metadata.get(key) == value for key, value in signature.items())
+
+
+def is_current(target):
+    """Whether the COG was built from the source's current size and mtime"""
+    return built_from(target.path, target.source)
+
+
+def build_cog(target):
+    """Write one band of ``target.source`` to ``target.path`` as a COG"""
+    from osgeo import gdal
+
+    gdal.UseExceptions()
+    os.makedirs(os.path.dirname(target.path), exist_ok=True)
+    tmp = f"{target.path}.{os.getpid()}.tmp"
+    # Taken first: a source replaced mid-build leaves the COG stale
+    metadata = source_metadata(target.source)
+    try:
+        gdal.Translate(
+            tmp,
+            target.source,
+            format="COG",
+            bandList=[target.band],
+            outputType=gdal.GDT_Float32,
+            creationOptions=CREATION_OPTIONS,
+            metadataOptions=metadata,
+        )
+        os.replace(tmp, target.path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def ingest(targets, force=False):
+    """Build the missing or stale COGs; returns the paths written"""
+    written = []
+    for target in targets:
+        if not os.path.exists(target.source):
+            log.warning("%s missing, skipping band %d", target.source, target.band)
+            continue
+        if not force and is_current(target):
+            continue
+        start = time.time()
+        build_cog(target)
+        written.append(target.path)
+        log.info(
+            "%s band %d -> %s (%.1f MB, %.1fs) for %s",
+            target.source,
+            target.band,
+            target.path,
+            os.path.getsize(target.path) / 1e6,
+            time.time() - start,
+            ", ".join(target.layers),
+        )
+    return written
+
+
+def _indent(line):
+    return line[: len(line) - len(line.lstrip())]
+
+
+def rewrite_mapfile(path, cog_dir=DEFAULT_COG_DIR, revert=False):
+    """Point the GRIB2 layers of a mapfile at their COGs, or back.
+
+    Lines are edited in place so comments and formatting survive. Returns
+    the number of layers changed.
+    """
+    with open(path) as f:
+        lines = f.read().split("\n")
+    edits = {}  # line number -> replacement lines, applied bottom-up
+    changed = 0
+    for layer in mapfile.layers(mapfile.parse("\n".join(lines))):
+        source = layer_source(layer)
+        data = layer.get_all("DATA")
+        if not source or not data or layer.get("CONNECTIONTYPE") == "OGR":
+            # OGR layers read precomputed contours, see perflab.ingest.contours
+            continue
+        source_path, band = source
+        target = source_path if revert else cog_path(cog_dir, source_path, band)
+        if data[0].values[0] == target:
+            continue
+        changed += 1
+        indent = _indent(lines[data[0].line - 1])
+        metadata = layer.block("METADATA")
+
+        if revert:
+            edits[data[0].line] = [
+                f'{indent}DATA "{target}"',
+                f'{indent}PROCESSING "BANDS={band}"',
+            ]
+            for lineno in (
+                range(metadata.line + 1, metadata.end_line) if metadata else ()
+            ):
+                key = lines[lineno - 1].strip().split(" ")[0].strip('"')
+                if key in ("perflab_source", "perflab_band"):
+                    edits[lineno] = []
+            continue
+
+        edits[data[0].line] = [f'{indent}DATA "{target}"']
+        for directive in layer.get_all("PROCESSING"):
+            if directive.values[0].startswith("BANDS="):
+                edits[directive.line] = []
+        items = [
+            f'"perflab_source" "{source_path}"',
+            f'"perflab_band" "{band}"',
+        ]
+        if metadata is None:
+            edits[layer.end_line] = (
+                [f"{indent}METADATA"]
+                + [f"{indent}  {item}" for item in items]
+                + [f"{indent}END", lines[layer.end_line - 1]]
+            )
+        elif "perflab_source" not in layer.metadata():
+            item_indent = _indent(lines[metadata.line - 1]) + "  "
+            edits[metadata.end_line] = [item_indent + item for item in items] + [
+                lines[metadata.end_line - 1]
+            ]
+
+    for lineno in sorted(edits, reverse=True):
+        lines[lineno - 1 : lineno] = edits[lineno]
+    if changed:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines))
+        os.replace(tmp, path)
+    return changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--maps", nargs="+", default=sorted(glob.glob(os.path.join(REPO_DIR, "*.map")))
+    )
+    parser.add_argument("--cog-dir", default=DEFAULT_COG_DIR)
+    parser.add_argument("--force", action="store_true", help="Rebuild current COGs")
+    parser.add_argument(
+        "--rewrite", action="store_true", help="Point the mapfiles' DATA at the COGs"
+    )
+    parser.add_argument(
+        "--revert", action="store_true", help="Point the mapfiles' DATA back at GRIB2"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only print the COGs that would be built"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    if args.rewrite or args.revert:
+        for path in args.maps:
+            changed = rewrite_mapfile(path, args.cog_dir, revert=args.revert)
+            log.info("%s: %d layers rewritten", path, changed)
+        return 0
+
+    targets = plan(args.maps, args.cog_dir)
+    if args.dry_run:
+        for target in targets:
+            state = "current" if is_current(target) else "build"
+            print(f"{state:8} {target.source} band {target.band} -> {target.path}")
+        return 0
+    ingest(targets, force=args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,306 @@
+"""Precompute the isolines of CONNECTIONTYPE CONTOUR layers into FlatGeobuf.
+
+With ``CONNECTIONTYPE CONTOUR`` MapServer traces isolines on every GetMap,
+which makes the ``*_contour`` and ``*_numbers`` layers the most expensive
+ones in the lab. This step traces each (raster, CONTOUR_INTERVAL) pair once
+per data update and writes one spatially indexed FlatGeobuf per zoom band,
+simplified to about half a pixel at the band's smallest scale:
+
+    /data/cog/gfs.t12z.pgrb2.0p25.f000/band580.tif, interval 5
+        -> /data/contours/gfs.t12z.pgrb2.0p25.f000/band580_i5_{full,mid,coarse}.fgb
+
+Output directories mirror the raster's under the COG directory (or next to
+it), like perflab.ingest.cog, so rasters of equal names never share one.
+
+``--rewrite`` switches the layers to ``CONNECTIONTYPE OGR`` with a
+SCALETOKEN picking the zoom band's file, and keeps the raster in the layer
+METADATA (``perflab_contour_data``). ``--revert`` switches back to
+on-the-fly contouring. Run after perflab.ingest.cog::
+
+    python -m perflab.ingest.contours --maps gfs.map mrms.map
+"""
+
+import argparse
+import collections
+import glob
+import logging
+import os
+import time
+
+from perflab import mapfile
+from perflab.ingest import cog
+
+log = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_CONTOUR_DIR = "/data/contours"
+ZOOM_TOKEN = "%zoom%"
+
+# (name, smallest scale denominator, simplification tolerance in degrees).
+# Half a pixel at the smallest scale: 0.28 mm / 111 km per degree.
+ZOOM_BANDS = [
+    ("full", 0, 0.0),
+    ("mid", 5000000, 0.006),
+    ("coarse", 30000000, 0.035),
+]
+
+ContourTarget = collections.namedtuple("ContourTarget", "raster interval paths layers")
+
+
+def contour_path(contour_dir, raster, interval, band=ZOOM_TOKEN):
+    # COGs keep their layout under the COG directory, other rasters cog_path's
+    roots = [cog.DEFAULT_COG_DIR, os.path.dirname(os.path.abspath(contour_dir))]
+    stem, _ = os.path.splitext(os.path.basename(raster))
+    return os.path.join(
+        cog.output_dir(contour_dir, raster, roots), f"{stem}_i{interval:g}_{band}.fgb"
+    )
+
+
+def layer_contour(layer):
+    """``(raster path, interval)`` of a contour layer, or None"""
+    raster = layer.metadata().get("perflab_contour_data")
+    if raster is None and layer.get("CONNECTIONTYPE") == "CONTOUR":
+        raster = layer.get("DATA")
+    interval = layer.processing().get("CONTOUR_INTERVAL")
+    if not raster or not interval:
+        return None
+    return raster, float(interval)
+
+
+def plan(map_paths, contour_dir=DEFAULT_CONTOUR_DIR):
+    """One ContourTarget per distinct (raster, interval) in the mapfiles"""
+    layers = collections.defaultdict(list)
+    for path in map_paths:
+        map_block = mapfile.load(path)
+        for layer in mapfile.layers(map_block):
+            contour = layer_contour(layer)
+            if contour:
+                layers[contour].append(f"{map_block.get('NAME')}/{layer.get('NAME')}")
+    return [
+        ContourTarget(
+            raster,
+            interval,
+            [
+                contour_path(contour_dir, raster, interval, name)
+                for name, _, _ in ZOOM_BANDS
+            ],
+            names,
+        )
+        for (raster, interval), names in sorted(layers.items())
+    ]
+
+
+def is_current(target):
+    try:
+        raster_mtime = os.path.getmtime(target.raster)
+        return all(os.path.getmtime(path) >= raster_mtime for path in target.paths)
+    except OSError:
+        return False
+
+
+def build_contours(target):
+    """Trace ``target.raster`` once and write every zoom band's FlatGeobuf"""
+    from osgeo import gdal, ogr
+
+    gdal.UseExceptions()
+    ogr.UseExceptions()
+    raster = gdal.Open(target.raster)
+    band = raster.GetRasterBand(1)
+    memory = ogr.GetDriverByName("Memory").CreateDataSource("")
+    lines = memory.CreateLayer(
+        "contours", srs=raster.GetSpatialRef(), geom_type=ogr.wkbLineString
+    )
+    lines.CreateField(ogr.FieldDefn("id", ogr.OFTInteger))
+    lines.CreateField(ogr.FieldDefn("value", ogr.OFTReal))
+    options = [f"LEVEL_INTERVAL={target.interval:g}", "ID_FIELD=0", "ELEV_FIELD=1"]
+    if band.GetNoDataValue() is not None:
+        options.append(f"NODATA={band.GetNoDataValue()!r}")
+    gdal.ContourGenerateEx(band, lines, options=options)
+
+    driver = ogr.GetDriverByName("FlatGeobuf")
+    for (_, _, tolerance), path in zip(ZOOM_BANDS, target.paths):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp.fgb"
+        try:
+            out = driver.CreateDataSource(tmp)
+            layer = out.CreateLayer(
+                "contours",
+                srs=lines.GetSpatialRef(),
+                geom_type=ogr.wkbLineString,
+                options=["SPATIAL_INDEX=YES"],
+            )
+            layer.CreateField(ogr.FieldDefn("value", ogr.OFTReal))
+            definition = layer.GetLayerDefn()
+            lines.ResetReading()
+            for feature in lines:
+                geometry = feature.GetGeometryRef()
+                if tolerance:
+                    geometry = geometry.SimplifyPreserveTopology(tolerance)
+                    if geometry.IsEmpty() or geometry.Length() < 2 * tolerance:
+                        continue
+                out_feature = ogr.Feature(definition)
+                out_feature.SetField("value", feature.GetField("value"))
+                out_feature.SetGeometry(geometry)
+                layer.CreateFeature(out_feature)
+            count = layer.GetFeatureCount()
+            layer = None
+            out = None  # flush and close
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        log.info(
+            "%s interval %g -> %s (%d lines, %.1f MB)",
+            target.raster,
+            target.interval,
+            path,
+            count,
+            os.path.getsize(path) / 1e6,
+        )
+
+
+def ingest(targets, force=False):
+    """Trace the missing or stale contour sets; returns the targets built"""
+    built = []
+    for target in targets:
+        if not os.path.exists(target.raster):
+            log.warning(
+                "%s missing, skipping interval %g", target.raster, target.interval
+            )
+            continue
+        if not force and is_current(target):
+            continue
+        start = time.time()
+        build_contours(target)
+        built.append(target)
+        log.info(
+            "Contours for %s in %.1fs", ", ".join(target.layers), time.time() - start
+        )
+    return built
+
+
+def _indent(line):
+    return line[: len(line) - len(line.lstrip())]
+
+
+def rewrite_mapfile(path, contour_dir=DEFAULT_CONTOUR_DIR, revert=False):
+    """Switch contour layers to the precomputed FlatGeobuf files, or back.
+
+    Returns the number of layers changed.
+    """
+    with open(path) as f:
+        lines = f.read().split("\n")
+    edits = {}  # line number -> replacement lines, applied bottom-up
+    changed = 0
+    for layer in mapfile.layers(mapfile.parse("\n".join(lines))):
+        contour = layer_contour(layer)
+        connection = layer.get_all("CONNECTIONTYPE")
+        data = layer.get_all("DATA")
+        if not contour or not connection or not data:
+            continue
+        raster, interval = contour
+        precomputed = connection[0].values[0] == "OGR"
+        if precomputed and not revert:
+            # Already switched: follow a moved contour path
+            target = contour_path(contour_dir, raster, interval)
+            if data[0].values[0] != target:
+                indent = _indent(lines[data[0].line - 1])
+                edits[data[0].line] = [f'{indent}DATA "{target}"']
+                changed += 1
+            continue
+        if precomputed != revert:
+            continue
+        changed += 1
+        indent = _indent(lines[connection[0].line - 1])
+        metadata = layer.block("METADATA")
+
+        if revert:
+            edits[connection[0].line] = [f"{indent}CONNECTIONTYPE CONTOUR"]
+            edits[data[0].line] = [f'{indent}DATA "{raster}"']
+            for token in layer.blocks("SCALETOKEN"):
+                for lineno in range(token.line, token.end_line + 1):
+                    edits[lineno] = []
+            for lineno in (
+                range(metadata.line + 1, metadata.end_line) if metadata else ()
+            ):
+                if lines[lineno - 1].strip().startswith('"perflab_contour_data"'):
+                    edits[lineno] = []
+            continue
+
+        edits[connection[0].line] = [f"{indent}CONNECTIONTYPE OGR"]
+        edits[data[0].line] = [
+            f'{indent}DATA "{contour_path(contour_dir, raster, interval)}"',
+            f"{indent}SCALETOKEN",
+            f'{indent}  NAME "{ZOOM_TOKEN}"',
+            f"{indent}  VALUES",
+        ]
+        edits[data[0].line] += [
+            f'{indent}    "{scale}" "{name}"' for name, scale, _ in ZOOM_BANDS
+        ]
+        edits[data[0].line] += [f"{indent}  END", f"{indent}END"]
+        item = f'"perflab_contour_data" "{raster}"'
+        if metadata is None:
+            edits[layer.end_line] = [
+                f"{indent}METADATA",
+                f"{indent}  {item}",
+                f"{indent}END",
+                lines[layer.end_line - 1],
+            ]
+        else:
+            item_indent = _indent(lines[metadata.line - 1]) + "  "
+            edits[metadata.end_line] = [
+                item_indent + item,
+                lines[metadata.end_line - 1],
+            ]
+
+    for lineno in sorted(edits, reverse=True):
+        lines[lineno - 1 : lineno] = edits[lineno]
+    if changed:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines))
+        os.replace(tmp, path)
+    return changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--maps", nargs="+", default=sorted(glob.glob(os.path.join(REPO_DIR, "*.map")))
+    )
+    parser.add_argument("--contour-dir", default=DEFAULT_CONTOUR_DIR)
+    parser.add_argument("--force", action="store_true", help="Rebuild current contours")
+    parser.add_argument(
+        "--rewrite", action="store_true", help="Point contour layers at the FlatGeobufs"
+    )
+    parser.add_argument(
+        "--revert",
+        action="store_true",
+        help="Back to on-the-fly CONNECTIONTYPE CONTOUR",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only print the contours that would be built",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    if args.rewrite or args.revert:
+        for path in args.maps:
+            changed = rewrite_mapfile(path, args.contour_dir, revert=args.revert)
+            log.info("%s: %d layers rewritten", path, changed)
+        return 0
+
+    targets = plan(args.maps, args.contour_dir)
+    if args.dry_run:
+        for target in targets:
+            state = "current" if is_current(target) else "build"
+            print(f"{state:8} {target.raster} interval {target.interval:g}")
+        return 0
+    ingest(targets, force=args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,364 @@
+"""Resample GOES ABI scans to EPSG:4326 through cached fixed-grid lookup tables.
+
+scripts/download-goes.sh fetches one ABI-L2-CMIPC file per channel
+(``vis_latest.nc`` = C02, ``swir`` = C07, ``wv`` = C08, ``ir`` = C13).
+goes.map reads them in EPSG:4326 as ``/data/goes/<channel>_4326.tif``.
+
+The CONUS fixed grid (scan angles seen from the satellite) is the same for
+every scan, so the geostationary -> lat/lon mapping is computed once per
+grid and stored under ``/data/goes/lut``. For each output pixel the table
+holds the source pixel and the bilinear weights. Each new scan is then one
+vectorized gather per channel, and the channels run in parallel processes.
+C07, C08 and C13 share the 2 km grid and its table; C02 (0.5 km) has its
+own. The output keeps the raw CMI counts, _FillValue and scale/offset (the
+DATARANGEs in goes.map are counts) and is written as a COG::
+
+    python -m perflab.ingest.goes --goes-dir /data/goes
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from perflab.ingest import cog
+
+log = logging.getLogger(__name__)
+
+DEFAULT_GOES_DIR = "/data/goes"
+LUT_VERSION = 1
+# Output rows gathered at a time; bounds the memory of the C02 resample
+CHUNK_ROWS = 256
+METERS_PER_DEGREE = 111319.49
+WEIGHT_SCALE = 65536
+
+GoesTarget = collections.namedtuple("GoesTarget", "source path")
+# Fixed-grid definition of a scan: geotransform in projection meters,
+# size, and the geos parameters (satellite height h, lon_0, semi-axes)
+Grid = collections.namedtuple("Grid", "geotransform width height h lon_0 a b")
+
+
+def plan(goes_dir=DEFAULT_GOES_DIR):
+    """One GoesTarget per downloaded ``<channel>_latest.nc``"""
+    targets = []
+    for source in sorted(glob.glob(os.path.join(goes_dir, "*_latest.nc"))):
+        channel = os.path.basename(source)[: -len("_latest.nc")]
+        targets.append(
+            GoesTarget(source, os.path.join(goes_dir, f"{channel}_4326.tif"))
+        )
+    return targets
+
+
+def is_current(target):
+    try:
+        return os.path.getmtime(target.path) >= os.path.getmtime(target.source)
+    except OSError:
+        return False
+
+
+def open_cmi(source):
+    from osgeo import gdal
+
+    gdal.UseExceptions()
+    return gdal.Open(f"NETCDF:{source}:CMI")
+
+
+def read_grid(dataset):
+    """Grid of a CMI dataset (GDAL gives the geos projection with sweep=x)"""
+    srs = dataset.GetSpatialRef()
+    proj4 = srs.ExportToProj4()
+    if "+proj=geos" not in proj4 or "+sweep=x" not in proj4:
+        raise ValueError(f"not a GOES fixed grid: {proj4}")
+    return Grid(
+        tuple(dataset.GetGeoTransform()),
+        dataset.RasterXSize,
+        dataset.RasterYSize,
+        srs.GetProjParm("satellite_height"),
+        srs.GetProjParm("central_meridian"),
+        srs.GetSemiMajor(),
+        srs.GetSemiMinor(),
+    )
+
+
+def grid_key(grid):
+    text = json.dumps([LUT_VERSION, list(grid)])
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def scan_to_lonlat(grid, x, y):
+    """Scan angles (radians) -> (lon, lat) in degrees; NaN off the Earth disk.
+
+    GOES-R PUG volume 4, section 4.2.8.1.
+    """
+    H = grid.h + grid.a
+    ratio = (grid.a / grid.b) ** 2
+    cos_x, cos_y, sin_x, sin_y = np.cos(x), np.cos(y), np.sin(x), np.sin(y)
+    a = sin_x**2 + cos_x**2 * (cos_y**2 + ratio * sin_y**2)
+    b = -2 * H * cos_x * cos_y
+    c = H**2 - grid.a**2
+    with np.errstate(invalid="ignore"):
+        r_s = (-b - np.sqrt(b**2 - 4 * a * c)) / (2 * a)
+    s_x = r_s * cos_x * cos_y
+    s_y = -r_s * sin_x
+    s_z = r_s * cos_x * sin_y
+    lat = np.degrees(np.arctan(ratio * s_z / np.hypot(H - s_x, s_y)))
+    lon = grid.lon_0 - np.degrees(np.arctan(s_y / (H - s_x)))
+    return lon, lat
+
+
+def lonlat_to_scan(grid, lon, lat):
+    """(lon, lat) in degrees -> scan angles (radians); NaN where not visible"""
+    H = grid.h + grid.a
+    e2 = 1 - (grid.b / grid.a) ** 2
+    phi_c = np.arctan((grid.b / grid.a) ** 2 * np.tan(np.radians(lat)))
+    r_c = grid.b / np.sqrt(1 - e2 * np.cos(phi_c) ** 2)
+    dlon = np.radians(lon - grid.lon_0)
+    s_x = H - r_c * np.cos(phi_c) * np.cos(dlon)
+    s_y = -r_c * np.cos(phi_c) * np.sin(dlon)
+    s_z = r_c * np.sin(phi_c)
+    visible = H * (H - s_x) >= s_y**2 + (grid.a / grid.b) ** 2 * s_z**2
+    x = np.arcsin(-s_y / np.sqrt(s_x**2 + s_y**2 + s_z**2))
+    y = np.arctan(s_z / s_x)
+    return np.where(visible, x, np.nan), np.where(visible, y, np.nan)
+
+
+def output_grid(grid):
+    """EPSG:4326 geotransform and size covering the scan at its nadir resolution"""
+    gt = grid.geotransform
+    step = max(1, min(grid.width, grid.height) // 512)
+    cols = np.arange(0, grid.width, step) + 0.5
+    rows = np.arange(0, grid.height, step) + 0.5
+    x = (gt[0] + cols * gt[1]) / grid.h
+    y = (gt[3] + rows * gt[5]) / grid.h
+    lon, lat = scan_to_lonlat(grid, *np.meshgrid(x, y))
+    resolution = abs(gt[1]) / METERS_PER_DEGREE
+    west, east = np.nanmin(lon), np.nanmax(lon)
+    south, north = np.nanmin(lat), np.nanmax(lat)
+    width = math.ceil((east - west) / resolution)
+    height = math.ceil((north - south) / resolution)
+    return (west, resolution, 0.0, north, 0.0, -resolution), width, height
+
+
+def build_lut(grid, lut_dir):
+    """Compute and store the lookup table of ``grid``; returns its directory.
+
+    ``index.npy`` (int32) is the flat source index of the top-left bilinear
+    neighbour of every output pixel, -1 where the pixel is off the scan.
+    ``fx.npy``/``fy.npy`` (uint16) are the weights of the right and lower
+    neighbours in 1/65536.
+    """
+    path = os.path.join(lut_dir, grid_key(grid))
+    if os.path.exists(os.path.join(path, "grid.json")):
+        return path
+    start = time.time()
+    geotransform, width, height = output_grid(grid)
+    gt = grid.geotransform
+    os.makedirs(lut_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=lut_dir)
+    try:
+        index = np.lib.format.open_memmap(
+            os.path.join(tmp, "index.npy"), "w+", np.int32, (height, width)
+        )
+        fx = np.lib.format.open_memmap(
+            os.path.join(tmp, "fx.npy"), "w+", np.uint16, (height, width)
+        )
+        fy = np.lib.format.open_memmap(
+            os.path.join(tmp, "fy.npy"), "w+", np.uint16, (height, width)
+        )
+        lon = geotransform[0] + (np.arange(width) + 0.5) * geotransform[1]
+        for row in range(0, height, CHUNK_ROWS):
+            rows = np.arange(row, min(row + CHUNK_ROWS, height))
+            lat = geotransform[3] + (rows + 0.5) * geotransform[5]
+            x, y = lonlat_to_scan(grid, *np.meshgrid(lon, lat))
+            # Fractional source pixel, 0 = center of the first pixel
+            col = (x * grid.h - gt[0]) / gt[1] - 0.5
+            src_row = (y * grid.h - gt[3]) / gt[5] - 0.5
+            with np.errstate(invalid="ignore"):
+                valid = (
+                    (col >= -0.5)
+                    & (col <= grid.width - 0.5)
+                    & (src_row >= -0.5)
+                    & (src_row <= grid.height - 0.5)
+                )
+            col = np.clip(np.nan_to_num(col), 0, grid.width - 1)
+            src_row = np.clip(np.nan_to_num(src_row), 0, grid.height - 1)
+            col0 = np.minimum(col.astype(np.int64), grid.width - 2)
+            row0 = np.minimum(src_row.astype(np.int64), grid.height - 2)
+            index[rows] = np.where(valid, row0 * grid.width + col0, -1)
+            fx[rows] = np.round((col - col0) * (WEIGHT_SCALE - 1))
+            fy[rows] = np.round((src_row - row0) * (WEIGHT_SCALE - 1))
+        index.flush()
+        fx.flush()
+        fy.flush()
+        del index, fx, fy
+        with open(os.path.join(tmp, "grid.json"), "w") as f:
+            json.dump({"geotransform": geotransform, "size": [width, height]}, f)
+        os.chmod(tmp, 0o755)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Another process built the same table first
+            shutil.rmtree(tmp, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    log.info(
+        "Lookup table %s: %dx%d -> %dx%d in %.1fs",
+        os.path.basename(path),
+        grid.width,
+        grid.height,
+        width,
+        height,
+        time.time() - start,
+    )
+    return path
+
+
+def load_lut(path):
+    """``(index, fx, fy, geotransform, (width, height))``, memory-mapped"""
+    with open(os.path.join(path, "grid.json")) as f:
+        meta = json.load(f)
+    arrays = [
+        np.load(os.path.join(path, f"{n}.npy"), "r") for n in ("index", "fx", "fy")
+    ]
+    return (*arrays, tuple(meta["geotransform"]), tuple(meta["size"]))
+
+
+def resample(values, nodata, lut, source_width):
+    """Bilinear gather of ``values`` (flat) through a lookup table.
+
+    Fill-value neighbours drop out of the weights, like gdalwarp.
+    """
+    index, fx, fy, _, (width, height) = lut
+    out = np.empty((height, width), values.dtype)
+    data = values.astype(np.float32)
+    if nodata is not None:
+        data[values == nodata] = np.nan
+    fill = nodata if nodata is not None else 0
+    for row in range(0, height, CHUNK_ROWS):
+        rows = slice(row, min(row + CHUNK_ROWS, height))
+        i = np.asarray(index[rows])
+        valid = i >= 0
+        i = np.where(valid, i, 0)
+        wx = np.asarray(fx[rows], np.float32) / (WEIGHT_SCALE - 1)
+        wy = np.asarray(fy[rows], np.float32) / (WEIGHT_SCALE - 1)
+        total = np.zeros(i.shape, np.float32)
+        weights = np.zeros(i.shape, np.float32)
+        for offset, weight in (
+            (0, (1 - wx) * (1 - wy)),
+            (1, wx * (1 - wy)),
+            (source_width, (1 - wx) * wy),
+            (source_width + 1, wx * wy),
+        ):
+            neighbour = data[i + offset]
+            ok = np.isfinite(neighbour)
+            total[ok] += weight[ok] * neighbour[ok]
+            weights[ok] += weight[ok]
+        valid &= weights > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = np.rint(total / weights)
+        out[rows] = np.where(valid, result, fill).astype(values.dtype)
+    return out
+
+
+def build_goes(target, lut_dir):
+    """Resample one scan through its grid's lookup table into ``target.path``"""
+    from osgeo import gdal
+
+    dataset = open_cmi(target.source)
+    grid = read_grid(dataset)
+    lut = load_lut(build_lut(grid, lut_dir))
+    band = dataset.GetRasterBand(1)
+    nodata = band.GetNoDataValue()
+    values = band.ReadAsArray().ravel()
+    if nodata is not None:
+        nodata = values.dtype.type(nodata)
+    image = resample(values, nodata, lut, grid.width)
+
+    geotransform, (width, height) = lut[3], lut[4]
+    memory = gdal.GetDriverByName("MEM").Create("", width, height, 1, band.DataType)
+    memory.SetGeoTransform(geotransform)
+    memory.SetProjection("EPSG:4326")
+    out_band = memory.GetRasterBand(1)
+    out_band.WriteArray(image)
+    if nodata is not None:
+        out_band.SetNoDataValue(float(nodata))
+    out_band.SetScale(band.GetScale() or 1.0)
+    out_band.SetOffset(band.GetOffset() or 0.0)
+    tmp = f"{target.path}.{os.getpid()}.tmp"
+    try:
+        gdal.Translate(tmp, memory, format="COG", creationOptions=cog.CREATION_OPTIONS)
+        os.replace(tmp, target.path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return target.path
+
+
+def _prepare_lut(source, lut_dir):
+    return build_lut(read_grid(open_cmi(source)), lut_dir)
+
+
+def ingest(targets, lut_dir=None, force=False, workers=None):
+    """Resample the new scans in parallel; returns the paths written"""
+    targets = [
+        t for t in targets if os.path.exists(t.source) and (force or not is_current(t))
+    ]
+    if not targets:
+        return []
+    lut_dir = lut_dir or os.path.join(os.path.dirname(targets[0].source), "lut")
+    workers = min(len(targets), workers or os.cpu_count() or 1)
+    start = time.time()
+    written = []
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        # Tables first, one per distinct grid, so no two channels build the same one
+        grids = {}
+        for target in targets:
+            grids.setdefault(grid_key(read_grid(open_cmi(target.source))), target)
+        for future in [
+            pool.submit(_prepare_lut, t.source, lut_dir) for t in grids.values()
+        ]:
+            future.result()
+        futures = {pool.submit(build_goes, t, lut_dir): t for t in targets}
+        for future in concurrent.futures.as_completed(futures):
+            target = futures[future]
+            try:
+                written.append(future.result())
+            except (RuntimeError, ValueError) as e:
+                log.warning("%s: %s", target.source, e)
+                continue
+            log.info(
+                "%s -> %s (%.1f MB)",
+                target.source,
+                target.path,
+                os.path.getsize(target.path) / 1e6,
+            )
+    log.info("%d GOES channels in %.1fs", len(written), time.time() - start)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--goes-dir", default=DEFAULT_GOES_DIR)
+    parser.add_argument("--lut-dir", help="Default: GOES_DIR/lut")
+    parser.add_argument("--workers", type=int, help="Parallel channels")
+    parser.add_argument("--force", action="store_true", help="Rebuild current files")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    ingest(plan(args.goes_dir), args.lut_dir, force=args.force, workers=args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,360 @@
+"""Download only the GRIB2 messages the mapfiles use, by byte range.
+
+A GFS ``pgrb2.0p25`` file is a few hundred MB, and gfs.map reads a handful
+of its ~700 fields. NOMADS publishes a ``.idx`` inventory next to every
+file, with one line per field:
+
+    580:412650432:d=2026101712:TMP:2 m above ground:anl:
+
+A message runs from its offset to the next message's offset. This step
+looks up the ``VARIABLE:LEVEL`` of every band the mapfiles reference (in
+the analysis inventory of the same run), fetches just those messages with
+concurrent ranged GETs over keep-alive connections (perflab.upstream) and
+writes a slim GRIB2 file. The file is verified message by message and then
+renamed into place. MapServer and GDAL open a few MB instead of the whole
+file, and the later forecast hours get the same fields.
+
+Bands are renumbered in the slim file. A ``<file>.bands.json`` sidecar
+maps the original numbers (``perflab_band`` in the mapfiles) to the slim
+ones. perflab.ingest.cog and perflab.ingest.timeindex read it through
+``cog.file_band``, so COG paths and the mapfiles keep the original numbers.
+
+MRMS ``.latest.grib2.gz`` products are one gzipped message without an
+inventory. URLs without a ``.idx`` are downloaded whole, gunzipped when
+they end in ``.gz`` and verified the same way. ``NAME=URL`` saves under
+another name. Example::
+
+    GFS=https://nomads.ncep.noaa.gov/pub/data/nccf/com/gfs/prod/gfs.20261017/12/atmos
+    python -m perflab.ingest.subset --dest /data $GFS/gfs.t12z.pgrb2.0p25.f003
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import glob
+import gzip
+import json
+import logging
+import os
+import re
+import time
+from urllib.parse import urlsplit
+
+from perflab import mapfile
+from perflab.ingest import cog, timeindex
+from perflab.upstream import Upstream
+
+log = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+# Ranges closer than this are fetched as one request and the gap dropped
+MERGE_GAP = 256 * 1024
+FORECAST_HOUR = re.compile(r"\.f\d{3}$")
+
+Record = collections.namedtuple("Record", "number offset date variable level forecast")
+# Bytes [start, end) of one message; end is None for the last one in the file
+Message = collections.namedtuple("Message", "start end bands keys")
+
+
+def parse_idx(text):
+    """Records of a NOMADS ``.idx`` inventory, one per field (GDAL band) in order"""
+    records = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        parts = line.split(":")
+        if len(parts) < 6 or not parts[1].isdigit():
+            raise ValueError(f"Bad inventory line {line!r}")
+        records.append(
+            Record(
+                parts[0],
+                int(parts[1]),
+                parts[2].partition("=")[2],
+                parts[3],
+                parts[4],
+                ":".join(parts[5:]).rstrip(":"),
+            )
+        )
+    return records
+
+
+def field_key(record):
+    return f"{record.variable}:{record.level}"
+
+
+def messages(records):
+    """Messages of an inventory; sub-fields (``580.1``, ``580.2``) share one"""
+    by_offset = collections.OrderedDict()
+    for band, record in enumerate(records, 1):
+        bands, keys = by_offset.setdefault(record.offset, ([], []))
+        bands.append(band)
+        keys.append(field_key(record))
+    offsets = list(by_offset)
+    return [
+        Message(offset, next_offset, *by_offset[offset])
+        for offset, next_offset in zip(offsets, offsets[1:] + [None])
+    ]
+
+
+def select(records, keys):
+    """The messages holding any of the ``VARIABLE:LEVEL`` ``keys``"""
+    return [m for m in messages(records) if set(m.keys) & set(keys)]
+
+
+def spans(selected, gap=MERGE_GAP):
+    """Coalesce messages into ``(start, end, messages)`` fetch ranges"""
+    result = []
+    for message in selected:
+        if result and result[-1][1] is not None:
+            if message.start - result[-1][1] <= gap:
+                result[-1][1] = message.end
+                result[-1][2].append(message)
+                continue
+        result.append([message.start, message.end, [message]])
+    return [tuple(span) for span in result]
+
+
+def verify(data):
+    """Number of GRIB messages in ``data``; raises ValueError unless it is whole"""
+    count = offset = 0
+    while offset < len(data):
+        if data[offset : offset + 4] != b"GRIB" or len(data) - offset < 16:
+            raise ValueError(f"No GRIB message at byte {offset}")
+        edition = data[offset + 7]
+        if edition == 2:
+            length = int.from_bytes(data[offset + 8 : offset + 16], "big")
+        elif edition == 1:
+            length = int.from_bytes(data[offset + 4 : offset + 7], "big")
+        else:
+            raise ValueError(f"GRIB edition {edition} at byte {offset}")
+        if data[offset + length - 4 : offset + length] != b"7777":
+            raise ValueError(f"GRIB message at byte {offset} is truncated")
+        offset += length
+        count += 1
+    return count
+
+
+def map_bands(map_paths):
+    """Bands (analysis numbering) of the GFS files the mapfiles read"""
+    bands = set()
+    for path in map_paths:
+        for layer in mapfile.layers(mapfile.load(path)):
+            source = cog.layer_source(layer)
+            if source and timeindex.GFS_FILE.match(os.path.basename(source[0])):
+                bands.add(source[1])
+    return bands
+
+
+def is_current(path, keys):
+    """Whether ``path`` holds the ``keys`` fields (a whole file holds them all)"""
+    if not os.path.exists(path):
+        return False
+    sidecar = cog.read_bands(path)
+    return sidecar is None or set(keys) <= set(sidecar["fields"])
+
+
+def _write(path, data, sidecar=None):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    if sidecar is None:
+        if os.path.exists(cog.bands_path(path)):
+            os.remove(cog.bands_path(path))
+        return
+    sidecar["size"] = len(data)
+    tmp = f"{cog.bands_path(path)}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(sidecar, f, indent=1, sort_keys=True)
+    os.replace(tmp, cog.bands_path(path))
+
+
+class Downloader:
+    def __init__(self, workers=DEFAULT_WORKERS, timeout=120):
+        self.workers = workers
+        self.timeout = timeout
+        self._upstreams = {}
+        self._inventories = {}
+        self._pool = concurrent.futures.ThreadPoolExecutor(workers)
+
+    def upstream(self, url):
+        parts = urlsplit(url)
+        base = f"{parts.scheme}://{parts.netloc}"
+        if base not in self._upstreams:
+            self._upstreams[base] = Upstream(base, timeout=self.timeout)
+        return self._upstreams[base], parts.path + (
+            f"?{parts.query}" if parts.query else ""
+        )
+
+    def get(self, url, headers=None):
+        upstream, path = self.upstream(url)
+        response = upstream.get(path, headers)
+        if response.status not in (200, 206):
+            raise OSError(f"GET {url}: HTTP {response.status}")
+        return response
+
+    def inventory(self, url):
+        """Records of ``url + ".idx"``, or None if there is none"""
+        if url.endswith(".gz"):
+            return None
+        if url not in self._inventories:
+            upstream, path = self.upstream(url + ".idx")
+            response = upstream.get(path)
+            if response.status == 404:
+                self._inventories[url] = None
+            elif response.status != 200:
+                raise OSError(f"GET {url}.idx: HTTP {response.status}")
+            else:
+                self._inventories[url] = parse_idx(response.body.decode())
+        return self._inventories[url]
+
+    def keys(self, url, bands):
+        """``VARIABLE:LEVEL`` of analysis ``bands``, from the run's f000 inventory"""
+        records = self.inventory(FORECAST_HOUR.sub(".f000", url))
+        if records is None:
+            raise OSError(f"No inventory for the analysis of {url}")
+        missing = [b for b in bands if not 1 <= b <= len(records)]
+        if missing:
+            raise ValueError(f"Analysis inventory has no band {missing}")
+        return sorted({field_key(records[b - 1]) for b in bands})
+
+    def _range(self, url, start, end):
+        last = "" if end is None else str(end - 1)
+        response = self.get(url, {"Range": f"bytes={start}-{last}"})
+        if response.status == 200:
+            # Range ignored: the whole file came back
+            return response.body[start:end]
+        return response.body
+
+    def subset(self, url, path, keys):
+        """Fetch the messages of ``keys`` from ``url`` into ``path``; returns bytes"""
+        records = self.inventory(url)
+        selected = select(records, keys)
+        found = {k for m in selected for k in m.keys}
+        if set(keys) - found:
+            log.warning("%s has no %s", url, ", ".join(sorted(set(keys) - found)))
+        if not selected:
+            raise ValueError(f"none of the fields {keys} in the inventory")
+        ranges = spans(selected)
+        bodies = self._pool.map(lambda span: self._range(url, *span[:2]), ranges)
+        parts = []
+        for (start, _, span_messages), body in zip(ranges, bodies):
+            for message in span_messages:
+                end = None if message.end is None else message.end - start
+                parts.append(body[message.start - start : end])
+        data = b"".join(parts)
+        if verify(data) != len(selected):
+            raise ValueError(f"expected {len(selected)} GRIB messages")
+        bands, slim = {}, 0
+        for message in selected:
+            for band in message.bands:
+                slim += 1
+                bands[str(band)] = slim
+        _write(
+            path,
+            data,
+            {"url": url, "fields": sorted(found), "bands": bands},
+        )
+        log.info(
+            "%s: %d of %d fields, %d requests, %.1f MB",
+            path,
+            slim,
+            len(records),
+            len(ranges),
+            len(data) / 1e6,
+        )
+        return len(data)
+
+    def whole(self, url, path):
+        """Download ``url`` (gunzipped if ``.gz``) into ``path``; returns bytes"""
+        data = self.get(url).body
+        if url.endswith(".gz"):
+            data = gzip.decompress(data)
+        count = verify(data)
+        _write(path, data)
+        log.info("%s: %d messages, %.1f MB", path, count, len(data) / 1e6)
+        return len(data)
+
+    def download(self, url, path, bands=(), fields=(), keep=False):
+        """Subset ``url`` if it has an inventory, else download it whole"""
+        keys = list(fields)
+        if bands and self.inventory(url) is not None:
+            keys = sorted(set(keys) | set(self.keys(url, bands)))
+        if keep and is_current(path, keys):
+            log.info("%s is current", path)
+            return 0
+        if keys and self.inventory(url) is not None:
+            return self.subset(url, path, keys)
+        if keys:
+            log.info("%s has no inventory, downloading it whole", url)
+        return self.whole(url, path)
+
+
+def target(item, dest):
+    """``URL`` or ``NAME=URL`` -> (url, path); GRIB2 names get ``.grb2``"""
+    name, _, url = item.partition("=")
+    if "://" in name or not url:
+        url = item
+        name = os.path.basename(urlsplit(url).path)
+        if name.endswith(".gz"):
+            name = name[:-3]
+        if not name.lower().endswith(cog.GRIB_EXTENSIONS):
+            name += ".grb2"
+    return url, os.path.join(dest, name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("urls", nargs="+", help="URL or NAME=URL")
+    parser.add_argument("--dest", default="/data")
+    parser.add_argument(
+        "--maps",
+        nargs="+",
+        default=sorted(glob.glob(os.path.join(cog.REPO_DIR, "*.map"))),
+    )
+    parser.add_argument(
+        "--field",
+        action="append",
+        default=[],
+        dest="fields",
+        help="Extra VARIABLE:LEVEL field, e.g. 'UGRD:10 m above ground' (repeatable)",
+    )
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument(
+        "--keep-existing",
+        action="store_true",
+        help="Skip files that already hold the wanted fields",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    bands = sorted(map_bands(args.maps))
+    downloader = Downloader(args.workers)
+    failed = total = 0
+    start = time.time()
+    for item in args.urls:
+        url, path = target(item, args.dest)
+        try:
+            total += downloader.download(
+                url, path, bands, args.fields, keep=args.keep_existing
+            )
+        except (OSError, ValueError) as e:
+            log.error("%s: %s", url, e)
+            failed += 1
+    log.info(
+        "%d files, %.1f MB in %.1fs, %d failed",
+        len(args.urls),
+        total / 1e6,
+        time.time() - start,
+        failed,
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,421 @@
+"""Forecast-hour index for the GFS raster layers (WMS TIME and DIM_REFERENCE_TIME).
+
+gfs.map reads a single file, ``gfs.t12z.pgrb2.0p25.f000.grb2``. This step
+finds every forecast file of the same model in ``/data``. In each one it
+locates the band that holds the layer's variable: the same GRIB_ELEMENT
+and GRIB_SHORT_NAME as the layer's own band. Band numbers differ between
+the analysis, later forecast hours and filtered downloads. Each band is
+extracted as a COG (perflab.ingest.cog), and a per-layer FlatGeobuf tile
+index is written, with one feature per file::
+
+    /data/index/GFS/t2m.fgb
+        location        /data/cog/gfs.t12z.pgrb2.0p25.f003/band581.tif
+        time            2026-10-17T15:00:00Z  (valid time)
+        reference_time  2026-10-17T12:00:00Z
+        fhour           3
+        band            581
+
+``--rewrite`` swaps the layers' DATA for TILEINDEX/TILEITEM and writes the
+time metadata from the index. That metadata is wms_timeextent,
+wms_timeitem and wms_timedefault, plus a ``reference_time`` dimension that
+defaults to the latest run. MapServer then answers ``TIME=`` and
+``DIM_REFERENCE_TIME=`` requests. Rerun it when new runs land so the
+extents follow. ``--revert`` restores DATA. Example::
+
+    python -m perflab.ingest.timeindex --maps gfs.map --rewrite
+"""
+
+import argparse
+import collections
+import datetime
+import glob
+import logging
+import os
+import re
+import time
+
+from perflab import mapfile
+from perflab.ingest import cog
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = "/data/index"
+GFS_FILE = re.compile(
+    r"^(?P<model>gfs)\.t(?P<cycle>\d\d)z\.(?P<product>pgrb2\.\w+)\.f(?P<fhour>\d{3})"
+    r"\.(?:grb2|grib2)$"
+)
+# Metadata written by --rewrite and removed by --revert
+TIME_METADATA = (
+    "wms_timeextent",
+    "wms_timeitem",
+    "wms_timedefault",
+    "wms_dimensionlist",
+    "wms_reference_time_item",
+    "wms_reference_time_extent",
+    "wms_reference_time_units",
+    "wms_reference_time_default",
+    "perflab_data",
+)
+
+Entry = collections.namedtuple(
+    "Entry", "source band path reference_time valid_time fhour"
+)
+IndexTarget = collections.namedtuple("IndexTarget", "map layer path key entries")
+
+
+def index_path(index_dir, map_name, layer_name):
+    return os.path.join(index_dir, map_name.upper(), f"{layer_name}.fgb")
+
+
+def iso(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%SZ"
+    )
+
+
+def _grib_seconds(value):
+    """GRIB_REF_TIME / GRIB_VALID_TIME: ``"  1697112000 sec UTC"`` -> int"""
+    return int(value.split()[0])
+
+
+def time_layers(map_block):
+    """``{layer name: (GRIB2 source, band)}`` of the GFS forecast raster layers"""
+    result = {}
+    for layer in mapfile.layers(map_block):
+        if (layer.get("TYPE") or "").upper() != "RASTER" or layer.get("CONNECTIONTYPE"):
+            continue
+        source = cog.layer_source(layer)
+        if source and GFS_FILE.match(os.path.basename(source[0])):
+            result[layer.get("NAME")] = source
+    return result
+
+
+def forecast_files(source):
+    """Every forecast file of the same model and product next to ``source``"""
+    match = GFS_FILE.match(os.path.basename(source))
+    directory = os.path.dirname(source)
+    pattern = f"{match['model']}.t??z.{match['product']}.f???.*"
+    return sorted(
+        path
+        for path in glob.glob(os.path.join(directory, pattern))
+        if GFS_FILE.match(os.path.basename(path))
+    )
+
+
+class GribScanner:
+    """Band keys and times of GRIB2 files, read from metadata only"""
+
+    def __init__(self):
+        from osgeo import gdal
+
+        gdal.UseExceptions()
+        self.gdal = gdal
+        self._files = {}
+
+    def scan(self, path):
+        """``{(element, level): (band, reference time, valid time)}``, first band wins"""
+        if path not in self._files:
+            bands = {}
+            dataset = self.gdal.Open(path)
+            for number in range(1, dataset.RasterCount + 1):
+                metadata = dataset.GetRasterBand(number).GetMetadata()
+                key = (metadata.get("GRIB_ELEMENT"), metadata.get("GRIB_SHORT_NAME"))
+                if None in key or key in bands:
+                    continue
+                bands[key] = (
+                    number,
+                    _grib_seconds(metadata["GRIB_REF_TIME"]),
+                    _grib_seconds(metadata["GRIB_VALID_TIME"]),
+                )
+            self._files[path] = bands
+        return self._files[path]
+
+    def band_key(self, path, band):
+        for key, (number, _, _) in self.scan(path).items():
+            if number == band:
+                return key
+        return None
+
+
+def plan(map_paths, index_dir=DEFAULT_INDEX_DIR, cog_dir=cog.DEFAULT_COG_DIR):
+    """One IndexTarget per GFS raster layer, entries sorted by run then valid time"""
+    scanner = GribScanner()
+    targets = []
+    for path in map_paths:
+        map_block = mapfile.load(path)
+        map_name = (map_block.get("NAME") or "").upper()
+        for name, (source, band) in sorted(time_layers(map_block).items()):
+            if not os.path.exists(source):
+                log.warning("%s/%s: %s missing, skipping", map_name, name, source)
+                continue
+            key = scanner.band_key(source, cog.file_band(source, band))
+            if key is None:
+                log.warning("%s/%s: %s has no band %d", map_name, name, source, band)
+                continue
+            entries = []
+            for candidate in forecast_files(source):
+                found = scanner.scan(candidate).get(key)
+                if found is None:
+                    continue
+                number, reference, valid = found
+                # COG paths use the original band number, like perflab.ingest.cog
+                original = cog.original_band(candidate, number)
+                entries.append(
+                    Entry(
+                        candidate,
+                        number,
+                        cog.cog_path(cog_dir, candidate, original),
+                        reference,
+                        valid,
+                        (valid - reference) // 3600,
+                    )
+                )
+            entries.sort(key=lambda e: (e.reference_time, e.valid_time))
+            targets.append(
+                IndexTarget(
+                    map_name, name, index_path(index_dir, map_name, name), key, entries
+                )
+            )
+    return targets
+
+
+def write_index(target):
+    """Write ``target``'s tile index (extents read from the COGs)"""
+    from osgeo import gdal, ogr, osr
+
+    gdal.UseExceptions()
+    os.makedirs(os.path.dirname(target.path), exist_ok=True)
+    tmp = f"{target.path}.{os.getpid()}.tmp.fgb"
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    dataset = ogr.GetDriverByName("FlatGeobuf").CreateDataSource(tmp)
+    try:
+        layer = dataset.CreateLayer(
+            target.layer, srs, ogr.wkbPolygon, options=["SPATIAL_INDEX=YES"]
+        )
+        for name, kind in (
+            ("location", ogr.OFTString),
+            ("time", ogr.OFTString),
+            ("reference_time", ogr.OFTString),
+            ("fhour", ogr.OFTInteger),
+            ("band", ogr.OFTInteger),
+        ):
+            layer.CreateField(ogr.FieldDefn(name, kind))
+        for entry in target.entries:
+            raster = gdal.Open(entry.path)
+            x0, dx, _, y0, _, dy = raster.GetGeoTransform()
+            x1, y1 = x0 + dx * raster.RasterXSize, y0 + dy * raster.RasterYSize
+            raster = None
+            feature = ogr.Feature(layer.GetLayerDefn())
+            feature.SetField("location", entry.path)
+            feature.SetField("time", iso(entry.valid_time))
+            feature.SetField("reference_time", iso(entry.reference_time))
+            feature.SetField("fhour", entry.fhour)
+            feature.SetField("band", entry.band)
+            feature.SetGeometry(
+                ogr.CreateGeometryFromWkt(
+                    f"POLYGON(({x0} {y0},{x1} {y0},{x1} {y1},{x0} {y1},{x0} {y0}))"
+                )
+            )
+            layer.CreateFeature(feature)
+        dataset = None
+        os.replace(tmp, target.path)
+    finally:
+        dataset = None
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def ingest(targets, force=False):
+    """Build the per-hour COGs and (re)write the indexes; returns the indexes written"""
+    written = []
+    for target in targets:
+        start = time.time()
+        built = cog.ingest(
+            [
+                cog.CogTarget(
+                    e.source, e.band, e.path, [f"{target.map}/{target.layer}"]
+                )
+                for e in target.entries
+            ],
+            force=force,
+        )
+        if not built and not force and _index_current(target):
+            continue
+        write_index(target)
+        written.append(target.path)
+        log.info(
+            "%s/%s: %d timesteps in %d runs -> %s (%.1fs)",
+            target.map,
+            target.layer,
+            len(target.entries),
+            len({e.reference_time for e in target.entries}),
+            target.path,
+            time.time() - start,
+        )
+    return written
+
+
+def _index_current(target):
+    try:
+        mtime = os.path.getmtime(target.path)
+        return all(os.path.getmtime(e.path) <= mtime for e in target.entries)
+    except OSError:
+        return False
+
+
+def extent(timestamps):
+    """WMS extent: ``start/end/PTnH`` when evenly spaced, else a list"""
+    times = sorted(set(timestamps))
+    steps = {b - a for a, b in zip(times, times[1:])}
+    if len(times) > 2 and len(steps) == 1 and steps.pop() % 3600 == 0:
+        return f"{iso(times[0])}/{iso(times[-1])}/PT{(times[1] - times[0]) // 3600}H"
+    return ",".join(iso(t) for t in times)
+
+
+def time_metadata(target, data):
+    """Layer METADATA items for a tile-indexed layer"""
+    runs = sorted({e.reference_time for e in target.entries})
+    latest = runs[-1]
+    return {
+        "wms_timeextent": extent(e.valid_time for e in target.entries),
+        "wms_timeitem": "time",
+        "wms_timedefault": iso(latest),
+        "wms_dimensionlist": "reference_time",
+        "wms_reference_time_item": "reference_time",
+        "wms_reference_time_extent": ",".join(iso(t) for t in runs),
+        "wms_reference_time_units": "ISO8601",
+        "wms_reference_time_default": iso(latest),
+        "perflab_data": data,
+    }
+
+
+def _indent(line):
+    return line[: len(line) - len(line.lstrip())]
+
+
+def rewrite_mapfile(path, targets, revert=False):
+    """Switch a mapfile's indexed layers to TILEINDEX (or back to DATA).
+
+    Lines are edited in place, like perflab.ingest.cog. Returns the number
+    of layers changed.
+    """
+    with open(path) as f:
+        text = f.read()
+    lines = text.split("\n")
+    map_block = mapfile.parse(text)
+    map_name = (map_block.get("NAME") or "").upper()
+    by_layer = {t.layer: t for t in targets if t.map == map_name and t.entries}
+    edits = {}  # line number -> replacement lines, applied bottom-up
+    changed = 0
+    for layer in mapfile.layers(map_block):
+        target = by_layer.get(layer.get("NAME"))
+        metadata_block = layer.block("METADATA")
+        metadata = layer.metadata()
+        tileindex = layer.get_all("TILEINDEX")
+        data = layer.get_all("DATA")
+        if revert:
+            if not tileindex or "perflab_data" not in metadata:
+                continue
+            indent = _indent(lines[tileindex[0].line - 1])
+            edits[tileindex[0].line] = [f'{indent}DATA "{metadata["perflab_data"]}"']
+            for directive in layer.get_all("TILEITEM"):
+                edits[directive.line] = []
+            items = {}
+        elif target is not None and (data or tileindex):
+            if not data and "perflab_data" not in metadata:
+                log.warning(
+                    "%s: layer %s has a TILEINDEX but no perflab_data, skipping",
+                    path,
+                    layer.get("NAME"),
+                )
+                continue
+            indent = _indent(lines[(data or tileindex)[0].line - 1])
+            original = metadata.get("perflab_data") or data[0].values[0]
+            if data:
+                edits[data[0].line] = [
+                    f'{indent}TILEINDEX "{target.path}"',
+                    f'{indent}TILEITEM "location"',
+                ]
+            items = time_metadata(target, original)
+        else:
+            continue
+        if metadata_block is None:
+            log.warning("%s: layer %s has no METADATA block", path, layer.get("NAME"))
+            continue
+
+        old = {key: metadata.get(key) for key in TIME_METADATA if key in metadata}
+        if old == items and not data:
+            continue
+        changed += 1
+        # Replace or drop the existing time items, then append the missing ones
+        item_indent = _indent(lines[metadata_block.line - 1]) + "  "
+        for lineno in range(metadata_block.line + 1, metadata_block.end_line):
+            key = lines[lineno - 1].strip().split(" ")[0].strip('"')
+            if key in TIME_METADATA:
+                edits[lineno] = (
+                    [f'{item_indent}"{key}" "{items[key]}"'] if key in items else []
+                )
+        missing = [key for key in items if key not in old]
+        if missing:
+            edits[metadata_block.end_line] = [
+                f'{item_indent}"{key}" "{items[key]}"' for key in missing
+            ] + [lines[metadata_block.end_line - 1]]
+
+    for lineno in sorted(edits, reverse=True):
+        lines[lineno - 1 : lineno] = edits[lineno]
+    if changed:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines))
+        os.replace(tmp, path)
+    return changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--maps",
+        nargs="+",
+        default=sorted(glob.glob(os.path.join(cog.REPO_DIR, "*.map"))),
+    )
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    parser.add_argument("--cog-dir", default=cog.DEFAULT_COG_DIR)
+    parser.add_argument("--force", action="store_true", help="Rebuild current files")
+    parser.add_argument(
+        "--rewrite", action="store_true", help="Point the layers at their indexes"
+    )
+    parser.add_argument(
+        "--revert", action="store_true", help="Point the layers back at DATA"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only print the timesteps found"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    if args.revert:
+        for path in args.maps:
+            changed = rewrite_mapfile(path, [], revert=True)
+            log.info("%s: %d layers reverted", path, changed)
+        return 0
+
+    targets = plan(args.maps, args.index_dir, args.cog_dir)
+    if args.dry_run:
+        for target in targets:
+            hours = ",".join(str(e.fhour) for e in target.entries)
+            print(
+                f"{target.map}/{target.layer} {target.key}: f{hours} -> {target.path}"
+            )
+        return 0
+    ingest(targets, force=args.force)
+    if args.rewrite:
+        for path in args.maps:
+            changed = rewrite_mapfile(path, targets)
+            log.info("%s: %d layers rewritten", path, changed)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,250 @@
+"""Web-Mercator copies of the raster layers' data, aligned to the webmerc grid.
+
+All source rasters are EPSG:4326 (GOES is warped to 4326 on download), so
+every EPSG:3857 GetMap reprojects on the fly. That includes the MapCache
+``webmerc`` tiles and the random 3857 requests of the aggressive users.
+This step writes one GoogleMapsCompatible COG per raster: the tiles and
+overviews line up with the webmerc zoom levels, and the resolution keeps
+the source's detail at the equator:
+
+    /data/cog/gfs.t12z.pgrb2.0p25.f000/band580.tif
+        -> /data/3857/gfs.t12z.pgrb2.0p25.f000/band580.tif
+
+Output directories mirror the source's under the COG directory (or next to
+it), like perflab.ingest.cog, and a copy is rebuilt once the source's size
+or mtime no longer matches the ones it records.
+
+``--rewrite`` records the copy in the layer METADATA (``perflab_3857_data``).
+perflab.native and the perflab.renderer pool then read it for EPSG:3857
+requests, which makes the warp a plain resample. ``--revert`` drops the
+metadata. Run after perflab.ingest.cog::
+
+    python -m perflab.ingest.webmerc --maps gfs.map mrms.map goes.map
+"""
+
+import argparse
+import collections
+import glob
+import logging
+import os
+import time
+
+from perflab import mapfile
+from perflab.ingest import cog
+
+log = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_WEBMERC_DIR = "/data/3857"
+METADATA_KEY = "perflab_3857_data"
+RESAMPLING = {"NEAREST": "near", "BILINEAR": "bilinear", "AVERAGE": "average"}
+
+CREATION_OPTIONS = [
+    "TILING_SCHEME=GoogleMapsCompatible",
+    # Keep the finer zoom level so no source pixel is lost
+    "ZOOM_LEVEL_STRATEGY=UPPER",
+    "COMPRESS=DEFLATE",
+    "PREDICTOR=YES",
+    "OVERVIEWS=AUTO",
+    "RESAMPLING=AVERAGE",
+    "NUM_THREADS=ALL_CPUS",
+    "BIGTIFF=IF_SAFER",
+]
+
+WebmercTarget = collections.namedtuple(
+    "WebmercTarget", "source band resample path layers"
+)
+
+
+def webmerc_path(webmerc_dir, source):
+    # COGs keep their layout under the COG directory, other rasters cog_path's
+    roots = [cog.DEFAULT_COG_DIR, os.path.dirname(os.path.abspath(webmerc_dir))]
+    stem, _ = os.path.splitext(os.path.basename(source))
+    return os.path.join(cog.output_dir(webmerc_dir, source, roots), f"{stem}.tif")
+
+
+def layer_raster(layer):
+    """``(file, band, resampling)`` of a plain-file raster layer, or None"""
+    data = layer.get("DATA")
+    band = layer.processing().get("BANDS", "1")
+    if (
+        (layer.get("TYPE") or "").upper() != "RASTER"
+        or layer.get("TILEINDEX")
+        or layer.get("CONNECTIONTYPE")
+        or not data
+        or not os.path.isabs(data)
+        or not band.isdigit()
+    ):
+        return None
+    resample = layer.processing().get("RESAMPLE", "NEAREST").upper()
+    return data, int(band), RESAMPLING.get(resample, "near")
+
+
+def plan(map_paths, webmerc_dir=DEFAULT_WEBMERC_DIR):
+    """One WebmercTarget per distinct (file, band, resampling) in the mapfiles"""
+    layers = collections.defaultdict(list)
+    for path in map_paths:
+        map_block = mapfile.load(path)
+        for layer in mapfile.layers(map_block):
+            raster = layer_raster(layer)
+            if raster:
+                layers[raster].append(f"{map_block.get('NAME')}/{layer.get('NAME')}")
+    paths = collections.Counter(webmerc_path(webmerc_dir, s) for s, _, _ in layers)
+    targets = []
+    for (source, band, resample), names in sorted(layers.items()):
+        path = webmerc_path(webmerc_dir, source)
+        if paths[path] > 1:
+            # Same file, other band or kernel: keep the copies apart
+            stem, ext = os.path.splitext(path)
+            path = f"{stem}_b{band}_{resample}{ext}"
+        targets.append(WebmercTarget(source, band, resample, path, names))
+    return targets
+
+
+def is_current(target):
+    """Whether the copy was built from the source's current size and mtime"""
+    return cog.built_from(target.path, target.source)
+
+
+def build_webmerc(target):
+    """Reproject one band of ``target.source`` to a GoogleMapsCompatible COG"""
+    from osgeo import gdal
+
+    gdal.UseExceptions()
+    os.makedirs(os.path.dirname(target.path), exist_ok=True)
+    tmp = f"{target.path}.{os.getpid()}.tmp"
+    metadata = cog.source_metadata(target.source)
+    try:
+        gdal.Translate(
+            tmp,
+            target.source,
+            format="COG",
+            bandList=[target.band],
+            creationOptions=CREATION_OPTIONS + [f"WARP_RESAMPLING={target.resample}"],
+            metadataOptions=metadata,
+        )
+        os.replace(tmp, target.path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def ingest(targets, force=False):
+    """Build the missing or stale copies; returns the paths written"""
+    written = []
+    for target in targets:
+        if not os.path.exists(target.source):
+            log.warning("%s missing, skipping", target.source)
+            continue
+        if not force and is_current(target):
+            continue
+        start = time.time()
+        build_webmerc(target)
+        written.append(target.path)
+        log.info(
+            "%s band %d -> %s (%.1f MB, %.1fs) for %s",
+            target.source,
+            target.band,
+            target.path,
+            os.path.getsize(target.path) / 1e6,
+            time.time() - start,
+            ", ".join(target.layers),
+        )
+    return written
+
+
+def _indent(line):
+    return line[: len(line) - len(line.lstrip())]
+
+
+def rewrite_mapfile(path, webmerc_dir=DEFAULT_WEBMERC_DIR, revert=False):
+    """Add (or remove) the ``perflab_3857_data`` metadata of the raster layers.
+
+    Returns the number of layers changed.
+    """
+    with open(path) as f:
+        lines = f.read().split("\n")
+    targets = {
+        (t.source, t.band, t.resample): t.path for t in plan([path], webmerc_dir)
+    }
+    edits = {}  # line number -> replacement lines, applied bottom-up
+    changed = 0
+    for layer in mapfile.layers(mapfile.parse("\n".join(lines))):
+        raster = layer_raster(layer)
+        target = None if revert or raster is None else targets[raster]
+        current = layer.metadata().get(METADATA_KEY)
+        if target == current:
+            continue
+        changed += 1
+        metadata = layer.block("METADATA")
+        for lineno in range(metadata.line + 1, metadata.end_line) if metadata else ():
+            key = lines[lineno - 1].strip().split(" ")[0].strip('"')
+            if key == METADATA_KEY:
+                edits[lineno] = []
+        if target is None:
+            continue
+        item = f'"{METADATA_KEY}" "{target}"'
+        if metadata is None:
+            indent = _indent(lines[layer.line - 1]) + "  "
+            edits[layer.end_line] = [
+                f"{indent}METADATA",
+                f"{indent}  {item}",
+                f"{indent}END",
+                lines[layer.end_line - 1],
+            ]
+        else:
+            item_indent = _indent(lines[metadata.line - 1]) + "  "
+            edits[metadata.end_line] = [
+                item_indent + item,
+                lines[metadata.end_line - 1],
+            ]
+
+    for lineno in sorted(edits, reverse=True):
+        lines[lineno - 1 : lineno] = edits[lineno]
+    if changed:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines))
+        os.replace(tmp, path)
+    return changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--maps", nargs="+", default=sorted(glob.glob(os.path.join(REPO_DIR, "*.map")))
+    )
+    parser.add_argument("--webmerc-dir", default=DEFAULT_WEBMERC_DIR)
+    parser.add_argument("--force", action="store_true", help="Rebuild current copies")
+    parser.add_argument(
+        "--rewrite", action="store_true", help="Record the copies in the mapfiles"
+    )
+    parser.add_argument(
+        "--revert", action="store_true", help="Remove the copies from the mapfiles"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only print the copies that would be built",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    if args.rewrite or args.revert:
+        for path in args.maps:
+            changed = rewrite_mapfile(path, args.webmerc_dir, revert=args.revert)
+            log.info("%s: %d layers rewritten", path, changed)
+        return 0
+
+    targets = plan(args.maps, args.webmerc_dir)
+    if args.dry_run:
+        for target in targets:
+            state = "current" if is_current(target) else "build"
+            print(f"{state:8} {target.source} band {target.band} -> {target.path}")
+        return 0
+    ingest(targets, force=args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,127 @@
+"""Prometheus endpoint for the Locust load generator.
+
+Every request Locust records (including the synthetic ``OPEN`` and ``ANIM``
+rows) is observed into histograms of latency and response size. Their
+labels are the map, layer and render style of the request and, for
+latency, the cache outcome the server reported. The cache outcome comes
+from X-Cache-Status for MapCache tiles and X-Tile-Proxy for the WMS proxy.
+Prometheus then gets exact-bucket quantiles every scrape without parsing
+logs in Loki.
+
+Enable with ``--metrics-port`` (LOCUST_METRICS_PORT). A worker serves on
+that port plus its worker index.
+"""
+
+import logging
+import re
+from urllib.parse import parse_qsl, urlsplit
+
+from locust import events
+from locust.runners import MasterRunner, WorkerRunner
+
+from perflab import mapcache, metrics
+
+log = logging.getLogger(__name__)
+
+TILE_PROXY_STATS = re.compile(r"tiles=(\d+) hits=(\d+)")
+LABELS = ["request_type", "map", "layer", "style"]
+
+REQUEST_SECONDS = metrics.histogram(
+    "perflab_locust_request_seconds",
+    "Client-side response time, by map, layer, style, cache and outcome",
+    LABELS + ["cache", "outcome"],
+    buckets=metrics.LATENCY_BUCKETS,
+)
+RESPONSE_BYTES = metrics.histogram(
+    "perflab_locust_response_bytes",
+    "Response body size, by map, layer and style",
+    LABELS,
+    buckets=metrics.BYTES_BUCKETS,
+)
+
+
+@events.init_command_line_parser.add_listener
+def _add_arguments(parser):
+    group = parser.add_argument_group("Prometheus metrics (perflab.locustmetrics)")
+    group.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        env_var="LOCUST_METRICS_PORT",
+        help="Serve /metrics on this port (0 = off)",
+    )
+
+
+@events.init.add_listener
+def _start_server(environment, **kwargs):
+    options = environment.parsed_options
+    port = getattr(options, "metrics_port", 0) if options else 0
+    if not port or isinstance(environment.runner, MasterRunner):
+        return
+    if isinstance(environment.runner, WorkerRunner):
+        port += environment.runner.worker_index
+    try:
+        metrics.start_http_server(port)
+    except OSError as e:
+        log.warning("Cannot serve metrics on :%d: %s", port, e)
+
+
+def url_labels(url):
+    """``(map, layer, style)`` of a WMS URL or MapCache tile path"""
+    parts = urlsplit(url or "")
+    params = {k.upper(): v for k, v in parse_qsl(parts.query)}
+    if "LAYERS" not in params and "/mapcache/" in parts.path:
+        # .../wmts/1.0.0/<tileset>/default/... or .../tms/1.0.0/<tileset>@<grid>/...
+        segments = parts.path.split("/")
+        if "1.0.0" in segments[:-1]:
+            tileset = segments[segments.index("1.0.0") + 1]
+            params.update(tileset_params(tileset.split("@")[0]))
+    return metrics.wms_labels(params)
+
+
+def tileset_params(name):
+    """MAP and LAYERS rendered by a MapCache tileset's source"""
+    try:
+        config = mapcache.load_config()
+    except OSError:
+        return {"LAYERS": name}
+    tileset = config.tilesets.get(name)
+    source = config.sources.get(tileset.source) if tileset else None
+    if source is None:
+        return {"LAYERS": name}
+    query = {k.upper(): v for k, v in parse_qsl(urlsplit(source.url).query)}
+    return {"MAP": query.get("MAP", ""), "LAYERS": source.params.get("LAYERS", "")}
+
+
+def cache_label(response):
+    if response is None:
+        return ""
+    headers = getattr(response, "headers", None) or {}
+    status = headers.get("X-Cache-Status")
+    if status:
+        return status.lower()
+    stats = headers.get("X-Tile-Proxy", "")
+    if stats.startswith("passthrough"):
+        return "passthrough"
+    match = TILE_PROXY_STATS.search(stats)
+    if match:
+        return metrics.cache_outcome(int(match.group(2)), int(match.group(1)))
+    return ""
+
+
+@events.request.add_listener
+def _on_request(
+    request_type,
+    name,
+    response_time,
+    response_length,
+    response=None,
+    exception=None,
+    url=None,
+    **kwargs,
+):
+    labels = (request_type,) + url_labels(url or name)
+    REQUEST_SECONDS.labels(
+        *labels, cache_label(response), "failure" if exception else "success"
+    ).observe(response_time / 1000)
+    RESPONSE_BYTES.labels(*labels).observe(response_length or 0)
@@ -0,0 +1,202 @@
+"""Offline latency analytics over the nginx ``wms_json`` access log.
+
+One streaming pass (perflab.accesslog) files every request under a key made
+of its map, layers, render style, size, CRS and format (``--by`` picks a
+subset). Each key gets an HDR-style log-linear histogram of
+``request_time``: at most a couple of thousand counters per key at
+``--digits`` significant digits, however many requests there are. Past
+``--max-keys``, new combinations are counted under ``(other)``, which
+bounds memory for any log.
+
+The report ranks the combinations by the total time they took. That
+shows where pre-generation or caching saves the most. Example::
+
+    python -m perflab.logstats /var/log/nginx/access.log --by map layers style
+"""
+
+import argparse
+import json
+import logging
+import math
+import sys
+
+from perflab import accesslog
+
+log = logging.getLogger(__name__)
+
+DIMENSIONS = ("map", "layers", "style", "size", "crs", "format")
+OTHER = "(other)"
+
+
+class Histogram:
+    """Log-linear latency histogram (HdrHistogram bucketing) over integers.
+
+    Values below ``2 * 10**digits`` are exact. Above that, each power of two
+    is split into ``10**digits`` sub-buckets, so every quantile is
+    within ``10**-digits`` relative error.
+    """
+
+    def __init__(self, digits=2):
+        self.sub_bits = math.ceil(math.log2(2 * 10**digits))
+        self.sub_count = 1 << self.sub_bits
+        self.half = self.sub_count >> 1
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def _index(self, value):
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - self.sub_bits
+        return self.sub_count + (shift - 1) * self.half + (value >> shift) - self.half
+
+    def _value(self, index):
+        """Midpoint of a bucket"""
+        if index < self.sub_count:
+            return index
+        shift, sub = divmod(index - self.sub_count, self.half)
+        shift += 1
+        low = (sub + self.half) << shift
+        return low + (1 << shift) // 2
+
+    def record(self, value, count=1):
+        value = max(0, int(value))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+
+def record_key(record, by):
+    """The ``by`` dimensions of one access-log record"""
+    params = accesslog.query_params(record)
+    fields = {
+        "map": params.get("MAP", ""),
+        "layers": params.get("LAYERS") or record.get("tile_layer") or "",
+        "style": record.get("render_style") or "",
+        "size": (
+            f"{params['WIDTH']}x{params['HEIGHT']}"
+            if "WIDTH" in params and "HEIGHT" in params
+            else ""
+        ),
+        "crs": (params.get("CRS") or params.get("SRS") or "").upper(),
+        "format": params.get("FORMAT", ""),
+    }
+    return tuple(fields[name] for name in by)
+
+
+class Analyzer:
+    def __init__(self, by=DIMENSIONS, digits=2, max_keys=10000):
+        self.by = tuple(by)
+        self.digits = digits
+        self.max_keys = max_keys
+        self.histograms = {}
+        self.records = 0
+
+    def add(self, record):
+        key = record_key(record, self.by)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            if len(self.histograms) >= self.max_keys:
+                key = (OTHER,) * len(self.by)
+                histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.digits)
+        # request_time has millisecond resolution; keep microseconds anyway
+        histogram.record(accesslog.request_time(record) * 1e6)
+        self.records += 1
+
+    def add_log(self, path):
+        for record in accesslog.iter_records(path):
+            self.add(record)
+
+    def ranking(self):
+        """Rows sorted by total time, each with its share of the grand total"""
+        grand_total = sum(h.total for h in self.histograms.values()) or 1
+        rows = []
+        cumulative = 0
+        for key, h in sorted(self.histograms.items(), key=lambda kv: -kv[1].total):
+            cumulative += h.total
+            rows.append(
+                {
+                    **dict(zip(self.by, key)),
+                    "count": h.count,
+                    "total_s": h.total / 1e6,
+                    "share": h.total / grand_total,
+                    "cumulative": cumulative / grand_total,
+                    "p50_ms": h.quantile(0.5) / 1e3,
+                    "p95_ms": h.quantile(0.95) / 1e3,
+                    "p99_ms": h.quantile(0.99) / 1e3,
+                    "max_ms": h.max / 1e3,
+                }
+            )
+        return rows
+
+
+def print_report(analyzer, top, out=sys.stdout):
+    rows = analyzer.ranking()
+    print(
+        f"{analyzer.records} requests, {len(rows)} combinations of "
+        f"{', '.join(analyzer.by)}",
+        file=out,
+    )
+    print(
+        f"{'share':>6} {'cum':>6} {'count':>8} {'total s':>9} {'p50':>7} "
+        f"{'p95':>7} {'p99':>7} {'max':>7}  key",
+        file=out,
+    )
+    for row in rows[:top]:
+        key = " ".join(f"{name}={row[name] or '-'}" for name in analyzer.by)
+        print(
+            f"{row['share']:6.1%} {row['cumulative']:6.1%} {row['count']:8d} "
+            f"{row['total_s']:9.1f} {row['p50_ms']:7.0f} {row['p95_ms']:7.0f} "
+            f"{row['p99_ms']:7.0f} {row['max_ms']:7.0f}  {key}",
+            file=out,
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("logs", nargs="+", help="wms_json access logs (.gz, -)")
+    parser.add_argument("--by", nargs="+", choices=DIMENSIONS, default=DIMENSIONS)
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument(
+        "--digits", type=int, default=2, help="Histogram significant digits"
+    )
+    parser.add_argument("--max-keys", type=int, default=10000)
+    parser.add_argument("--json", action="store_true", help="Dump every row")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    analyzer = Analyzer(args.by, args.digits, args.max_keys)
+    for path in args.logs:
+        analyzer.add_log(path)
+    if args.json:
+        print(json.dumps(analyzer.ranking(), indent=1))
+    else:
+        print_report(analyzer, args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,67 @@
+"""Thread-safe LRU cache bounded by the total size of its values."""
+
+import collections
+import threading
+import time
+
+
+class LRUCache:
+    def __init__(self, max_bytes, sizeof=len, max_age=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        # Seconds after which an entry counts as missing (None = never)
+        self.max_age = max_age
+        self.bytes = 0
+        self._items = collections.OrderedDict()  # key -> (value, created)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, created = self._items[key]
+            except KeyError:
+                return default
+            if self.max_age is not None and created < time.time() - self.max_age:
+                del self._items[key]
+                self.bytes -= self.sizeof(value)
+                return default
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value, created=None):
+        """Store ``value``; returns the number of entries evicted.
+
+        ``created`` (default now) is when the value was made, for ``max_age``.
+        """
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return 0
+        evicted = 0
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= self.sizeof(old[0])
+            self._items[key] = (value, time.time() if created is None else created)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (dropped, _) = self._items.popitem(last=False)
+                self.bytes -= self.sizeof(dropped)
+                evicted += 1
+        return evicted
+
+    def discard(self, match):
+        """Drop the entries whose key satisfies ``match``; returns how many"""
+        with self._lock:
+            keys = [key for key in self._items if match(key)]
+            for key in keys:
+                value, _ = self._items.pop(key)
+                self.bytes -= self.sizeof(value)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
@@ -0,0 +1,185 @@
+"""mapcache.xml model: grids, tilesets and tile/metatile arithmetic.
+
+Tile coordinates follow MapCache's internal (TMS) convention: ``y`` counts
+rows up from the bottom of the grid extent. WMTS addresses rows from the
+top; ``Grid.wmts_row`` converts.
+"""
+
+import math
+import os
+import xml.etree.ElementTree as ET
+
+DEFAULT_MAPCACHE_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mapcache.xml"
+)
+
+EARTH_RADIUS = 6378137.0
+MAX_MERCATOR_LAT = 85.0511287798
+
+_config_cache = {}
+
+
+def mapcache_file():
+    """Path of mapcache.xml, overridable with PERFLAB_MAPCACHE"""
+    return os.environ.get("PERFLAB_MAPCACHE", DEFAULT_MAPCACHE_FILE)
+
+
+def load_config(path=None):
+    """Parse mapcache.xml (cached per path)"""
+    path = path or mapcache_file()
+    if path not in _config_cache:
+        _config_cache[path] = MapcacheConfig(ET.parse(path).getroot())
+    return _config_cache[path]
+
+
+def lonlat_to_mercator(lon, lat):
+    lat = max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, lat))
+    x = EARTH_RADIUS * math.radians(lon)
+    y = EARTH_RADIUS * math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+    return x, y
+
+
+def mercator_to_lonlat(x, y):
+    lon = math.degrees(x / EARTH_RADIUS)
+    lat = math.degrees(2 * math.atan(math.exp(y / EARTH_RADIUS)) - math.pi / 2)
+    return lon, lat
+
+
+class Grid:
+    """A MapCache grid: extent, tile size and resolution ladder"""
+
+    def __init__(self, name, srs, extent, size, resolutions):
+        self.name = name
+        self.srs = srs
+        self.extent = extent
+        self.tile_width, self.tile_height = size
+        self.resolutions = resolutions
+
+    @classmethod
+    def from_xml(cls, node):
+        return cls(
+            node.get("name"),
+            node.findtext("srs").strip(),
+            tuple(float(v) for v in node.findtext("extent").split()),
+            tuple(int(v) for v in node.findtext("size").split()),
+            [float(v) for v in node.findtext("resolutions").split()],
+        )
+
+    @property
+    def max_zoom(self):
+        return len(self.resolutions) - 1
+
+    def tile_span(self, z):
+        """Ground size (x, y) of one tile at zoom ``z``"""
+        res = self.resolutions[z]
+        return self.tile_width * res, self.tile_height * res
+
+    def tile_count(self, z):
+        """Number of tile columns and rows at zoom ``z``"""
+        span_x, span_y = self.tile_span(z)
+        minx, miny, maxx, maxy = self.extent
+        # Tolerate rounding in the published resolutions
+        nx = math.ceil((maxx - minx) / span_x - 1e-6)
+        ny = math.ceil((maxy - miny) / span_y - 1e-6)
+        return nx, ny
+
+    def tile_bbox(self, z, x, y):
+        span_x, span_y = self.tile_span(z)
+        minx = self.extent[0] + x * span_x
+        miny = self.extent[1] + y * span_y
+        return minx, miny, minx + span_x, miny + span_y
+
+    def tile_range(self, z, bbox):
+        """Inclusive ``(x0, y0, x1, y1)`` tile range covering ``bbox``"""
+        span_x, span_y = self.tile_span(z)
+        nx, ny = self.tile_count(z)
+        minx, miny, maxx, maxy = bbox
+        x0 = int((minx - self.extent[0]) // span_x)
+        y0 = int((miny - self.extent[1]) // span_y)
+        x1 = int(math.ceil((maxx - self.extent[0]) / span_x)) - 1
+        y1 = int(math.ceil((maxy - self.extent[1]) / span_y)) - 1
+        return (
+            max(0, min(nx - 1, x0)),
+            max(0, min(ny - 1, y0)),
+            max(0, min(nx - 1, x1)),
+            max(0, min(ny - 1, y1)),
+        )
+
+    def wmts_row(self, z, y):
+        return self.tile_count(z)[1] - 1 - y
+
+    def project(self, lon, lat):
+        """Geographic coordinates to grid coordinates"""
+        if self.srs.upper() in ("EPSG:3857", "EPSG:900913"):
+            return lonlat_to_mercator(lon, lat)
+        return lon, lat
+
+    def unproject(self, x, y):
+        if self.srs.upper() in ("EPSG:3857", "EPSG:900913"):
+            return mercator_to_lonlat(x, y)
+        return x, y
+
+    def lonlat_bbox_to_grid(self, bbox):
+        minx, miny = self.project(bbox[0], bbox[1])
+        maxx, maxy = self.project(bbox[2], bbox[3])
+        return minx, miny, maxx, maxy
+
+    def metatile(self, x, y, metatile_size):
+        """Metatile coordinates containing tile ``(x, y)``"""
+        mx, my = metatile_size
+        return x // mx, y // my
+
+    def metatile_tile_count(self, z, mx, my, metatile_size):
+        """Tiles inside metatile ``(mx, my)``, clipped to the grid"""
+        nx, ny = self.tile_count(z)
+        sx, sy = metatile_size
+        return max(0, min(sx, nx - mx * sx)) * max(0, min(sy, ny - my * sy))
+
+
+class Tileset:
+    def __init__(self, node):
+        self.name = node.get("name")
+        self.source = node.findtext("source")
+        self.grids = [g.text.strip() for g in node.findall("grid")]
+        self.format = node.findtext("format") or "PNG"
+        self.cache = node.findtext("cache")
+        self.expires = int(node.findtext("expires") or 0)
+        metatile = node.findtext("metatile") or "1 1"
+        self.metatile = tuple(int(v) for v in metatile.split())
+        self.metabuffer = int(node.findtext("metabuffer") or 0)
+
+
+class Source:
+    def __init__(self, node):
+        self.name = node.get("name")
+        self.type = node.get("type")
+        self.url = (node.findtext("http/url") or "").strip()
+        params = node.find("getmap/params")
+        self.params = {} if params is None else {p.tag: p.text for p in params}
+
+
+class MapcacheConfig:
+    def __init__(self, root):
+        self.grids = {n.get("name"): Grid.from_xml(n) for n in root.findall("grid")}
+        self.tilesets = {n.get("name"): Tileset(n) for n in root.findall("tileset")}
+        self.sources = {n.get("name"): Source(n) for n in root.findall("source")}
+        self.caches = {
+            n.get("name"): {
+                "type": n.get("type"),
+                "base": (n.findtext("base") or "").strip(),
+            }
+            for n in root.findall("cache")
+        }
+        self.services = {
+            n.get("type") for n in root.findall("service") if n.get("enabled") == "true"
+        }
+
+
+def wmts_path(tileset, grid, z, x, y, extension="png"):
+    """RESTful WMTS tile path below /mapcache/"""
+    return f"/wmts/1.0.0/{tileset}/default/{grid.name}/{z}/{grid.wmts_row(z, y)}/{x}.{extension}"
+
+
+def tms_path(tileset, grid, z, x, y, extension="png"):
+    """TMS tile path below /mapcache/"""
+    return f"/tms/1.0.0/{tileset}@{grid.name}/{z}/{x}/{y}.{extension}"
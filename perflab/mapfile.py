@@ -0,0 +1,220 @@
+"""Small MapServer mapfile parser.
+
+Parses the subset of the mapfile syntax used by gfs.map, mrms.map and
+goes.map: one directive per line, nested blocks closed by ``END``, list
+blocks (METADATA, PROJECTION, ...) and single-line blocks such as
+``POINTS 1 1 END``. Parenthesized expressions and quoted strings are kept
+as single tokens; quotes are stripped.
+
+Every directive remembers its line number so tools can rewrite a mapfile
+in place without reformatting it.
+"""
+
+import collections
+
+# Blocks whose lines are directives
+BLOCKS = {
+    "MAP",
+    "WEB",
+    "LAYER",
+    "CLASS",
+    "STYLE",
+    "LABEL",
+    "SYMBOL",
+    "OUTPUTFORMAT",
+    "LEGEND",
+    "SCALEBAR",
+    "QUERYMAP",
+    "REFERENCE",
+    "SCALETOKEN",
+    "LEADER",
+    "GRID",
+    "FEATURE",
+    "COMPOSITE",
+    "CLUSTER",
+    "JOIN",
+}
+
+# Blocks whose lines are plain value lists
+LIST_BLOCKS = {"METADATA", "VALIDATION", "VALUES", "PROJECTION", "POINTS", "PATTERN"}
+
+Directive = collections.namedtuple("Directive", "key values line")
+
+
+class MapfileError(ValueError):
+    pass
+
+
+class Block:
+    def __init__(self, kind, line=0, values=()):
+        self.kind = kind
+        self.line = line
+        self.end_line = None
+        self.values = list(values)
+        self.directives = []
+        self.children = []
+        self.items = []
+
+    def __repr__(self):
+        name = self.get("NAME")
+        return f"<{self.kind}{' ' + name if name else ''} line {self.line}>"
+
+    def get(self, key, default=None):
+        """First value of the first ``key`` directive"""
+        for directive in self.directives:
+            if directive.key == key:
+                return directive.values[0] if directive.values else default
+        return default
+
+    def get_values(self, key):
+        """All values of the first ``key`` directive, or None"""
+        for directive in self.directives:
+            if directive.key == key:
+                return directive.values
+        return None
+
+    def get_floats(self, key):
+        values = self.get_values(key)
+        return None if values is None else [float(v) for v in values]
+
+    def get_all(self, key):
+        return [d for d in self.directives if d.key == key]
+
+    def blocks(self, kind):
+        return [child for child in self.children if child.kind == kind]
+
+    def block(self, kind):
+        for child in self.children:
+            if child.kind == kind:
+                return child
+        return None
+
+    def metadata(self):
+        block = self.block("METADATA")
+        if block is None:
+            return {}
+        return {item[0]: item[1] for item in block.items if len(item) >= 2}
+
+    def processing(self):
+        """PROCESSING directives as a dict, e.g. ``{"BANDS": "580"}``"""
+        result = {}
+        for directive in self.get_all("PROCESSING"):
+            key, _, value = directive.values[0].partition("=")
+            result[key.upper()] = value
+        return result
+
+    def walk(self, kind):
+        """All descendant blocks of ``kind``, depth first"""
+        for child in self.children:
+            if child.kind == kind:
+                yield child
+            yield from child.walk(kind)
+
+
+def tokenize(line):
+    """Split one mapfile line into tokens, dropping a trailing comment"""
+    tokens = []
+    i = 0
+    n = len(line)
+    while i < n:
+        c = line[i]
+        if c.isspace():
+            i += 1
+        elif c == "#":
+            break
+        elif c in "\"'":
+            j = i + 1
+            while j < n and line[j] != c:
+                j += 2 if line[j] == "\\" else 1
+            tokens.append(line[i + 1 : j])
+            i = j + 1
+        elif c == "(":
+            depth = 0
+            j = i
+            while j < n:
+                if line[j] == "(":
+                    depth += 1
+                elif line[j] == ")":
+                    depth -= 1
+                    if depth == 0:
+                        break
+                j += 1
+            tokens.append(line[i : j + 1])
+            i = j + 1
+        else:
+            j = i
+            while j < n and not line[j].isspace():
+                j += 1
+            tokens.append(line[i:j])
+            i = j
+    return tokens
+
+
+def parse(text):
+    """Parse mapfile text and return the top-level MAP block"""
+    root = Block("ROOT")
+    stack = [root]
+    for lineno, line in enumerate(text.splitlines(), 1):
+        tokens = tokenize(line)
+        if not tokens:
+            continue
+        current = stack[-1]
+        keyword = tokens[0].upper()
+        if keyword == "END" and len(tokens) == 1:
+            if len(stack) == 1:
+                raise MapfileError(f"line {lineno}: END without block")
+            current.end_line = lineno
+            stack.pop()
+        elif current.kind in LIST_BLOCKS:
+            current.items.append(tokens)
+        elif keyword in BLOCKS or keyword in LIST_BLOCKS:
+            inline = len(tokens) > 1 and tokens[-1].upper() == "END"
+            if len(tokens) > 1 and not inline:
+                # A block keyword with arguments is a directive, e.g. SYMBOL "circle"
+                current.directives.append(Directive(keyword, tokens[1:], lineno))
+                continue
+            block = Block(keyword, lineno, tokens[1:-1] if inline else ())
+            current.children.append(block)
+            if inline:
+                block.end_line = lineno
+            else:
+                stack.append(block)
+        else:
+            current.directives.append(Directive(keyword, tokens[1:], lineno))
+    if len(stack) != 1:
+        raise MapfileError(
+            f"unterminated {stack[-1].kind} block at line {stack[-1].line}"
+        )
+    maps = root.blocks("MAP")
+    if not maps:
+        raise MapfileError("no MAP block")
+    return maps[0]
+
+
+def load(path):
+    with open(path) as f:
+        return parse(f.read())
+
+
+def layers(map_block):
+    return map_block.blocks("LAYER")
+
+
+def data_files(layer):
+    """Files a layer's DATA can resolve to, with SCALETOKEN values substituted"""
+    data = layer.get("DATA")
+    if not data:
+        return []
+    paths = [data]
+    for token in layer.blocks("SCALETOKEN"):
+        name = token.get("NAME")
+        values = token.block("VALUES")
+        if not name or values is None:
+            continue
+        paths = [
+            path.replace(name, item[1])
+            for path in paths
+            for item in values.items
+            if len(item) >= 2
+        ]
+    return paths
@@ -0,0 +1,121 @@
+"""Prometheus metrics for the perflab services.
+
+prometheus_client is optional: without it every metric is a no-op, so the
+tools still run (just without a /metrics endpoint) outside the tools image.
+"""
+
+import logging
+
+from perflab import catalog
+
+try:
+    import prometheus_client
+except ImportError:  # pragma: no cover - depends on the environment
+    prometheus_client = None
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+BYTES_BUCKETS = [1024, 4096, 16384, 65536, 262144, 1048576, 4194304]
+# Render style by LAYERS suffix, like nginx's $render_style
+STYLE_SUFFIXES = {"_contour": "contour", "_numbers": "numbers"}
+# Layer label of a LAYERS list, and of a MAP or layer the catalog does not know
+MULTI_LABEL = "multi"
+OTHER_LABEL = "other"
+
+# (maps, {(map, layer or group): style}) the labels are bounded to
+_label_catalog = None
+
+
+class _NullMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+def start_http_server(port):
+    """Serve /metrics on ``port`` (0 disables)"""
+    if not port:
+        return
+    if prometheus_client is None:
+        log.warning("prometheus_client is not installed, metrics disabled")
+        return
+    prometheus_client.start_http_server(port)
+    log.info("Serving Prometheus metrics on :%d/metrics", port)
+
+
+def counter(name, documentation, labelnames=()):
+    if prometheus_client is None:
+        return _NullMetric()
+    return prometheus_client.Counter(name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=()):
+    if prometheus_client is None:
+        return _NullMetric()
+    return prometheus_client.Gauge(name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=None):
+    if prometheus_client is None:
+        return _NullMetric()
+    kwargs = {"buckets": buckets} if buckets else {}
+    return prometheus_client.Histogram(name, documentation, labelnames, **kwargs)
+
+
+def label_catalog(map_paths=None):
+    """Bound the map and layer labels to the catalog of ``map_paths``"""
+    global _label_catalog
+    layers = catalog.load(map_paths)
+    styles = {}
+    for layer in layers:
+        if layer.group:
+            styles.setdefault((layer.map, layer.group), suffix_style(layer.group))
+        styles[layer.map, layer.name] = layer.style
+    _label_catalog = (set(layers.maps()), styles)
+    return _label_catalog
+
+
+def suffix_style(layers):
+    style = "gradient"
+    for suffix, name in STYLE_SUFFIXES.items():
+        if layers.endswith(suffix):
+            style = name
+    return style
+
+
+def wms_labels(params):
+    """``(map, layer, style)`` labels of a request with upper-cased WMS keys
+
+    The labels only take catalog values: an unknown MAP or layer is
+    ``other`` and a list of layers is ``multi``, so clients cannot add series.
+    """
+    maps, styles = _label_catalog or label_catalog()
+    map_name = params.get("MAP", "").upper()
+    layers = params.get("LAYERS", "")
+    style = suffix_style(layers)
+    if map_name and map_name not in maps:
+        return OTHER_LABEL, OTHER_LABEL if layers else "", style
+    if "," in layers:
+        return map_name, MULTI_LABEL, style
+    if (map_name, layers) in styles:
+        return map_name, layers, styles[map_name, layers]
+    return map_name, OTHER_LABEL if layers else "", style
+
+
+def cache_outcome(hits, tiles):
+    """``hit``, ``partial`` or ``miss`` for a request assembled from tiles"""
+    if tiles and hits == tiles:
+        return "hit"
+    return "partial" if hits else "miss"
@@ -0,0 +1,766 @@
+"""Native NumPy renderer for the gradient (COLORRANGE/DATARANGE) raster layers.
+
+Layers such as ``t2m``, ``mslp``, ``refl`` or GOES ``ir_color`` are
+piecewise-linear color ramps: CLASS blocks with ``[pixel]`` comparisons and
+one COLORRANGE/DATARANGE (or COLOR) style each. ``compile_layer`` turns
+them into a ``Ramp`` that classifies whole NumPy arrays at once, and
+``NativeRenderer`` answers GetMap for those layers without MapServer: GDAL
+warps the band onto the requested grid (the layer's RESAMPLE kernel), the
+ramp is applied through a lookup table and Pillow encodes the image.
+
+The lookup table follows MapServer's own classification of non-8-bit
+rasters (``msDrawRasterLayerGDAL_16BitClassification``): SCALE_BUCKETS
+buckets (65536 by default) spanning the window's min/max (or PROCESSING
+SCALE), each classified at its center with the value formatted the way
+MapServer substitutes ``[pixel]``. 8-bit bands use a 256-entry table over
+the raw values. Tables are kept in an LRU cache keyed by the layer's CLASS
+signature and scale window, so fixed-SCALE and 8-bit layers build theirs
+once. OFFSITE values are masked transparent before classification.
+Anything the compiler does not understand raises ``Unsupported`` and is
+left to MapServer.
+
+EPSG:3857 requests read the layer's Web-Mercator copy (METADATA
+``perflab_3857_data``, perflab.ingest.webmerc) when there is one. Other
+reprojections go through warp maps: the source pixel coordinates of every
+output pixel, computed once per (source grid, CRS, bbox, size) and kept in
+an LRU cache (``warp_map_mb``). Nearest and bilinear layers are then
+sampled with NumPy; AVERAGE layers and same-CRS requests use gdal.Warp.
+
+Compare against MapServer::
+
+    python -m perflab.native --upstream http://nginx/cgi-bin/mapserv-direct \\
+        --map GFS --layers t2m mslp --bbox -125,25,-65,50
+"""
+
+import argparse
+import collections
+import glob
+import io
+import logging
+import os
+import re
+import threading
+import time
+from urllib.parse import urlencode
+
+import numpy as np
+from PIL import Image
+
+from perflab import encoding, mapfile, metrics, trace
+from perflab.lru import LRUCache
+from perflab.upstream import Upstream
+
+log = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUCKETS = 65536
+RESAMPLING = {"NEAREST": "near", "BILINEAR": "bilinear", "AVERAGE": "average"}
+# PROCESSING keys that do not change how the layer is drawn here
+HANDLED_PROCESSING = {"BANDS", "RESAMPLE", "SCALE", "SCALE_BUCKETS"}
+# Layer METADATA naming a copy of DATA reprojected to a CRS (perflab.ingest.webmerc)
+ALTERNATE_DATA = {"EPSG:3857": "perflab_3857_data"}
+# Warp maps: source pixel coordinates sampled every WARP_MAP_STEP output pixels
+WARP_MAP_STEP = 16
+DEFAULT_WARP_MAP_MB = 256
+LOOKUP_TABLE_MB = 64
+
+RENDER_SECONDS = metrics.histogram(
+    "perflab_native_render_seconds",
+    "Time to render a GetMap natively, by map",
+    ["map"],
+    buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5],
+)
+WARP_MAPS = metrics.counter(
+    "perflab_native_warp_maps_total",
+    "Warp map lookups, by outcome (hit, computed, gdal = left to gdal.Warp)",
+    ["outcome"],
+)
+
+
+class Unsupported(Exception):
+    """The layer or request needs MapServer"""
+
+
+_EXPR_TOKEN = re.compile(
+    r"\s*(\[pixel\]|-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|<=|>=|==|!=|=|<|>|\(|\)"
+    r"|&&|\|\||!|[A-Za-z]+)",
+    re.IGNORECASE,
+)
+_COMPARISONS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "=": np.equal,
+    "==": np.equal,
+    "EQ": np.equal,
+    "!=": np.not_equal,
+    "NE": np.not_equal,
+    "LT": np.less,
+    "LE": np.less_equal,
+    "GT": np.greater,
+    "GE": np.greater_equal,
+}
+
+
+def _tokens(text):
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = _EXPR_TOKEN.match(text, pos)
+        if not match:
+            raise Unsupported(f"cannot parse expression {text!r}")
+        tokens.append(match.group(1))
+        pos = match.end()
+    return tokens
+
+
+def compile_expression(text):
+    """``([pixel] >= 5 AND [pixel] < 15)`` -> function of an array returning a mask"""
+    tokens = _tokens(text)
+    pos = 0
+
+    def peek():
+        return tokens[pos].upper() if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def operand():
+        token = take()
+        if token.lower() == "[pixel]":
+            return lambda v: v
+        try:
+            number = float(token)
+        except ValueError:
+            raise Unsupported(f"unsupported operand {token!r} in {text!r}")
+        return lambda v: number
+
+    def comparison():
+        if peek() in ("NOT", "!"):
+            take()
+            inner = comparison()
+            return lambda v: ~inner(v)
+        if peek() == "(":
+            take()
+            inner = disjunction()
+            if take() != ")":
+                raise Unsupported(f"unbalanced {text!r}")
+            return inner
+        left = operand()
+        op = _COMPARISONS.get(take().upper() if pos < len(tokens) else None)
+        if op is None:
+            raise Unsupported(f"unsupported comparison in {text!r}")
+        right = operand()
+        return lambda v: op(left(v), right(v))
+
+    def conjunction():
+        terms = [comparison()]
+        while peek() in ("AND", "&&"):
+            take()
+            terms.append(comparison())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda v: np.logical_and.reduce([term(v) for term in terms])
+
+    def disjunction():
+        terms = [conjunction()]
+        while peek() in ("OR", "||"):
+            take()
+            terms.append(conjunction())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda v: np.logical_or.reduce([term(v) for term in terms])
+
+    if not tokens:
+        raise Unsupported("empty expression")
+    result = disjunction()
+    if pos != len(tokens):
+        raise Unsupported(f"trailing tokens in {text!r}")
+    return result
+
+
+def _color(values):
+    """3 or 4 mapfile color components -> RGBA floats"""
+    try:
+        rgba = [float(v) for v in values]
+    except ValueError:
+        raise Unsupported(f"unsupported color {values}")
+    if len(rgba) not in (3, 4):
+        raise Unsupported(f"bad color {values}")
+    return rgba if len(rgba) == 4 else rgba + [255.0]
+
+
+def _pixel_token(values):
+    """Values as MapServer writes ``[pixel]`` into expressions (printf %g)"""
+    values = np.asarray(values, dtype=np.float64)
+    result = values.copy()
+    nonzero = np.isfinite(values) & (values != 0)
+    # %g keeps 6 significant digits
+    exponent = np.floor(np.log10(np.abs(values[nonzero])))
+    scale = 10.0 ** (5 - exponent)
+    result[nonzero] = np.round(values[nonzero] * scale) / scale
+    return result
+
+
+class Ramp:
+    """Compiled CLASS blocks of one raster layer"""
+
+    def __init__(self, classes, signature=None):
+        # [(mask function or None, min RGBA, max RGBA, min value, max value)]
+        self.classes = classes
+        # Hashable CLASS definitions (expressions instead of mask functions)
+        self.signature = signature
+
+    def colors(self, values):
+        """RGBA uint8 array for ``values``; unclassified values get alpha 0"""
+        values = np.asarray(values, dtype=np.float64)
+        tokens = _pixel_token(values.astype(np.float32))
+        out = np.zeros(values.shape + (4,), dtype=np.uint8)
+        todo = np.isfinite(values)
+        for test, low, high, vmin, vmax in self.classes:
+            hit = todo if test is None else todo & test(tokens)
+            if not hit.any():
+                continue
+            low = np.asarray(low)
+            if vmin is None:
+                out[hit] = low.astype(np.uint8)
+            else:
+                # msValueToRange: linear in value, clamped to 0-255, truncated
+                scaled = (values[hit] - vmin) / (vmax - vmin)
+                rgba = low + (np.asarray(high) - low) * scaled[:, None]
+                out[hit] = np.clip(rgba, 0, 255).astype(np.uint8)
+            todo &= ~hit
+        return out
+
+    def lookup_table(self, low, high, buckets):
+        """Bucket colors over ``[low, high]`` and the value-to-index ratio"""
+        if high <= low:
+            high = low + 1.0
+        ratio = buckets / (high - low)
+        centers = (np.arange(buckets) + 0.5) / ratio + low
+        return self.colors(centers), ratio
+
+
+def compile_classes(layer):
+    classes = []
+    signature = []
+    for cls in layer.blocks("CLASS"):
+        if (cls.get("STATUS") or "ON").upper() == "OFF":
+            continue
+        styles = cls.blocks("STYLE")
+        if len(styles) != 1 or cls.blocks("LABEL"):
+            raise Unsupported(f"{layer.get('NAME')}: class needs one plain STYLE")
+        style = styles[0]
+        expression = cls.get("EXPRESSION")
+        test = compile_expression(expression) if expression else None
+        colorrange = style.get_values("COLORRANGE")
+        if colorrange:
+            half = len(colorrange) // 2
+            datarange = style.get_floats("DATARANGE")
+            if not datarange or len(datarange) != 2 or datarange[0] == datarange[1]:
+                raise Unsupported(f"{layer.get('NAME')}: COLORRANGE without DATARANGE")
+            classes.append(
+                (
+                    test,
+                    _color(colorrange[:half]),
+                    _color(colorrange[half:]),
+                    datarange[0],
+                    datarange[1],
+                )
+            )
+        elif style.get_values("COLOR"):
+            color = _color(style.get_values("COLOR"))
+            classes.append((test, color, color, None, None))
+        else:
+            raise Unsupported(f"{layer.get('NAME')}: style has no color")
+        _, low, high, vmin, vmax = classes[-1]
+        signature.append((expression, tuple(low), tuple(high), vmin, vmax))
+    if not classes:
+        raise Unsupported(f"{layer.get('NAME')}: unclassified raster")
+    return Ramp(classes, tuple(signature))
+
+
+def _upsample(coarse, cols, rows, width, height):
+    """Bilinear interpolation of ``coarse`` (sampled at ``rows`` x ``cols``) to
+    every pixel of a ``width`` x ``height`` grid"""
+    fx = np.interp(np.arange(width), cols, np.arange(len(cols)))
+    fy = np.interp(np.arange(height), rows, np.arange(len(rows)))
+    x0 = np.minimum(fx.astype(np.intp), len(cols) - 2)
+    y0 = np.minimum(fy.astype(np.intp), len(rows) - 2)
+    tx = (fx - x0)[None, :]
+    ty = (fy - y0)[:, None]
+    top = coarse[y0][:, x0] * (1 - tx) + coarse[y0][:, x0 + 1] * tx
+    bottom = coarse[y0 + 1][:, x0] * (1 - tx) + coarse[y0 + 1][:, x0 + 1] * tx
+    return top * (1 - ty) + bottom * ty
+
+
+# Source pixel coordinates (pixel-edge convention, in the pixels of overview
+# ``level``, 0 = full resolution) of every output pixel; ``window`` is the
+# (xoff, yoff, xsize, ysize) block of that level they fall in, ``wrap`` the
+# level's width when the source wraps around the globe
+WarpMap = collections.namedtuple("WarpMap", "level x y window wrap")
+
+
+def _warp_map_size(warp_map):
+    return warp_map.x.nbytes + warp_map.y.nbytes if warp_map else 64
+
+
+class NativeLayer:
+    def __init__(
+        self, name, path, band, ramp, resample, scale, buckets, alternates, offsite
+    ):
+        self.name = name
+        self.path = path
+        self.band = band
+        # CRS -> single-band copy of the data already in that CRS
+        self.alternates = alternates
+        self.ramp = ramp
+        self.resample = resample
+        self.scale = scale
+        self.buckets = buckets
+        # Band value drawn transparent (OFFSITE), or None
+        self.offsite = offsite
+
+
+def compile_layer(layer, buckets=DEFAULT_BUCKETS):
+    """NativeLayer for a gradient raster layer block, or raise Unsupported"""
+    name = layer.get("NAME")
+    if (layer.get("TYPE") or "").upper() != "RASTER":
+        raise Unsupported(f"{name}: not a raster layer")
+    if layer.get("CONNECTIONTYPE") or layer.blocks("SCALETOKEN"):
+        raise Unsupported(f"{name}: connection or scale tokens")
+    for key in ("MINSCALEDENOM", "MAXSCALEDENOM", "OPACITY", "COMPOSITE", "MASK"):
+        if layer.get(key) is not None or layer.blocks(key):
+            raise Unsupported(f"{name}: {key}")
+    data = layer.get("DATA")
+    if not data or not os.path.isabs(data):
+        raise Unsupported(f"{name}: DATA must be an absolute path")
+    processing = layer.processing()
+    extra = set(processing) - HANDLED_PROCESSING
+    if extra:
+        raise Unsupported(f"{name}: PROCESSING {sorted(extra)}")
+    bands = processing.get("BANDS", "1")
+    if not bands.isdigit():
+        raise Unsupported(f"{name}: BANDS={bands}")
+    resample = RESAMPLING.get(processing.get("RESAMPLE", "NEAREST").upper())
+    if resample is None:
+        raise Unsupported(f"{name}: RESAMPLE={processing['RESAMPLE']}")
+    scale = None
+    if processing.get("SCALE", "AUTO").upper() != "AUTO":
+        try:
+            scale = tuple(float(v) for v in processing["SCALE"].split(","))
+        except ValueError:
+            raise Unsupported(f"{name}: SCALE={processing['SCALE']}")
+    offsite = None
+    values = layer.get_values("OFFSITE")
+    if values:
+        try:
+            offsite = float(values[0])
+        except ValueError:
+            raise Unsupported(f"{name}: OFFSITE {' '.join(values)}")
+        if offsite < 0:
+            # -1 -1 -1 is MapServer's "not set"
+            offsite = None
+    metadata = layer.metadata()
+    alternates = {
+        crs: metadata[key] for crs, key in ALTERNATE_DATA.items() if metadata.get(key)
+    }
+    return NativeLayer(
+        name,
+        data,
+        int(bands),
+        compile_classes(layer),
+        resample,
+        scale,
+        int(processing.get("SCALE_BUCKETS", buckets)),
+        alternates,
+        offsite,
+    )
+
+
+class NativeRenderer:
+    """GetMap for the compiled layers of the given mapfiles"""
+
+    def __init__(
+        self,
+        map_paths,
+        buckets=DEFAULT_BUCKETS,
+        band_cache=None,
+        warp_map_mb=DEFAULT_WARP_MAP_MB,
+    ):
+        from osgeo import gdal, osr
+
+        gdal.UseExceptions()
+        self.gdal = gdal
+        self.osr = osr
+        # perflab.bandcache.BandCache: read decoded bands instead of the sources
+        self.band_cache = band_cache
+        # (source grid, CRS, bbox, size) -> WarpMap, or False where GDAL warps
+        self.warp_maps = LRUCache(warp_map_mb * 1024 * 1024, _warp_map_size)
+        # (CLASS signature, scale window, buckets) -> (lookup table, ratio)
+        self.tables = LRUCache(
+            LOOKUP_TABLE_MB * 1024 * 1024, lambda entry: entry[0].nbytes
+        )
+        self.maps = {}
+        self.backgrounds = {}
+        for path in map_paths:
+            map_block = mapfile.load(path)
+            map_name = (map_block.get("NAME") or "").upper()
+            compiled = {}
+            for layer in mapfile.layers(map_block):
+                try:
+                    compiled[layer.get("NAME")] = compile_layer(layer, buckets)
+                except Unsupported as e:
+                    log.debug("%s: %s", map_name, e)
+            self.maps[map_name] = compiled
+            self.backgrounds[map_name] = tuple(
+                int(v) for v in map_block.get_values("IMAGECOLOR") or (255, 255, 255)
+            )
+            log.info(
+                "Native renderer: %s layers %s", map_name, ", ".join(sorted(compiled))
+            )
+        self._local = threading.local()
+
+    def layers(self, map_name, names):
+        compiled = self.maps.get(map_name.upper(), {})
+        try:
+            return [compiled[name] for name in names]
+        except KeyError as e:
+            raise Unsupported(f"layer {e} is not native")
+
+    def _dataset(self, path, key=None):
+        """Per-thread handle (GDAL datasets are not thread-safe), reopened on change.
+
+        ``key`` names the slot, so a new band cache version replaces the old
+        handle instead of adding one.
+        """
+        handles = self._local.__dict__.setdefault("handles", {})
+        st = os.stat(path)
+        signature = (path, st.st_mtime_ns, st.st_size)
+        cached = handles.get(key or path)
+        if cached is None or cached[0] != signature:
+            cached = handles[key or path] = (signature, self.gdal.Open(path))
+        return cached[1]
+
+    def read(self, layer, crs, bbox, size):
+        """The layer's band warped onto the request grid; NaN where no data"""
+        with trace.stage("open"):
+            path, band_number = layer.path, layer.band
+            alternate = layer.alternates.get(crs)
+            if alternate and os.path.exists(alternate):
+                # Already in the request CRS: the warp only resamples
+                path, band_number = alternate, 1
+            slot = (layer.path, path == alternate)
+            if self.band_cache:
+                path, band_number = self.band_cache.path(path, band_number), 1
+            source = self._dataset(path, slot)
+            band = source.GetRasterBand(band_number)
+            nodata = band.GetNoDataValue()
+        byte_data = band.DataType == self.gdal.GDT_Byte
+        with trace.stage("warp"):
+            warp_map = None
+            if layer.resample in ("near", "bilinear") and source.RasterCount == 1:
+                warp_map = self.warp_map(source, crs, bbox, size)
+            if warp_map is not None:
+                return self.sample(band, nodata, warp_map, layer.resample), byte_data
+            # Band read and reprojection/resampling happen in one GDAL call
+            warped = self.gdal.Warp(
+                "",
+                source,
+                format="MEM",
+                dstSRS=crs,
+                outputBounds=bbox,
+                width=size[0],
+                height=size[1],
+                srcBands=[band_number],
+                resampleAlg=layer.resample,
+                srcNodata=nodata,
+                dstNodata=float("nan"),
+                outputType=self.gdal.GDT_Float64,
+            )
+            values = warped.GetRasterBand(1).ReadAsArray()
+        return values, byte_data
+
+    def warp_map(self, source, crs, bbox, size):
+        """Cached WarpMap from ``source`` to the request grid, or None for gdal.Warp
+
+        Reprojecting every output pixel dominates a warp to another CRS, and
+        the result only depends on the grids, not on the data. It is kept
+        per (source grid, CRS, bbox, size), so new data versions and other
+        layers on the same grid reuse it.
+        """
+        band = source.GetRasterBand(1)
+        overviews = tuple(
+            (band.GetOverview(i).XSize, band.GetOverview(i).YSize)
+            for i in range(band.GetOverviewCount())
+        )
+        grid = (
+            source.GetProjection(),
+            source.GetGeoTransform(),
+            source.RasterXSize,
+            source.RasterYSize,
+            overviews,
+        )
+        key = (grid, crs, tuple(bbox), tuple(size))
+        warp_map = self.warp_maps.get(key)
+        if warp_map is not None:
+            WARP_MAPS.labels("hit").inc()
+            return warp_map or None
+        warp_map = self._compute_warp_map(grid, crs, bbox, size) or False
+        WARP_MAPS.labels("computed" if warp_map else "gdal").inc()
+        self.warp_maps.put(key, warp_map)
+        return warp_map or None
+
+    def _compute_warp_map(self, grid, crs, bbox, size):
+        osr = self.osr
+        wkt, gt, full_width, full_height, overviews = grid
+        if gt[2] or gt[4]:
+            return None
+        source_srs = osr.SpatialReference()
+        source_srs.ImportFromWkt(wkt)
+        target_srs = osr.SpatialReference()
+        target_srs.SetFromUserInput(crs)
+        for srs in (source_srs, target_srs):
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        if source_srs.IsSame(target_srs):
+            # Same CRS: gdal.Warp only resamples, nothing to cache
+            return None
+
+        # Transform a coarse lattice of pixel centers and interpolate the
+        # rest, like GDAL's approximate transformer
+        width, height = size
+        cols = np.unique(np.r_[np.arange(0, width, WARP_MAP_STEP), max(width - 1, 1)])
+        rows = np.unique(np.r_[np.arange(0, height, WARP_MAP_STEP), max(height - 1, 1)])
+        minx, miny, maxx, maxy = bbox
+        px = minx + (cols + 0.5) * (maxx - minx) / width
+        py = maxy - (rows + 0.5) * (maxy - miny) / height
+        gx, gy = np.meshgrid(px, py)
+        transform = osr.CoordinateTransformation(target_srs, source_srs)
+        try:
+            points = np.array(
+                transform.TransformPoints(
+                    np.column_stack([gx.ravel(), gy.ravel()]).tolist()
+                )
+            )
+        except RuntimeError:
+            return None
+        sx = points[:, 0].reshape(gx.shape)
+        sy = points[:, 1].reshape(gx.shape)
+        if not (np.isfinite(sx).all() and np.isfinite(sy).all()):
+            return None
+        wrap = None
+        if source_srs.IsGeographic():
+            # Keep longitudes continuous across the antimeridian
+            sx = np.unwrap(sx, period=360, axis=1)
+            if abs(abs(gt[1] * full_width) - 360) < abs(gt[1]):
+                wrap = full_width
+        x = (_upsample(sx, cols, rows, width, height) - gt[0]) / gt[1]
+        y = (_upsample(sy, cols, rows, width, height) - gt[3]) / gt[5]
+
+        # Overview like GDAL: the coarsest one still finer than the output
+        ratio = min((x.max() - x.min()) / width, (y.max() - y.min()) / height)
+        level, level_size = 0, (full_width, full_height)
+        for i, (ov_width, ov_height) in enumerate(overviews, 1):
+            if full_width / ov_width <= ratio and ov_width < level_size[0]:
+                level, level_size = i, (ov_width, ov_height)
+        x *= level_size[0] / full_width
+        y *= level_size[1] / full_height
+        if wrap:
+            wrap = level_size[0]
+            x %= wrap
+
+        inside = (x >= 0) & (x < level_size[0]) & (y >= 0) & (y < level_size[1])
+        if not inside.any():
+            window = None
+        else:
+            # One pixel of margin for the bilinear kernel
+            y0 = max(int(np.floor(y[inside].min())) - 1, 0)
+            y1 = min(int(np.ceil(y[inside].max())) + 1, level_size[1])
+            if wrap:
+                x0, x1 = 0, wrap
+            else:
+                x0 = max(int(np.floor(x[inside].min())) - 1, 0)
+                x1 = min(int(np.ceil(x[inside].max())) + 1, level_size[0])
+            window = (x0, y0, x1 - x0, y1 - y0)
+        x[~inside] = np.nan
+        return WarpMap(level, x.astype(np.float32), y.astype(np.float32), window, wrap)
+
+    def sample(self, band, nodata, warp_map, resample):
+        """Values of ``band`` at the WarpMap's pixels (near or bilinear); NaN outside"""
+        values = np.full(warp_map.x.shape, np.nan)
+        if warp_map.window is None:
+            return values
+        if warp_map.level:
+            band = band.GetOverview(warp_map.level - 1)
+        xoff, yoff, xsize, ysize = warp_map.window
+        data = band.ReadAsArray(xoff, yoff, xsize, ysize).astype(np.float64)
+        if nodata is not None and not np.isnan(nodata):
+            data[data == nodata] = np.nan
+        inside = np.isfinite(warp_map.x)
+        x = warp_map.x[inside].astype(np.float64) - xoff
+        y = warp_map.y[inside].astype(np.float64) - yoff
+        if resample == "near":
+            col = np.clip(x.astype(np.intp), 0, xsize - 1)
+            row = np.clip(y.astype(np.intp), 0, ysize - 1)
+            values[inside] = data[row, col]
+            return values
+
+        # Bilinear over pixel centers; nodata neighbours drop out of the weights
+        x -= 0.5
+        y -= 0.5
+        col0 = np.floor(x).astype(np.intp)
+        row0 = np.floor(y).astype(np.intp)
+        tx = x - col0
+        ty = y - row0
+        total = np.zeros(x.shape)
+        weights = np.zeros(x.shape)
+        for dr, dc, weight in (
+            (0, 0, (1 - tx) * (1 - ty)),
+            (0, 1, tx * (1 - ty)),
+            (1, 0, (1 - tx) * ty),
+            (1, 1, tx * ty),
+        ):
+            col = col0 + dc
+            col = col % xsize if warp_map.wrap else np.clip(col, 0, xsize - 1)
+            neighbour = data[np.clip(row0 + dr, 0, ysize - 1), col]
+            valid = np.isfinite(neighbour)
+            total[valid] += weight[valid] * neighbour[valid]
+            weights[valid] += weight[valid]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values[inside] = np.where(weights > 0, total / weights, np.nan)
+        return values
+
+    def lookup_table(self, layer, window=None):
+        """Cached ``(table, ratio)`` of the layer's ramp: its buckets over the
+        ``(low, high)`` window, or the 256 raw values of 8-bit data without one"""
+        key = (layer.ramp.signature, window, layer.buckets)
+        entry = self.tables.get(key)
+        if entry is None:
+            if window is None:
+                entry = layer.ramp.colors(np.arange(256)), None
+            else:
+                entry = layer.ramp.lookup_table(*window, layer.buckets)
+            self.tables.put(key, entry)
+        return entry
+
+    def colorize(self, layer, values, byte_data):
+        """RGBA array for warped values, classified like MapServer"""
+        valid = np.isfinite(values)
+        if layer.offsite is not None:
+            valid &= values != layer.offsite
+        if byte_data:
+            table, _ = self.lookup_table(layer)
+            index = np.clip(np.nan_to_num(values), 0, 255).astype(np.intp)
+        elif not valid.any():
+            return np.zeros(values.shape + (4,), dtype=np.uint8)
+        else:
+            low, high = layer.scale or (values[valid].min(), values[valid].max())
+            table, ratio = self.lookup_table(layer, (float(low), float(high)))
+            index = ((np.where(valid, values, low) - low) * ratio).astype(np.int64)
+            np.clip(index, 0, layer.buckets - 1, out=index)
+        rgba = table[index]
+        rgba[~valid] = 0
+        return rgba
+
+    def render(
+        self,
+        map_name,
+        layer_names,
+        crs,
+        bbox,
+        size,
+        image_format="image/png",
+        **options,
+    ):
+        """GetMap image encoded as WMS FORMAT ``image_format`` (perflab.encoding).
+
+        ``bbox`` is in the CRS's x/y order. ``options``: ``transparent``
+        (bool), ``bgcolor`` (RGB tuple, defaults to the map's IMAGECOLOR)
+        and ``style`` (the encoding policy's render style).
+        """
+        start = time.time()
+        layers = self.layers(map_name, layer_names)
+        bgcolor = options.get("bgcolor") or self.backgrounds[map_name.upper()]
+        transparent = options.get("transparent") and encoding.content_type(
+            image_format
+        ) in ("image/png", "image/webp")
+        image = Image.new("RGBA", size, tuple(bgcolor) + (0 if transparent else 255,))
+        for layer in layers:
+            values, byte_data = self.read(layer, crs, bbox, size)
+            with trace.stage("classify"):
+                rgba = self.colorize(layer, values, byte_data)
+            with trace.stage("composite"):
+                image = Image.alpha_composite(image, Image.fromarray(rgba, "RGBA"))
+        with trace.stage("encode"):
+            body = encoding.encode(
+                image, image_format, options.get("style", "gradient"), transparent
+            )
+        RENDER_SECONDS.labels(map_name.upper()).observe(time.time() - start)
+        return body
+
+
+def compare(renderer, upstream, map_name, layer, crs, bbox, size):
+    """Render natively and through MapServer; returns (max diff, % pixels differing)"""
+    params = {
+        "MAP": map_name,
+        "SERVICE": "WMS",
+        "VERSION": "1.1.1",
+        "REQUEST": "GetMap",
+        "LAYERS": layer,
+        "STYLES": "",
+        "SRS": crs,
+        "BBOX": ",".join(repr(v) for v in bbox),
+        "WIDTH": str(size[0]),
+        "HEIGHT": str(size[1]),
+        "FORMAT": "image/png",
+    }
+    response = upstream.get("?" + urlencode(params))
+    if response.status != 200:
+        raise RuntimeError(f"upstream {response.status}: {response.body[:200]!r}")
+    with Image.open(io.BytesIO(response.body)) as image:
+        expected = np.asarray(image.convert("RGB"), dtype=np.int16)
+    native = renderer.render(map_name, [layer], crs, bbox, size)
+    with Image.open(io.BytesIO(native)) as image:
+        actual = np.asarray(image.convert("RGB"), dtype=np.int16)
+    diff = np.abs(expected - actual)
+    return int(diff.max()), 100.0 * float(diff.any(axis=2).mean())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--maps",
+        nargs="+",
+        default=sorted(glob.glob(os.path.join(REPO_DIR, "*.map"))),
+    )
+    parser.add_argument("--upstream", default="http://nginx/cgi-bin/mapserv-direct")
+    parser.add_argument("--map", default="GFS")
+    parser.add_argument("--layers", nargs="+", help="Default: every native layer")
+    parser.add_argument("--crs", default="EPSG:4326")
+    parser.add_argument("--bbox", default="-125,25,-65,50", help="x/y order")
+    parser.add_argument("--size", default="512x512")
+    parser.add_argument("--buckets", type=int, default=DEFAULT_BUCKETS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    renderer = NativeRenderer(args.maps, args.buckets)
+    upstream = Upstream(args.upstream)
+    bbox = tuple(float(v) for v in args.bbox.split(","))
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+    layers = args.layers or sorted(renderer.maps.get(args.map.upper(), {}))
+    worst = 0
+    for layer in layers:
+        max_diff, differing = compare(
+            renderer, upstream, args.map, layer, args.crs, bbox, size
+        )
+        worst = max(worst, max_diff)
+        print(f"{layer:16} max diff {max_diff:3d}  pixels differing {differing:6.2f}%")
+    return 1 if worst > 1 else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
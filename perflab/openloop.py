@@ -0,0 +1,198 @@
+"""Open-loop (constant arrival rate) load for honest latency numbers.
+
+Closed-loop users wait for a response before sending the next request, so
+a slow server also slows the offered load and the tail latency looks
+better than it is (coordinated omission). OpenLoopUser instead draws
+request send times from an arrival process (fixed interval or Poisson) at
+a target rate and measures every request from its *intended* send time.
+Each request is reported twice in the Locust stats:
+
+- ``GET <name>``: service time, as with any other user
+- ``OPEN <name>``: latency corrected for queueing, measured from the
+  intended send time
+
+Rate steps are given as ``duration:rate`` pairs, e.g. ``60:20,120:50``.
+When ARRIVAL_STEPS is set in the environment, locustfile.py also installs
+ArrivalRateShape, which ramps the user pool to match and ends the test
+after the last step. Rates are per Locust process; divide the target by
+the number of workers when running distributed. Example::
+
+    ARRIVAL_STEPS=60:20,60:50,60:100 locust -f locustfile.py OpenLoopUser \\
+        --headless --arrival-scenario mixed_data
+"""
+
+import logging
+import math
+import os
+import random
+import threading
+import time
+
+import gevent
+from locust import HttpUser, LoadTestShape, constant, events, task
+from locust.exception import StopUser
+
+from perflab.workload import get_scenario, user_rng
+
+log = logging.getLogger(__name__)
+
+_schedule = None
+_schedule_lock = threading.Lock()
+
+
+@events.init_command_line_parser.add_listener
+def _add_arguments(parser):
+    group = parser.add_argument_group("Open-loop arrivals (OpenLoopUser)")
+    group.add_argument(
+        "--arrival-rate",
+        type=float,
+        default=0.0,
+        env_var="ARRIVAL_RATE",
+        help="Target requests/s per Locust process (ignored with --arrival-steps)",
+    )
+    group.add_argument(
+        "--arrival-steps",
+        default="",
+        env_var="ARRIVAL_STEPS",
+        help="Rate ramp as duration:rate pairs, e.g. 60:20,120:50",
+    )
+    group.add_argument(
+        "--arrival-process",
+        choices=["poisson", "fixed"],
+        default="poisson",
+        env_var="ARRIVAL_PROCESS",
+        help="Inter-arrival distribution",
+    )
+    group.add_argument(
+        "--arrival-scenario",
+        default="mixed_data",
+        env_var="ARRIVAL_SCENARIO",
+        help="scenarios.json scenario whose request mix is sent",
+    )
+    group.add_argument(
+        "--arrival-headroom",
+        type=float,
+        default=2.0,
+        env_var="ARRIVAL_HEADROOM",
+        help="Seconds of response time the user pool can absorb (users = rate x headroom)",
+    )
+
+
+def parse_steps(spec):
+    """``"60:20,120:50"`` -> ``[(60.0, 20.0), (120.0, 50.0)]``"""
+    steps = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        duration, rate = part.split(":")
+        steps.append((float(duration), float(rate)))
+    return steps
+
+
+def rate_at(steps, elapsed):
+    """Target rate at ``elapsed`` seconds into the ramp, None when it is over"""
+    for duration, rate in steps:
+        if elapsed < duration:
+            return rate
+        elapsed -= duration
+    return None
+
+
+class ArrivalSchedule:
+    """Process-wide sequence of intended send times"""
+
+    def __init__(self, rate=0.0, steps=None, process="poisson", seed=None):
+        self.rate = rate
+        self.steps = steps or []
+        self.process = process
+        self.rng = random.Random(seed)
+        self.t0 = None
+        self.next_time = None
+        self._lock = threading.Lock()
+
+    def next(self):
+        """Intended send time of the next request, None once the ramp is over"""
+        with self._lock:
+            now = time.time()
+            if self.t0 is None:
+                self.t0 = self.next_time = now
+            rate = self._rate(self.next_time - self.t0)
+            if not rate:
+                return None
+            intended = self.next_time
+            if self.process == "fixed":
+                self.next_time += 1.0 / rate
+            else:
+                self.next_time += self.rng.expovariate(rate)
+            return intended
+
+    def _rate(self, elapsed):
+        if self.steps:
+            return rate_at(self.steps, elapsed)
+        return self.rate
+
+
+def get_schedule(options):
+    global _schedule
+    with _schedule_lock:
+        if _schedule is None and options is not None:
+            steps = parse_steps(options.arrival_steps)
+            if steps or options.arrival_rate > 0:
+                _schedule = ArrivalSchedule(
+                    rate=options.arrival_rate,
+                    steps=steps,
+                    process=options.arrival_process,
+                    seed=os.environ.get("PERFLAB_SEED") or None,
+                )
+        return _schedule
+
+
+class OpenLoopUser(HttpUser):
+    """Sends a scenario's request mix on an open-loop arrival schedule"""
+
+    wait_time = constant(0)
+    host = "http://nginx"
+
+    def on_start(self):
+        options = self.environment.parsed_options
+        self.schedule = get_schedule(options)
+        if self.schedule is None:
+            log.warning("OpenLoopUser needs --arrival-rate or --arrival-steps")
+            raise StopUser()
+        self.workload = get_scenario(options.arrival_scenario)
+        self.rng = user_rng(self)
+
+    @task
+    def send(self):
+        intended = self.schedule.next()
+        if intended is None:
+            raise StopUser()
+        delay = intended - time.time()
+        if delay > 0:
+            gevent.sleep(delay)
+        for url, name in self.workload.pick(self.rng):
+            response = self.client.get(url, name=name)
+            events.request.fire(
+                request_type="OPEN",
+                name=name,
+                response_time=(time.time() - intended) * 1000,
+                response_length=len(response.content or b""),
+                exception=None if response.ok else f"HTTP {response.status_code}",
+                context={},
+            )
+
+
+class ArrivalRateShape(LoadTestShape):
+    """Sizes the OpenLoopUser pool to the ARRIVAL_STEPS ramp and stops after it"""
+
+    abstract = True
+
+    def tick(self):
+        options = self.runner.environment.parsed_options
+        steps = parse_steps(options.arrival_steps)
+        rate = rate_at(steps, self.get_run_time())
+        if rate is None:
+            return None
+        users = max(1, math.ceil(rate * options.arrival_headroom))
+        return users, users, [OpenLoopUser]
@@ -0,0 +1,168 @@
+"""Predictive next-frame rendering for time-loop viewers.
+
+Animating radar loops or forecast hours requests the same viewport again
+and again, one TIME step further each time. ``Prefetcher.observe`` sees
+every tiled GetMap with a TIME. Once a viewport (every parameter except
+TIME) has moved by the same step twice in a row, the next frames are
+predicted. The following ``frames`` timesteps are rendered into the proxy's
+tile cache on a small, separate worker pool, so they never take workers
+from foreground requests. A frame the viewer asks for while it is still
+being prefetched joins the render through single-flight.
+
+A session's pending frames are cancelled when its viewer stops. That
+happens when no frame arrives for ``idle`` seconds, when the pattern
+breaks (another step, a jump, a new viewport), or when a prefetched frame
+fails (past the end of the time extent). Frames already behind the viewer
+are dropped.
+"""
+
+import collections
+import concurrent.futures
+import datetime
+import logging
+import threading
+import time
+
+from perflab import metrics
+from perflab.singleflight import wms_key
+
+log = logging.getLogger(__name__)
+
+TIME_FORMATS = (
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%dT%H:%MZ",
+    "%Y-%m-%d",
+)
+
+FRAMES = metrics.counter(
+    "perflab_prefetch_frames_total",
+    "Prefetched frames by outcome (scheduled, rendered, cancelled, failed)",
+    ["outcome"],
+)
+TILES_USED = metrics.counter(
+    "perflab_prefetch_tiles_used_total", "Prefetched tiles later served to a viewer"
+)
+SESSIONS = metrics.gauge("perflab_prefetch_sessions", "Viewports being animated")
+
+
+def parse_time(value):
+    """``(datetime, format)`` of a single WMS TIME value, or None"""
+    for fmt in TIME_FORMATS:
+        try:
+            parsed = datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return parsed.replace(tzinfo=datetime.timezone.utc), fmt
+    return None
+
+
+class _Session:
+    def __init__(self, now):
+        self.last = None
+        self.step = None
+        self.confirmed = False
+        self.seen = now
+        self.scheduled = {}  # time -> future
+        self.cancelled = threading.Event()
+
+
+class Prefetcher:
+    def __init__(self, render_frame, frames=6, workers=2, idle=10.0, max_sessions=256):
+        """``render_frame(params, cancelled)`` renders one frame into the cache"""
+        self.render_frame = render_frame
+        self.frames = frames
+        self.idle = idle
+        self.max_sessions = max_sessions
+        self.pool = concurrent.futures.ThreadPoolExecutor(
+            workers, thread_name_prefix="prefetch"
+        )
+        self._sessions = {}
+        self._prefetched = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, params):
+        """Record a viewer's frame request and prefetch what comes next"""
+        value = params.get("TIME", "")
+        parsed = parse_time(value)
+        if parsed is None:
+            return
+        current, fmt = parsed
+        key = wms_key({k: v for k, v in params.items() if k != "TIME"})
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(key)
+            if session is None:
+                if len(self._sessions) >= self.max_sessions:
+                    return
+                session = self._sessions[key] = _Session(now)
+                SESSIONS.set(len(self._sessions))
+            session.seen = now
+            if session.last is not None:
+                step = current - session.last
+                if step and step == session.step:
+                    session.confirmed = True
+                elif step != session.step:
+                    self._cancel(session)
+                    session.step = step or None
+                    session.confirmed = False
+            session.last = current
+            if not session.confirmed:
+                return
+            # Drop frames the viewer has already passed, queue the ones ahead
+            for frame in list(session.scheduled):
+                if (frame - current) / session.step <= 0:
+                    session.scheduled.pop(frame).cancel()
+            for i in range(1, self.frames + 1):
+                frame = current + i * session.step
+                if frame in session.scheduled:
+                    continue
+                frame_params = dict(params, TIME=frame.strftime(fmt))
+                session.scheduled[frame] = self.pool.submit(
+                    self._run, session, frame_params
+                )
+                FRAMES.labels("scheduled").inc()
+
+    def _run(self, session, params):
+        if session.cancelled.is_set():
+            FRAMES.labels("cancelled").inc()
+            return
+        try:
+            keys = self.render_frame(params, session.cancelled)
+        except Exception as e:
+            # Usually a TIME past the end of the extent: stop this session
+            log.debug("Prefetch of %s failed: %s", params.get("TIME"), e)
+            FRAMES.labels("failed").inc()
+            session.cancelled.set()
+            return
+        if keys is None:
+            FRAMES.labels("cancelled").inc()
+            return
+        FRAMES.labels("rendered").inc()
+        with self._lock:
+            for key in keys:
+                self._prefetched[key] = True
+            while len(self._prefetched) > 100000:
+                self._prefetched.popitem(last=False)
+
+    def used(self, tile_key):
+        """Count a cache hit on a prefetched tile"""
+        with self._lock:
+            if self._prefetched.pop(tile_key, None):
+                TILES_USED.inc()
+
+    def _cancel(self, session):
+        session.cancelled.set()
+        for future in session.scheduled.values():
+            if future.cancel():
+                FRAMES.labels("cancelled").inc()
+        session.scheduled = {}
+        session.cancelled = threading.Event()
+
+    def _expire(self, now):
+        for key, session in list(self._sessions.items()):
+            if now - session.seen > self.idle:
+                self._cancel(session)
+                del self._sessions[key]
+        SESSIONS.set(len(self._sessions))
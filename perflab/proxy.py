@@ -0,0 +1,635 @@
+"""Cache-aware WMS front proxy between nginx and MapServer.
+
+Only three GFS layers go through MapCache; every other GetMap hits mapserv
+uncached, and arbitrary BBOX/WIDTH/HEIGHT combinations never repeat
+exactly anyway. The proxy snaps each GetMap onto the matching mapcache.xml
+grid (``webmerc`` for EPSG:3857, ``wgs84`` for EPSG:4326): it picks the
+coarsest zoom level at least as fine as the request, renders the covering
+grid tiles through MapServer (or takes them from an in-memory LRU cache
+and, with ``--tile-store``, the content-addressed perflab.tilestore),
+stitches them and crops/resamples the result to the requested size.
+Leaflet's WMS tiles (viewer.html) line up with the webmerc grid exactly, so
+they become pure cache hits.
+
+Cached tiles are keyed by the newest mtime of the layers' data files and
+expire after ``--cache-max-age``; perflab.watcher also drops them through
+``POST /invalidate`` when new data lands.
+
+Requests the grids cannot serve faithfully are passed through unchanged:
+anything but GetMap, other CRSs or output formats, a bbox outside the grid
+extent, resolutions finer than the deepest zoom level, or a MapServer error
+on any tile. Identical concurrent renders are coalesced (perflab.singleflight)
+both for grid tiles and for passed-through requests. With ``--native``,
+upstream GetMaps for the gradient raster layers are rendered in-process by
+perflab.native instead of MapServer. With ``--prefetch-frames K``, viewers
+stepping through TIME get their next K frames rendered ahead of them
+(perflab.prefetch). Answers are encoded as PNG, palette PNG, WebP or JPEG
+following the per-style policy of perflab.encoding. Example::
+
+    python -m perflab.proxy --upstream http://mapserver --port 8000 --native
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import http.client
+import http.server
+import io
+import logging
+import os
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from PIL import Image
+
+from perflab import catalog, encoding, metrics, trace
+from perflab.bandcache import BandCache
+from perflab.lru import LRUCache
+from perflab.mapcache import load_config
+from perflab.native import NativeRenderer, Unsupported
+from perflab.prefetch import Prefetcher
+from perflab.singleflight import SingleFlight, wms_key
+from perflab.tilestore import TileStore
+from perflab.upstream import Response, Upstream
+
+log = logging.getLogger(__name__)
+
+# Geographic CRSs whose WMS 1.3.0 axis order is latitude first
+LAT_LON_CRS = {"EPSG:4326"}
+CRS_ALIASES = {"EPSG:900913": "EPSG:3857", "CRS:84": "EPSG:4326"}
+TILE_PARAMS = {"BBOX", "WIDTH", "HEIGHT", "CRS", "SRS", "VERSION", "FORMAT"}
+# GetMap parameters the native renderer understands; anything else goes upstream
+NATIVE_PARAMS = TILE_PARAMS | {
+    "MAP",
+    "SERVICE",
+    "REQUEST",
+    "LAYERS",
+    "STYLES",
+    "TRANSPARENT",
+    "BGCOLOR",
+    "EXCEPTIONS",
+}
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# MapCache's <expires> for its tilesets
+DEFAULT_CACHE_MAX_AGE = 3600
+
+REQUESTS = metrics.counter(
+    "perflab_proxy_requests_total", "GetMap requests by handling mode", ["mode"]
+)
+TILES = metrics.counter(
+    "perflab_proxy_tiles_total", "Grid tiles needed by tiled requests", ["outcome"]
+)
+CACHE_BYTES = metrics.gauge("perflab_proxy_cache_bytes", "Bytes in the tile cache")
+EVICTIONS = metrics.counter("perflab_proxy_cache_evictions_total", "Tiles evicted")
+NATIVE = metrics.counter(
+    "perflab_proxy_native_total",
+    "Upstream calls by native renderer outcome (rendered or unsupported)",
+    ["outcome"],
+)
+REQUEST_SECONDS = metrics.histogram(
+    "perflab_proxy_request_seconds",
+    "Time to answer a request, by handling mode",
+    ["mode"],
+    buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+)
+LAYER_SECONDS = metrics.histogram(
+    "perflab_proxy_layer_seconds",
+    "Time to answer a request, by map, layer, style and tile cache outcome",
+    ["map", "layer", "style", "cache"],
+    buckets=metrics.LATENCY_BUCKETS,
+)
+RESPONSE_BYTES = metrics.histogram(
+    "perflab_proxy_response_bytes",
+    "Response body size, by map, layer and style",
+    ["map", "layer", "style"],
+    buckets=metrics.BYTES_BUCKETS,
+)
+
+
+class Passthrough(Exception):
+    """The request cannot be served from grid tiles"""
+
+
+def normalize_params(query):
+    """Query string -> dict with upper-case keys (WMS keys are case-insensitive)"""
+    return {k.upper(): v for k, v in parse_qsl(query, keep_blank_values=True)}
+
+
+def request_bbox(params):
+    """``(crs, (minx, miny, maxx, maxy))`` in the CRS's x/y order"""
+    crs = (params.get("CRS") or params.get("SRS") or "").upper()
+    crs = CRS_ALIASES.get(crs, crs)
+    try:
+        bbox = tuple(float(v) for v in params["BBOX"].split(","))
+    except (KeyError, ValueError):
+        raise Passthrough("bad BBOX")
+    if len(bbox) != 4:
+        raise Passthrough("bad BBOX")
+    # WMS 1.3.0 uses the CRS's own axis order: EPSG:4326 is lat/lon
+    raw_crs = params.get("CRS", "").upper()
+    if params.get("VERSION", "1.3.0") >= "1.3" and raw_crs in LAT_LON_CRS:
+        bbox = (bbox[1], bbox[0], bbox[3], bbox[2])
+    return crs, bbox
+
+
+class DataVersions:
+    """Version of the data behind a MAP/LAYERS pair: its files' newest mtime.
+
+    Cached tiles are keyed by it, so a new MRMS or GOES scan misses the
+    cache as soon as the file lands. Each file is stat'ed at most once per
+    ``interval`` seconds; ``refresh`` forgets the stats early.
+    """
+
+    def __init__(self, map_paths, interval=2.0):
+        self.catalog = catalog.load(map_paths)
+        self.interval = interval
+        self._mtimes = {}  # path -> (checked, mtime_ns)
+        self._lock = threading.Lock()
+
+    def _mtime(self, path, now):
+        checked = self._mtimes.get(path)
+        if checked is not None and now - checked[0] < self.interval:
+            return checked[1]
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = 0
+        with self._lock:
+            self._mtimes[path] = (now, mtime)
+        return mtime
+
+    def version(self, params):
+        now = time.monotonic()
+        version = 0
+        for name in params.get("LAYERS", "").split(","):
+            layer = self.catalog.get(params.get("MAP", ""), name)
+            if layer is None:
+                continue
+            for path in layer.files + ([layer.tileindex] if layer.tileindex else []):
+                version = max(version, self._mtime(path, now))
+        return version
+
+    def refresh(self):
+        with self._lock:
+            self._mtimes.clear()
+
+
+def tile_key(tile, version):
+    return (version,) + tuple(sorted(tile.items()))
+
+
+def store_tileset(tile):
+    """Tile store name of a grid tile's tileset: its parameters but the position"""
+    return urlencode(sorted((k, v) for k, v in tile.items() if k not in TILE_PARAMS))
+
+
+class TileProxy:
+    def __init__(
+        self,
+        upstream,
+        config,
+        cache_bytes,
+        max_tiles=64,
+        workers=16,
+        native=None,
+        store=None,
+        versions=None,
+        cache_max_age=DEFAULT_CACHE_MAX_AGE,
+    ):
+        self.upstream = upstream
+        self.native = native
+        self.grids = {grid.srs.upper(): grid for grid in config.grids.values()}
+        self.cache = LRUCache(cache_bytes, max_age=cache_max_age)
+        self.versions = versions
+        self.store = store
+        self.max_tiles = max_tiles
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers)
+        self.tile_flight = SingleFlight("tile")
+        self.passthrough_flight = SingleFlight("passthrough")
+        self.prefetcher = None
+
+    def forward(self, query):
+        if self.native is not None:
+            try:
+                response = self.render_native(normalize_params(query))
+            except (Passthrough, Unsupported) as e:
+                NATIVE.labels("unsupported").inc()
+                log.debug("Not native %s: %s", query, e)
+            else:
+                NATIVE.labels("rendered").inc()
+                return response
+        with trace.stage("upstream"):
+            response = self.upstream.get("/?" + query, trace.upstream_headers())
+        trace.current().add_header(response.headers.get("Server-Timing"), "upstream.")
+        return response
+
+    def render_native(self, params):
+        """Answer an upstream GetMap with the native renderer"""
+        if params.get("REQUEST", "").lower() != "getmap":
+            raise Passthrough("not GetMap")
+        extra = set(params) - NATIVE_PARAMS
+        if extra:
+            raise Passthrough(f"parameters {sorted(extra)}")
+        if params.get("STYLES", "").strip(","):
+            raise Passthrough("styles")
+        if not encoding.supported(params.get("FORMAT")):
+            raise Passthrough("format")
+        crs, bbox = request_bbox(params)
+        try:
+            size = int(params["WIDTH"]), int(params["HEIGHT"])
+            bgcolor = params.get("BGCOLOR")
+            bgcolor = bgcolor and tuple(bytes.fromhex(bgcolor[-6:]))
+        except (KeyError, ValueError):
+            raise Passthrough("size or BGCOLOR")
+        body = self.native.render(
+            params.get("MAP", ""),
+            params.get("LAYERS", "").split(","),
+            crs,
+            bbox,
+            size,
+            params["FORMAT"],
+            transparent=params.get("TRANSPARENT", "").upper() == "TRUE",
+            bgcolor=bgcolor,
+            style=metrics.wms_labels(params)[2],
+        )
+        content_type = encoding.content_type(params["FORMAT"])
+        return Response(200, {"Content-Type": content_type}, body)
+
+    def passthrough(self, query):
+        """Forward a request unchanged, coalescing identical concurrent ones"""
+        key = wms_key(normalize_params(query))
+        response, _ = self.passthrough_flight.do(key, lambda: self.forward(query))
+        return response
+
+    def plan(self, params):
+        """Grid, zoom and inclusive tile range covering the request"""
+        if params.get("REQUEST", "").lower() != "getmap":
+            raise Passthrough("not GetMap")
+        if not encoding.supported(params.get("FORMAT")):
+            raise Passthrough("format")
+        crs, bbox = request_bbox(params)
+        grid = self.grids.get(crs)
+        if grid is None:
+            raise Passthrough("crs")
+        try:
+            width, height = int(params["WIDTH"]), int(params["HEIGHT"])
+        except (KeyError, ValueError):
+            raise Passthrough("size")
+        minx, miny, maxx, maxy = bbox
+        ex = grid.extent
+        tolerance = 1e-6 * (ex[2] - ex[0])
+        if (
+            width <= 0
+            or height <= 0
+            or minx >= maxx
+            or miny >= maxy
+            or minx < ex[0] - tolerance
+            or miny < ex[1] - tolerance
+            or maxx > ex[2] + tolerance
+            or maxy > ex[3] + tolerance
+        ):
+            raise Passthrough("bbox")
+        res = min((maxx - minx) / width, (maxy - miny) / height)
+        levels = [z for z, r in enumerate(grid.resolutions) if r <= res * 1.0001]
+        if not levels:
+            raise Passthrough("resolution")
+        z = levels[0]
+        tiles = grid.tile_range(z, bbox)
+        count = (tiles[2] - tiles[0] + 1) * (tiles[3] - tiles[1] + 1)
+        if count > self.max_tiles:
+            raise Passthrough("too many tiles")
+        return grid, z, tiles, bbox, (width, height)
+
+    def tile_params(self, params, grid, z, x, y):
+        tile = {k: v for k, v in params.items() if k not in TILE_PARAMS}
+        tile.update(
+            VERSION="1.1.1",
+            SRS=grid.srs,
+            BBOX=",".join(repr(v) for v in grid.tile_bbox(z, x, y)),
+            WIDTH=str(grid.tile_width),
+            HEIGHT=str(grid.tile_height),
+            FORMAT="image/png",
+        )
+        return tile
+
+    def fetch_tile(self, params, grid, z, x, y):
+        """PNG bytes of one grid tile and whether it came from the cache"""
+        tile = self.tile_params(params, grid, z, x, y)
+        version = self.data_version(params)
+        key = tile_key(tile, version)
+        data = self.cache.get(key)
+        if data is None and self.store is not None:
+            stored = self.store.get(store_tileset(tile), grid.name, z, x, y, version)
+            if stored is not None:
+                # Keep the stored creation time so the tile expires on schedule
+                data, created = stored
+                EVICTIONS.inc(self.cache.put(key, data, created))
+                CACHE_BYTES.set(self.cache.bytes)
+        if data is not None:
+            if self.prefetcher is not None:
+                self.prefetcher.used(key)
+            return data, True
+
+        def render_tile():
+            try:
+                response = self.forward(urlencode(tile))
+            except OSError as e:
+                raise Passthrough(f"tile error {e}")
+            content_type = response.headers.get("Content-Type", "")
+            if response.status != 200 or not content_type.startswith("image/"):
+                raise Passthrough(f"tile error {response.status} {content_type}")
+            EVICTIONS.inc(self.cache.put(key, response.body))
+            CACHE_BYTES.set(self.cache.bytes)
+            if self.store is not None:
+                self.store.put(
+                    store_tileset(tile), grid.name, z, x, y, response.body, version
+                )
+            return response.body
+
+        data, _ = self.tile_flight.do(key, render_tile)
+        return data, False
+
+    def data_version(self, params):
+        return self.versions.version(params) if self.versions is not None else 0
+
+    def invalidate(self, map_name, layers):
+        """Drop the cached tiles of ``layers`` of ``map_name``; returns how many"""
+        if self.versions is not None:
+            self.versions.refresh()
+        layers = set(layers)
+
+        def match(key):
+            tile = dict(key[1:])
+            return tile.get("MAP", "").upper() == map_name.upper() and bool(
+                layers & set(tile.get("LAYERS", "").split(","))
+            )
+
+        dropped = self.cache.discard(match)
+        CACHE_BYTES.set(self.cache.bytes)
+        return dropped
+
+    def prefetch_frame(self, params, cancelled):
+        """Render a frame's grid tiles into the cache; None once cancelled"""
+        grid, z, (x0, y0, x1, y1), _, _ = self.plan(params)
+        rendered = []
+        for y in range(y0, y1 + 1):
+            for x in range(x0, x1 + 1):
+                if cancelled.is_set():
+                    return None
+                _, hit = self.fetch_tile(params, grid, z, x, y)
+                if not hit:
+                    tile = self.tile_params(params, grid, z, x, y)
+                    rendered.append(tile_key(tile, self.data_version(params)))
+        return rendered
+
+    def render(self, params):
+        """GetMap answer assembled from grid tiles: (body, type, stats, cache)"""
+        grid, z, (x0, y0, x1, y1), bbox, size = self.plan(params)
+        if self.prefetcher is not None and "TIME" in params:
+            self.prefetcher.observe(params)
+        coords = [(x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+        fetch_tile = trace.bind(self.fetch_tile)
+        futures = [
+            self.pool.submit(fetch_tile, params, grid, z, x, y) for x, y in coords
+        ]
+        tw, th = grid.tile_width, grid.tile_height
+        canvas = Image.new("RGBA", ((x1 - x0 + 1) * tw, (y1 - y0 + 1) * th))
+        hits = 0
+        tracer = trace.current()
+        for (x, y), future in zip(coords, futures):
+            with tracer.stage("tiles"):
+                data, hit = future.result()
+            hits += hit
+            with tracer.stage("stitch"), Image.open(io.BytesIO(data)) as tile:
+                canvas.paste(tile.convert("RGBA"), ((x - x0) * tw, (y1 - y) * th))
+        TILES.labels("hit").inc(hits)
+        TILES.labels("miss").inc(len(coords) - hits)
+
+        # Canvas origin is the top-left corner of tile (x0, y1)
+        res = grid.resolutions[z]
+        origin_x, _, _, origin_y = grid.tile_bbox(z, x0, y1)
+        minx, miny, maxx, maxy = bbox
+        box = (
+            (minx - origin_x) / res,
+            (origin_y - maxy) / res,
+            (maxx - origin_x) / res,
+            (origin_y - miny) / res,
+        )
+        with tracer.stage("resample"):
+            image = canvas.resize(size, Image.BILINEAR, box=box)
+
+        transparent = params.get("TRANSPARENT", "").upper() == "TRUE"
+        style = metrics.wms_labels(params)[2]
+        with tracer.stage("encode"):
+            body = encoding.encode(image, params["FORMAT"], style, transparent)
+        stats = f"z={z} tiles={len(coords)} hits={hits}"
+        return (
+            body,
+            encoding.content_type(params["FORMAT"]),
+            stats,
+            metrics.cache_outcome(hits, len(coords)),
+        )
+
+
+class ProxyHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    proxy = None  # set by main()
+
+    def do_GET(self):
+        start = time.time()
+        query = urlsplit(self.path).query
+        params = normalize_params(query)
+        tracer = trace.begin("proxy", self.headers)
+        try:
+            body, content_type, stats, cache = self.proxy.render(params)
+            mode = "tiled"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("X-Tile-Proxy", stats)
+        except Passthrough as e:
+            mode = cache = "passthrough"
+            log.debug("Passing through %s: %s", query, e)
+            try:
+                response = self.proxy.passthrough(query)
+            except (OSError, http.client.HTTPException) as error:
+                self.fail(502, error)
+                return
+            body = response.body
+            self.send_response(response.status)
+            self.send_header(
+                "Content-Type", response.headers.get("Content-Type", "text/plain")
+            )
+            self.send_header("X-Tile-Proxy", f"passthrough ({e})")
+        except (OSError, http.client.HTTPException) as e:
+            # Upstream unreachable, or a tile PIL cannot decode
+            log.warning("Rendering %s failed: %s", query, e)
+            self.fail(502, e)
+            return
+        except Exception as e:  # answer instead of dropping the connection
+            log.exception("Rendering %s failed", query)
+            self.fail(500, e)
+            return
+        if tracer:
+            self.send_header("Server-Timing", tracer.header())
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        elapsed = time.time() - start
+        labels = metrics.wms_labels(params)
+        tracer.finish(mode=mode, map=labels[0], layers=labels[1], cache=cache)
+        trace.end()
+        REQUESTS.labels(mode).inc()
+        REQUEST_SECONDS.labels(mode).observe(elapsed)
+        LAYER_SECONDS.labels(*labels, cache).observe(elapsed)
+        RESPONSE_BYTES.labels(*labels).observe(len(body))
+
+    def fail(self, status, error):
+        self.send_error(status, str(error))
+        trace.end()
+        REQUESTS.labels("error").inc()
+
+    def do_POST(self):
+        """``POST /invalidate?MAP=MRMS&LAYERS=refl,base_refl`` (perflab.watcher)"""
+        parts = urlsplit(self.path)
+        params = normalize_params(parts.query)
+        if parts.path != "/invalidate" or "MAP" not in params:
+            self.send_error(404)
+            return
+        dropped = self.proxy.invalidate(
+            params["MAP"], params.get("LAYERS", "").split(",")
+        )
+        log.info(
+            "Invalidated %s %s: %d tiles", params["MAP"], params.get("LAYERS"), dropped
+        )
+        body = f"{dropped}\n".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+class ProxyServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # bursts from Locust overflow the default of 5
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--upstream", default="http://mapserver")
+    parser.add_argument("--mapcache", help="mapcache.xml path")
+    parser.add_argument("--cache-mb", type=int, default=512, help="Tile cache size")
+    parser.add_argument(
+        "--cache-max-age",
+        type=int,
+        default=DEFAULT_CACHE_MAX_AGE,
+        help="Seconds before cached tiles are rendered again",
+    )
+    parser.add_argument(
+        "--max-tiles", type=int, default=64, help="Pass through above this many tiles"
+    )
+    parser.add_argument("--workers", type=int, default=16, help="Parallel tile renders")
+    parser.add_argument(
+        "--native",
+        action="store_true",
+        help="Render gradient raster layers in-process (perflab.native)",
+    )
+    parser.add_argument(
+        "--maps",
+        nargs="+",
+        default=sorted(glob.glob(os.path.join(REPO_DIR, "*.map"))),
+        help="Mapfiles for --native and the data versions of cached tiles",
+    )
+    parser.add_argument(
+        "--band-cache",
+        metavar="DIR",
+        help="Read --native bands decoded once per host into DIR (perflab.bandcache)",
+    )
+    parser.add_argument(
+        "--warp-map-mb",
+        type=int,
+        default=256,
+        help="Cache of --native reprojection grids (perflab.native warp maps)",
+    )
+    parser.add_argument(
+        "--prefetch-frames",
+        type=int,
+        default=0,
+        help="Frames to render ahead of TIME animations (0 = off)",
+    )
+    parser.add_argument(
+        "--prefetch-workers", type=int, default=2, help="Parallel prefetch renders"
+    )
+    parser.add_argument(
+        "--png-policy",
+        help="zlib level and palette mode per style, e.g. gradient=1,contour=6:exact "
+        "(default PERFLAB_PNG_POLICY, see perflab.encoding)",
+    )
+    parser.add_argument(
+        "--tile-store",
+        metavar="PATH",
+        help="Keep rendered grid tiles in a content-addressed SQLite store "
+        "(perflab.tilestore) below the in-memory cache",
+    )
+    parser.add_argument(
+        "--tile-store-mb", type=int, default=4096, help="Tile store size"
+    )
+    parser.add_argument(
+        "--tile-store-max-age",
+        type=int,
+        help="Seconds before stored tiles are rendered again (default --cache-max-age)",
+    )
+    parser.add_argument("--metrics-port", type=int, default=0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    metrics.start_http_server(args.metrics_port)
+    metrics.label_catalog(args.maps)
+    if args.png_policy is not None:
+        encoding.DEFAULT = encoding.Policy(args.png_policy)
+    native = None
+    if args.native:
+        band_cache = BandCache(args.band_cache) if args.band_cache else None
+        native = NativeRenderer(
+            args.maps, band_cache=band_cache, warp_map_mb=args.warp_map_mb
+        )
+    store = None
+    if args.tile_store:
+        store = TileStore(
+            args.tile_store,
+            args.tile_store_mb * 1024 * 1024,
+            max_age=(
+                args.cache_max_age
+                if args.tile_store_max_age is None
+                else args.tile_store_max_age
+            ),
+        )
+    ProxyHandler.proxy = TileProxy(
+        Upstream(args.upstream),
+        load_config(args.mapcache),
+        args.cache_mb * 1024 * 1024,
+        max_tiles=args.max_tiles,
+        workers=args.workers,
+        native=native,
+        store=store,
+        versions=DataVersions(args.maps),
+        cache_max_age=args.cache_max_age,
+    )
+    if args.prefetch_frames > 0:
+        ProxyHandler.proxy.prefetcher = Prefetcher(
+            ProxyHandler.proxy.prefetch_frame,
+            frames=args.prefetch_frames,
+            workers=args.prefetch_workers,
+        )
+    server = ProxyServer(("", args.port), ProxyHandler)
+    log.info("WMS tile proxy on :%d -> %s", args.port, args.upstream)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
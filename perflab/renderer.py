@@ -0,0 +1,408 @@
+"""Persistent MapScript WMS renderer pool.
+
+Under Apache + mod_fcgid every mapserv process parses gfs.map, mrms.map and
+goes.map and opens its own GDAL datasets. This server loads each mapfile
+once per worker process, keeps the data files open for the life of the
+worker (``CLOSE_CONNECTION=DEFER`` plus shared GDAL handles opened at
+start-up) and answers WMS requests from a pool of pre-started processes,
+one per core by default. Workers notice replaced data files (new COGs from
+perflab.ingest) and reopen them before the next render. With
+``--band-cache DIR``, raster layers read bands that perflab.bandcache
+decoded once for all workers instead of decoding the COGs in every worker.
+EPSG:3857 requests read the Web-Mercator copies of perflab.ingest.webmerc
+where they exist.
+
+It speaks the same ``?MAP=GFS&SERVICE=WMS&...`` protocol as mapserv, so it
+can replace ``mapserver`` as the proxy's upstream::
+
+    python -m perflab.renderer --port 8080 --metrics-port 9111
+
+Needs the Python MapScript bindings, i.e. run it in the mapserver image.
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import http.server
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from perflab import catalog, metrics, trace
+from perflab.bandcache import BandCache
+
+log = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MAP_DIR = "/etc/mapserver/maps"
+WEBMERC_CRS = {"EPSG:3857", "EPSG:900913"}
+
+QUEUE_DEPTH = metrics.gauge(
+    "perflab_renderer_queue_depth", "Requests waiting for a free render worker"
+)
+IN_FLIGHT = metrics.gauge("perflab_renderer_in_flight", "Requests being handled")
+RENDER_SECONDS = metrics.histogram(
+    "perflab_renderer_render_seconds",
+    "Time spent inside a worker, by map and request",
+    ["map", "request"],
+    buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+)
+WAIT_SECONDS = metrics.histogram(
+    "perflab_renderer_queue_seconds",
+    "Time a request waited for a free worker",
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5],
+)
+LAYER_SECONDS = metrics.histogram(
+    "perflab_renderer_layer_seconds",
+    "GetMap time inside a worker, by map, layer and style",
+    ["map", "layer", "style"],
+    buckets=metrics.LATENCY_BUCKETS,
+)
+RESPONSE_BYTES = metrics.histogram(
+    "perflab_renderer_response_bytes",
+    "GetMap response size, by map, layer and style",
+    ["map", "layer", "style"],
+    buckets=metrics.BYTES_BUCKETS,
+)
+DATASET_OPENS = metrics.counter(
+    "perflab_renderer_dataset_opens_total", "GDAL datasets opened by the workers"
+)
+MAP_LOADS = metrics.counter(
+    "perflab_renderer_map_loads_total", "Mapfiles parsed by the workers"
+)
+
+# Worker process state, set by _init_worker
+_worker = None
+
+
+def wms_params(query):
+    """Parameters of a WMS query string, keys upper-cased"""
+    return {k.upper(): v for k, v in parse_qsl(query, keep_blank_values=True)}
+
+
+class Worker:
+    """Mapfiles and open datasets of one render process"""
+
+    def __init__(self, map_paths, band_cache_dir=None):
+        import mapscript
+        from osgeo import gdal
+
+        self.mapscript = mapscript
+        self.gdal = gdal
+        self.maps = {}
+        self.data_files = set()
+        # map -> [(layerObj, source file, band)] served from the shared band cache
+        self.cached_layers = {}
+        # map -> [(layer index, EPSG:3857 copy of its data)] (perflab.ingest.webmerc)
+        self.webmerc_layers = {}
+        self.band_cache = BandCache(band_cache_dir) if band_cache_dir else None
+        for path in map_paths:
+            map_obj = mapscript.mapObj(path)
+            for i in range(map_obj.numlayers):
+                layer = map_obj.getLayer(i)
+                layer.setProcessingKey("CLOSE_CONNECTION", "DEFER")
+                band = layer.getProcessingKey("BANDS") or "1"
+                if (
+                    self.band_cache
+                    and layer.type == mapscript.MS_LAYER_RASTER
+                    and not layer.tileindex
+                    and layer.data
+                    and os.path.isfile(layer.data)
+                    and band.isdigit()
+                ):
+                    self.cached_layers.setdefault(map_obj.name.upper(), []).append(
+                        (layer, layer.data, int(band))
+                    )
+                webmerc = layer.metadata.get("perflab_3857_data")
+                if webmerc:
+                    self.webmerc_layers.setdefault(map_obj.name.upper(), []).append(
+                        (i, webmerc)
+                    )
+            self.maps[map_obj.name.upper()] = map_obj
+        for layer in catalog.load(map_paths).select(type="RASTER"):
+            self.data_files.update(layer.files)
+        self.data_files -= {
+            source for cached in self.cached_layers.values() for _, source, _ in cached
+        }
+        self.map_loads = len(self.maps)
+        self.datasets = {}
+        self.signatures = {}
+
+    def bind_band_cache(self, map_name, names):
+        """Point the cached layers (or groups) ``names`` of ``map_name`` at the
+        current decoded band; True if any moved
+
+        Only the requested layers are bound, so a data update costs the first
+        request for each layer one decode instead of one for every layer.
+        """
+        moved = False
+        for layer, source, band in self.cached_layers.get(map_name, ()):
+            if layer.name.lower() not in names and (
+                not layer.group or layer.group.lower() not in names
+            ):
+                continue
+            try:
+                path = self.band_cache.path(source, band)
+            except (OSError, RuntimeError, ValueError) as e:
+                log.warning("Band cache: %s band %d: %s", source, band, e)
+                path = source
+            if layer.data == path:
+                continue
+            if layer.data != source:
+                self.data_files.discard(layer.data)
+                self.datasets.pop(layer.data, None)
+                self.signatures.pop(layer.data, None)
+                moved = True
+            layer.data = path
+            layer.setProcessingKey("BANDS", "1" if path != source else str(band))
+            self.data_files.add(path)
+        return moved
+
+    def refresh_datasets(self, params=None):
+        """(Re)open changed data files; returns the number of datasets opened
+
+        ``params`` (upper-case WMS parameters) name the layers to bind to the
+        band cache first.
+        """
+        opened = 0
+        stale = False
+        if self.band_cache and params:
+            names = {
+                name.strip().lower()
+                for key in ("LAYERS", "QUERY_LAYERS", "LAYER")
+                for name in params.get(key, "").split(",")
+                if name.strip()
+            }
+            if names:
+                stale = self.bind_band_cache(params.get("MAP", "").upper(), names)
+        for path in self.data_files:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+            if self.signatures.get(path) == signature:
+                continue
+            if path in self.datasets:
+                stale = True
+                del self.datasets[path]
+            self.signatures[path] = signature
+            try:
+                # Shared handles are reused by MapServer's own GDALOpenShared
+                self.datasets[path] = self.gdal.OpenShared(path)
+            except RuntimeError as e:
+                log.warning("Cannot open %s: %s", path, e)
+                continue
+            opened += 1
+        if stale:
+            # Drop MapServer's deferred connections to the replaced files
+            self.mapscript.msConnPoolCloseUnreferenced()
+        return opened
+
+    def use_webmerc(self, map_obj, map_name):
+        """Point layers with an EPSG:3857 copy at it, so MapServer only resamples"""
+        for index, path in self.webmerc_layers.get(map_name, ()):
+            if not os.path.exists(path):
+                continue
+            if self.band_cache:
+                try:
+                    path = self.band_cache.path(path)
+                except (OSError, RuntimeError, ValueError) as e:
+                    log.warning("Band cache: %s: %s", path, e)
+            layer = map_obj.getLayer(index)
+            layer.data = path
+            layer.setProcessingKey("BANDS", "1")
+            layer.setProjection("init=epsg:3857")
+
+    def render(self, query, params=None):
+        mapscript = self.mapscript
+        if params is None:
+            params = wms_params(query)
+        map_obj = self.maps.get(params.get("MAP", "").upper())
+        if map_obj is None:
+            return 400, "text/plain", b"Unknown MAP\n"
+        # OWSDispatch changes layer status, extent and size: use a copy
+        map_obj = map_obj.clone()
+        crs = (params.get("CRS") or params.get("SRS") or "").upper()
+        if crs in WEBMERC_CRS:
+            self.use_webmerc(map_obj, params["MAP"].upper())
+        request = mapscript.OWSRequest()
+        request.loadParamsFromURL(query)
+        mapscript.msIO_installStdoutToBuffer()
+        try:
+            map_obj.OWSDispatch(request)
+            content_type = mapscript.msIO_stripStdoutBufferContentType()
+            body = mapscript.msIO_getStdoutBufferBytes()
+        finally:
+            mapscript.msIO_resetHandlers()
+        return 200, content_type or "application/octet-stream", body
+
+
+def _init_worker(map_paths, band_cache_dir):
+    global _worker
+    _worker = Worker(map_paths, band_cache_dir)
+
+
+def _render(query, submitted):
+    """Runs in a worker: returns (status, type, body, stats)"""
+    started = time.time()
+    params = wms_params(query)
+    opened = _worker.refresh_datasets(params)
+    map_loads, _worker.map_loads = _worker.map_loads, 0
+    dispatched = time.time()
+    status, content_type, body = _worker.render(query, params)
+    finished = time.time()
+    stats = {
+        "waited": started - submitted,
+        "seconds": finished - started,
+        "opened": opened,
+        "map_loads": map_loads,
+        # MapServer draws and encodes inside OWSDispatch: one stage
+        "stages": {"open": dispatched - started, "dispatch": finished - dispatched},
+    }
+    return status, content_type, body, stats
+
+
+class RendererPool:
+    def __init__(self, map_paths, workers, band_cache_dir=None):
+        self.map_paths = map_paths
+        self.workers = workers
+        self.band_cache_dir = band_cache_dir
+        self.executor = self._start()
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def _start(self):
+        return concurrent.futures.ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_worker,
+            initargs=(self.map_paths, self.band_cache_dir),
+        )
+
+    def _track(self, delta):
+        with self._lock:
+            self.in_flight += delta
+            IN_FLIGHT.set(self.in_flight)
+            QUEUE_DEPTH.set(max(0, self.in_flight - self.workers))
+
+    def warm_up(self):
+        """Start every worker now so no request pays for map loading"""
+        futures = [
+            self.executor.submit(_render, "", time.time()) for _ in range(self.workers)
+        ]
+        for future in futures:
+            _, _, body, stats = future.result()
+            self._record("", stats, len(body))
+
+    def render(self, query):
+        self._track(+1)
+        executor = self.executor
+        try:
+            status, content_type, body, stats = executor.submit(
+                _render, query, time.time()
+            ).result()
+        except concurrent.futures.process.BrokenProcessPool:
+            # A worker crashed inside MapServer: replace the whole pool once
+            with self._lock:
+                if self.executor is executor:
+                    log.error("Render worker died, restarting the pool")
+                    self.executor = self._start()
+            raise
+        finally:
+            self._track(-1)
+        self._record(query, stats, len(body))
+        tracer = trace.current()
+        tracer.add("queue", stats["waited"])
+        for name, seconds in stats["stages"].items():
+            tracer.add(name, seconds)
+        return status, content_type, body
+
+    def _record(self, query, stats, size):
+        params = {k.upper(): v for k, v in parse_qsl(query)}
+        request = params.get("REQUEST", "").lower()
+        RENDER_SECONDS.labels(params.get("MAP", "").upper(), request).observe(
+            stats["seconds"]
+        )
+        if request == "getmap":
+            labels = metrics.wms_labels(params)
+            LAYER_SECONDS.labels(*labels).observe(stats["seconds"])
+            RESPONSE_BYTES.labels(*labels).observe(size)
+        WAIT_SECONDS.observe(stats["waited"])
+        DATASET_OPENS.inc(stats["opened"])
+        MAP_LOADS.inc(stats["map_loads"])
+
+
+class RendererHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    pool = None  # set by main()
+
+    def do_GET(self):
+        query = urlsplit(self.path).query
+        tracer = trace.begin("renderer", self.headers)
+        try:
+            status, content_type, body = self.pool.render(query)
+        except Exception as e:  # a crashed worker must not kill the server
+            log.exception("Render failed")
+            self.send_error(500, str(e))
+            trace.end()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if tracer:
+            self.send_header("Server-Timing", tracer.header())
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        params = {k.upper(): v for k, v in parse_qsl(query)}
+        map_name, layers, _ = metrics.wms_labels(params)
+        tracer.finish(map=map_name, layers=layers)
+        trace.end()
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+class RendererServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    default_dir = DEFAULT_MAP_DIR if os.path.isdir(DEFAULT_MAP_DIR) else REPO_DIR
+    parser.add_argument(
+        "--maps",
+        nargs="+",
+        default=sorted(glob.glob(os.path.join(default_dir, "*.map"))),
+    )
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument(
+        "--band-cache",
+        metavar="DIR",
+        help="Share decoded bands between workers in DIR (perflab.bandcache)",
+    )
+    parser.add_argument("--metrics-port", type=int, default=0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    metrics.start_http_server(args.metrics_port)
+    metrics.label_catalog(args.maps)
+    RendererHandler.pool = RendererPool(args.maps, args.workers, args.band_cache)
+    RendererHandler.pool.warm_up()
+    server = RendererServer(("", args.port), RendererHandler)
+    log.info(
+        "MapScript renderer on :%d with %d workers (%s)",
+        args.port,
+        args.workers,
+        ", ".join(os.path.basename(p) for p in args.maps),
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
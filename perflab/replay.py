@@ -0,0 +1,214 @@
+"""Access-log replay for Locust.
+
+Streams a JSONL capture (the nginx ``wms_json`` access log, or any JSONL
+with ``request``/``uri`` and timing fields) and re-issues its requests
+against the lab. Three pacing modes are supported:
+
+- recorded timing (``--replay-speed 1``, the default)
+- recorded timing compressed N times (``--replay-speed N``)
+- open loop at a fixed rate, ignoring recorded timing (``--replay-rate R``)
+
+Every ReplayUser in a Locust process pulls from one shared schedule, so
+the number of users only bounds concurrency; run enough of them that a
+slow response never delays the next scheduled request. Example::
+
+    locust -f locustfile.py ReplayUser --headless -u 200 -r 200 \\
+        --replay-file /mnt/reports/access.log --replay-speed 4
+"""
+
+import logging
+import re
+import threading
+import time
+
+import gevent
+from locust import HttpUser, constant, events, task
+from locust.exception import StopUser
+
+from perflab import accesslog
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INCLUDE = r"^/(cgi-bin/mapserv|mapcache/)"
+
+_schedule = None
+_schedule_lock = threading.Lock()
+
+
+@events.init_command_line_parser.add_listener
+def _add_arguments(parser):
+    group = parser.add_argument_group("Access-log replay (ReplayUser)")
+    group.add_argument(
+        "--replay-file",
+        default="",
+        env_var="REPLAY_FILE",
+        help="JSONL capture to replay (nginx wms_json log, .gz or - for stdin)",
+    )
+    group.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        env_var="REPLAY_SPEED",
+        help="Replay recorded timing N times faster",
+    )
+    group.add_argument(
+        "--replay-rate",
+        type=float,
+        default=0.0,
+        env_var="REPLAY_RATE",
+        help="Ignore recorded timing and send at this many requests/s",
+    )
+    group.add_argument(
+        "--replay-loop",
+        action="store_true",
+        default=False,
+        env_var="REPLAY_LOOP",
+        help="Start over at the end of the capture",
+    )
+    group.add_argument(
+        "--replay-include",
+        default=DEFAULT_INCLUDE,
+        env_var="REPLAY_INCLUDE",
+        help="Only replay request paths matching this regex",
+    )
+
+
+class ReplaySchedule:
+    """Lazily turns a capture into ``(due_time, uri, name)`` entries"""
+
+    def __init__(self, path, speed=1.0, rate=0.0, loop=False, include=DEFAULT_INCLUDE):
+        self.path = path
+        self.speed = speed if speed > 0 else 1.0
+        self.rate = rate
+        self.loop = loop
+        self.include = re.compile(include)
+        self.t0 = None
+        self.sent = 0
+        self.late = 0
+        # Malformed records skipped (no usable time or request line)
+        self.skipped = 0
+        self.max_lag = 0.0
+        self._entries = self._iter_entries()
+        self._lock = threading.Lock()
+
+    def next(self):
+        """Next entry, or None once the capture is exhausted"""
+        with self._lock:
+            if self.t0 is None:
+                self.t0 = time.time()
+            entry = next(self._entries, None)
+            if entry is None:
+                return None
+            offset, uri, name = entry
+            return self.t0 + offset, uri, name
+
+    def record_lag(self, lag):
+        self.sent += 1
+        if lag > 0.001:
+            self.late += 1
+            self.max_lag = max(self.max_lag, lag)
+
+    def _iter_entries(self):
+        cycle_offset = 0.0
+        n = 0
+        while True:
+            first = None
+            offset = 0.0
+            for record in accesslog.iter_records(self.path):
+                try:
+                    uri = accesslog.request_uri(record)
+                    if not uri or accesslog.request_method(record) != "GET":
+                        continue
+                    if not self.include.search(uri):
+                        continue
+                    name = replay_name(record, uri)
+                except (AttributeError, TypeError, ValueError):
+                    self.skipped += 1
+                    continue
+                if self.rate > 0:
+                    offset = n / self.rate
+                else:
+                    start = accesslog.start_time(record)
+                    if start is None:
+                        self.skipped += 1
+                        continue
+                    if first is None:
+                        first = start
+                    offset = cycle_offset + (start - first) / self.speed
+                n += 1
+                yield offset, uri, name
+            if not self.loop or n == 0:
+                return
+            cycle_offset = offset
+
+
+def replay_name(record, uri):
+    """Locust stats name grouping replayed requests by map and render style"""
+    params = accesslog.query_params(record)
+    if uri.startswith("/mapcache"):
+        layer = record.get("tile_layer") or params.get("LAYERS", "")
+        return f"/replay/mapcache?{layer}"
+    map_name = (record.get("wms_map") or params.get("MAP", "")).lower()
+    request = params.get("REQUEST", "")
+    if request.lower() != "getmap":
+        return f"/replay/{map_name}?{request}"
+    style = record.get("render_style")
+    if not style:
+        layer = params.get("LAYERS", "")
+        style = "gradient"
+        for suffix in ("contour", "numbers"):
+            if layer.endswith("_" + suffix):
+                style = suffix
+    return f"/replay/{map_name}?style={style}"
+
+
+def get_schedule(options):
+    """Process-wide schedule built from the Locust command line options"""
+    global _schedule
+    with _schedule_lock:
+        if _schedule is None and options is not None and options.replay_file:
+            _schedule = ReplaySchedule(
+                options.replay_file,
+                speed=options.replay_speed,
+                rate=options.replay_rate,
+                loop=options.replay_loop,
+                include=options.replay_include,
+            )
+        return _schedule
+
+
+@events.test_stop.add_listener
+def _report(**kwargs):
+    if _schedule is not None and _schedule.sent:
+        log.info(
+            "Replay sent %d requests, %d late (max lag %.3fs), %d bad records skipped",
+            _schedule.sent,
+            _schedule.late,
+            _schedule.max_lag,
+            _schedule.skipped,
+        )
+
+
+class ReplayUser(HttpUser):
+    """Replays a recorded access log at recorded timing, N x speed or a fixed rate"""
+
+    wait_time = constant(0)
+    host = "http://nginx"
+
+    def on_start(self):
+        self.schedule = get_schedule(self.environment.parsed_options)
+        if self.schedule is None:
+            log.warning("ReplayUser needs --replay-file, stopping user")
+            raise StopUser()
+
+    @task
+    def replay(self):
+        entry = self.schedule.next()
+        if entry is None:
+            raise StopUser()
+        due, uri, name = entry
+        delay = due - time.time()
+        if delay > 0:
+            gevent.sleep(delay)
+        self.schedule.record_lag(-delay)
+        self.client.get(uri, name=name)
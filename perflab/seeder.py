@@ -0,0 +1,276 @@
+"""Parallel, resumable MapCache seeder.
+
+Reads the tilesets and grids from mapcache.xml, enumerates one request per
+metatile (MapCache renders and stores the whole 8x8 block on the first
+miss, so asking for more tiles of the same metatile is wasted work), and
+fetches them with a bounded thread pool. Metatiles are ordered by expected
+popularity: everything touching the priority area (CONUS by default),
+low zooms first, then the rest of the world, low zooms first.
+
+Completed metatiles are appended to ``--state`` so an interrupted run picks
+up where it stopped. Progress is logged and exported as Prometheus
+counters with ``--metrics-port``. Example::
+
+    python -m perflab.seeder --base-url http://localhost:8080/mapcache \\
+        --zoom 0-6 --workers 16 --state reports/seed-state.txt
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import http.client
+import logging
+import math
+import os
+import time
+
+from perflab import metrics
+from perflab.mapcache import load_config, tms_path, wmts_path
+from perflab.upstream import Upstream
+
+log = logging.getLogger(__name__)
+
+WORLD_BBOX = (-180.0, -90.0, 180.0, 90.0)
+CONUS_BBOX = (-125.0, 24.0, -66.0, 50.0)
+
+SEED_REQUESTS = metrics.counter(
+    "perflab_seed_metatiles_total",
+    "Metatiles seeded, by outcome",
+    ["tileset", "grid", "z", "outcome"],
+)
+SEED_PENDING = metrics.gauge("perflab_seed_pending", "Metatiles left to seed")
+SEED_SECONDS = metrics.histogram(
+    "perflab_seed_request_seconds",
+    "Time to render and store one metatile",
+    ["tileset", "grid"],
+    buckets=[0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30],
+)
+
+SeedJob = collections.namedtuple("SeedJob", "priority tileset grid z mx my x y")
+
+
+def job_key(job):
+    return f"{job.tileset} {job.grid} {job.z} {job.mx} {job.my}"
+
+
+def parse_bbox(value):
+    bbox = tuple(float(v) for v in value.split(","))
+    if len(bbox) != 4:
+        raise argparse.ArgumentTypeError("bbox must be minx,miny,maxx,maxy")
+    return bbox
+
+
+def parse_zooms(value):
+    """``"3"`` or ``"0-6"`` -> list of zoom levels"""
+    if "-" in value:
+        low, high = value.split("-")
+        return list(range(int(low), int(high) + 1))
+    return [int(value)]
+
+
+def _intersects(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def plan(config, tilesets, grids, zooms, bbox=WORLD_BBOX, priority_bbox=CONUS_BBOX):
+    """All metatile seed jobs inside ``bbox``, sorted by priority"""
+    jobs = []
+    for tileset_name in tilesets:
+        tileset = config.tilesets[tileset_name]
+        sx, sy = tileset.metatile
+        for grid_name in tileset.grids:
+            if grids and grid_name not in grids:
+                continue
+            grid = config.grids[grid_name]
+            area = grid.lonlat_bbox_to_grid(bbox)
+            hot = grid.lonlat_bbox_to_grid(priority_bbox)
+            hot_x, hot_y = (hot[0] + hot[2]) / 2, (hot[1] + hot[3]) / 2
+            width = grid.extent[2] - grid.extent[0]
+            for z in zooms:
+                if z > grid.max_zoom:
+                    continue
+                x0, y0, x1, y1 = grid.tile_range(z, area)
+                span_x, span_y = grid.tile_span(z)
+                for mx in range(x0 // sx, x1 // sx + 1):
+                    for my in range(y0 // sy, y1 // sy + 1):
+                        minx, miny, _, _ = grid.tile_bbox(z, mx * sx, my * sy)
+                        meta = (minx, miny, minx + sx * span_x, miny + sy * span_y)
+                        center_x = (meta[0] + meta[2]) / 2
+                        center_y = (meta[1] + meta[3]) / 2
+                        distance = math.hypot(center_x - hot_x, center_y - hot_y)
+                        priority = (
+                            0 if _intersects(meta, hot) else 1,
+                            z,
+                            distance / width,
+                        )
+                        jobs.append(
+                            SeedJob(
+                                priority,
+                                tileset_name,
+                                grid_name,
+                                z,
+                                mx,
+                                my,
+                                max(mx * sx, x0),
+                                max(my * sy, y0),
+                            )
+                        )
+    jobs.sort(key=lambda job: job.priority)
+    return jobs
+
+
+def load_state(path):
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+class Seeder:
+    def __init__(
+        self,
+        upstream,
+        config,
+        workers=8,
+        service="wmts",
+        retries=2,
+        state_path=None,
+        headers=None,
+    ):
+        self.upstream = upstream
+        self.config = config
+        self.workers = workers
+        self.build_path = wmts_path if service == "wmts" else tms_path
+        self.retries = retries
+        self.state_path = state_path
+        self.headers = headers or {}
+
+    def seed_one(self, job):
+        """Request one tile of the job's metatile; returns (ok, seconds)"""
+        grid = self.config.grids[job.grid]
+        path = self.build_path(job.tileset, grid, job.z, job.x, job.y)
+        start = time.time()
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.upstream.get(path, self.headers)
+                if response.status == 200:
+                    return True, time.time() - start
+            except (OSError, http.client.HTTPException) as e:
+                log.debug("Seeding %s failed: %s", path, e)
+            if attempt < self.retries:
+                time.sleep(0.5 * 2**attempt)
+        return False, time.time() - start
+
+    def run(self, jobs):
+        """Seed ``jobs`` in order, skipping those already in the state file"""
+        done = load_state(self.state_path)
+        pending = [job for job in jobs if job_key(job) not in done]
+        log.info(
+            "Seeding %d metatiles (%d already done) with %d workers",
+            len(pending),
+            len(jobs) - len(pending),
+            self.workers,
+        )
+        SEED_PENDING.set(len(pending))
+        state_file = open(self.state_path, "a") if self.state_path else None
+        counts = collections.Counter()
+        started = last_report = time.time()
+
+        def finish(future):
+            job = futures.pop(future)
+            ok, seconds = future.result()
+            outcome = "ok" if ok else "failed"
+            counts[outcome] += 1
+            SEED_REQUESTS.labels(job.tileset, job.grid, str(job.z), outcome).inc()
+            SEED_SECONDS.labels(job.tileset, job.grid).observe(seconds)
+            SEED_PENDING.dec()
+            if ok and state_file:
+                state_file.write(job_key(job) + "\n")
+                state_file.flush()
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+                futures = {}
+                for job in pending:
+                    if len(futures) >= 2 * self.workers:
+                        completed, _ = concurrent.futures.wait(
+                            futures, return_when=concurrent.futures.FIRST_COMPLETED
+                        )
+                        for future in completed:
+                            finish(future)
+                    futures[pool.submit(self.seed_one, job)] = job
+                    if time.time() - last_report > 10:
+                        last_report = time.time()
+                        self._report(counts, len(pending), started)
+                for future in concurrent.futures.as_completed(list(futures)):
+                    finish(future)
+        finally:
+            if state_file:
+                state_file.close()
+        self._report(counts, len(pending), started)
+        return counts
+
+    def _report(self, counts, total, started):
+        finished = counts["ok"] + counts["failed"]
+        elapsed = time.time() - started
+        rate = finished / elapsed if elapsed else 0.0
+        eta = (total - finished) / rate if rate else 0.0
+        log.info(
+            "%d/%d metatiles (%d failed), %.1f/s, ETA %.0fs",
+            finished,
+            total,
+            counts["failed"],
+            rate,
+            eta,
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--base-url", default="http://localhost:8080/mapcache")
+    parser.add_argument("--mapcache", help="mapcache.xml path")
+    parser.add_argument(
+        "--tileset", action="append", help="Tileset to seed (repeatable, default all)"
+    )
+    parser.add_argument(
+        "--grid", action="append", help="Grid to seed (repeatable, default all)"
+    )
+    parser.add_argument("--zoom", type=parse_zooms, default=parse_zooms("0-6"))
+    parser.add_argument("--bbox", type=parse_bbox, default=WORLD_BBOX)
+    parser.add_argument("--priority-bbox", type=parse_bbox, default=CONUS_BBOX)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--service", choices=["wmts", "tms"], default="wmts")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--state", help="Resume file of completed metatiles")
+    parser.add_argument("--metrics-port", type=int, default=0)
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only print the seeding plan"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    config = load_config(args.mapcache)
+    tilesets = args.tileset or list(config.tilesets)
+    jobs = plan(config, tilesets, args.grid, args.zoom, args.bbox, args.priority_bbox)
+    if args.dry_run:
+        per_level = collections.Counter((j.tileset, j.grid, j.z) for j in jobs)
+        for (tileset, grid, z), count in sorted(per_level.items()):
+            print(f"{tileset}@{grid} z{z}: {count} metatiles")
+        print(f"total: {len(jobs)} metatiles")
+        return 0
+
+    metrics.start_http_server(args.metrics_port)
+    seeder = Seeder(
+        Upstream(args.base_url),
+        config,
+        workers=args.workers,
+        service=args.service,
+        retries=args.retries,
+        state_path=args.state,
+    )
+    counts = seeder.run(jobs)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
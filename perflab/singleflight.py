@@ -0,0 +1,98 @@
+"""Request coalescing ("single-flight") for identical concurrent upstream calls.
+
+Under the aggressive Locust users many clients ask for the same
+LAYERS/BBOX/SIZE at the same moment, and each one used to cost a full
+MapServer render. ``SingleFlight.do`` runs the call once per key; callers
+arriving while it is in flight wait for it and share the result (or the
+exception). Nothing is cached after the call completes, so this only
+removes duplicate concurrent work and never serves stale images.
+
+``wms_key`` builds the key: upper-case parameter names, case-normalized
+enumerated values and a bbox rounded to 9 significant digits, so
+``bbox=-100,30,-80,45&format=IMAGE/PNG`` and
+``BBOX=-100.0,30.0,-80.0,45.0&FORMAT=image/png`` coalesce.
+"""
+
+import threading
+import time
+
+from perflab import metrics
+
+# Parameters whose values are case-insensitive enumerations
+CASELESS_VALUES = {"SERVICE", "REQUEST", "FORMAT", "CRS", "SRS", "TRANSPARENT"}
+
+CALLS = metrics.counter(
+    "perflab_singleflight_requests_total",
+    "Calls by outcome: rendered upstream, or coalesced onto an in-flight call",
+    ["flight", "outcome"],
+)
+CALL_SECONDS = metrics.histogram(
+    "perflab_singleflight_call_seconds",
+    "Duration of calls that went upstream",
+    ["flight"],
+    buckets=[0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+)
+IN_FLIGHT = metrics.gauge(
+    "perflab_singleflight_in_flight", "Distinct calls in flight", ["flight"]
+)
+
+
+def wms_key(params):
+    """Canonical, hashable form of WMS query parameters"""
+    items = []
+    for name, value in params.items():
+        name = name.upper()
+        if name == "BBOX":
+            try:
+                value = ",".join(f"{float(v):.9g}" for v in value.split(","))
+            except ValueError:
+                pass
+        elif name in CASELESS_VALUES:
+            value = value.lower()
+        items.append((name, value))
+    return tuple(sorted(items))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Return ``(fn(), shared)``, running ``fn`` at most once per key at a time"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                IN_FLIGHT.labels(self.name).inc()
+
+        if not leader:
+            CALLS.labels(self.name, "coalesced").inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        start = time.time()
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            IN_FLIGHT.labels(self.name).dec()
+            call.done.set()
+            CALLS.labels(self.name, "rendered").inc()
+            CALL_SECONDS.labels(self.name).observe(time.time() - start)
+        return call.result, False
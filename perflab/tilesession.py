@@ -0,0 +1,213 @@
+"""Slippy-map tile sessions against MapCache's WMTS and TMS services.
+
+TileSessionUser behaves like a Leaflet viewer: it opens a viewport over a
+popular area, then pans and zooms through it, requesting only the grid
+tiles that became visible (center first, a few in parallel, tiles already
+loaded in the session are not fetched again). Tile coordinates come from
+the ``webmerc`` and ``wgs84`` resolution ladders in mapcache.xml, so the
+requests line up with what MapCache actually stores.
+
+At the end of the run a per-zoom summary is logged: nginx cache HIT
+ratio, distinct tiles requested, distinct metatiles touched and the
+metatile amplification (tiles MapCache renders per distinct tile asked for).
+"""
+
+import collections
+import logging
+import math
+
+import gevent.pool
+from locust import HttpUser, between, events, task
+
+from perflab.mapcache import load_config, tms_path, wmts_path
+from perflab.workload import user_rng
+
+log = logging.getLogger(__name__)
+
+# (lon, lat, weight): CONUS dominates, matching viewer.html's default view
+POPULAR_CENTERS = [
+    (-95.0, 38.0, 6),
+    (-122.0, 45.0, 1),
+    (-80.0, 30.0, 1),
+    (-87.0, 42.0, 1),
+    (10.0, 50.0, 1),
+    (-40.0, 35.0, 0.5),
+]
+
+FORMAT_EXTENSIONS = {"PNG": "png", "JPEG": "jpg"}
+
+
+class TileStats:
+    """Cache outcome and metatile footprint per (service, tileset, grid, z)"""
+
+    def __init__(self):
+        self.requests = collections.Counter()
+        self.hits = collections.Counter()
+        self.tiles = collections.defaultdict(set)
+        self.metatiles = collections.defaultdict(set)
+
+    def record(self, service, tileset, grid, z, x, y, cache_status):
+        key = (service, tileset.name, grid.name, z)
+        self.requests[key] += 1
+        if cache_status == "HIT":
+            self.hits[key] += 1
+        self.tiles[key].add((x, y))
+        self.metatiles[key].add(grid.metatile(x, y, tileset.metatile))
+
+    def summary(self, config):
+        lines = [
+            f"{'service':7} {'tileset@grid':22} {'z':>2} {'requests':>9} "
+            f"{'hit%':>6} {'tiles':>7} {'metatiles':>9} {'amplif.':>8}"
+        ]
+        for key in sorted(self.requests):
+            service, tileset_name, grid_name, z = key
+            tileset = config.tilesets[tileset_name]
+            grid = config.grids[grid_name]
+            rendered = sum(
+                grid.metatile_tile_count(z, mx, my, tileset.metatile)
+                for mx, my in self.metatiles[key]
+            )
+            requests = self.requests[key]
+            lines.append(
+                f"{service:7} {tileset_name + '@' + grid_name:22} {z:>2} {requests:>9} "
+                f"{100.0 * self.hits[key] / requests:>6.1f} {len(self.tiles[key]):>7} "
+                f"{len(self.metatiles[key]):>9} {rendered / len(self.tiles[key]):>8.1f}"
+            )
+        return "\n".join(lines)
+
+
+stats = TileStats()
+
+
+@events.test_stop.add_listener
+def _report(**kwargs):
+    if stats.requests:
+        log.info("Tile session summary:\n%s", stats.summary(load_config()))
+
+
+class TileSessionUser(HttpUser):
+    """Pans and zooms a Leaflet-sized viewport over MapCache WMTS/TMS tiles"""
+
+    wait_time = between(0.5, 2.0)
+    host = "http://nginx"
+
+    # Relative weights, override in subclasses to focus a run
+    services = {"wmts": 3, "tms": 1}
+    grids = {"webmerc": 3, "wgs84": 1}
+    tilesets = None  # default: every tileset in mapcache.xml
+    viewport = (1280, 800)
+    start_zoom = (3, 5)
+    session_moves = (10, 40)
+    fetch_concurrency = 6
+
+    def on_start(self):
+        self.config = load_config()
+        self.rng = user_rng(self)
+        self.pool = gevent.pool.Pool(self.fetch_concurrency)
+        self.new_session()
+
+    def new_session(self):
+        """Start over at a popular area with a fresh tileset, grid and service"""
+        names = self.tilesets or list(self.config.tilesets)
+        self.tileset = self.config.tilesets[self.rng.choice(names)]
+        grids = {g: w for g, w in self.grids.items() if g in self.tileset.grids}
+        self.grid = self.config.grids[self.weighted(grids)]
+        self.service = self.weighted(self.services)
+        self.extension = FORMAT_EXTENSIONS.get(self.tileset.format.upper(), "png")
+
+        lon, lat, _ = self.rng.choices(
+            POPULAR_CENTERS, weights=[c[2] for c in POPULAR_CENTERS]
+        )[0]
+        self.center = self.grid.project(lon, lat)
+        self.zoom = min(self.grid.max_zoom, self.rng.randint(*self.start_zoom))
+        self.moves_left = self.rng.randint(*self.session_moves)
+        self.loaded = set()
+        self.load_viewport()
+
+    def weighted(self, weights):
+        names = list(weights)
+        return self.rng.choices(names, weights=[weights[n] for n in names])[0]
+
+    @task(6)
+    def pan(self):
+        span_x, span_y = self.viewport_span()
+        fraction = 0.25 + 0.5 * self.rng.random()
+        angle = 2 * math.pi * self.rng.random()
+        self.move_to(
+            self.center[0] + math.cos(angle) * fraction * span_x,
+            self.center[1] + math.sin(angle) * fraction * span_y,
+        )
+        self.load_viewport()
+        self.end_move()
+
+    @task(2)
+    def zoom_in(self):
+        self.zoom_burst(+1)
+
+    @task(2)
+    def zoom_out(self):
+        self.zoom_burst(-1)
+
+    def zoom_burst(self, direction):
+        """One to three zoom steps in quick succession, like scroll-wheel zooming"""
+        for _ in range(self.rng.randint(1, 3)):
+            zoom = self.zoom + direction
+            if not 0 <= zoom <= self.grid.max_zoom:
+                break
+            self.zoom = zoom
+            self.load_viewport()
+            gevent.sleep(0.1 + 0.2 * self.rng.random())
+        self.end_move()
+
+    def end_move(self):
+        self.moves_left -= 1
+        if self.moves_left <= 0:
+            self.new_session()
+
+    def viewport_span(self):
+        res = self.grid.resolutions[self.zoom]
+        return self.viewport[0] * res, self.viewport[1] * res
+
+    def move_to(self, x, y):
+        minx, miny, maxx, maxy = self.grid.extent
+        self.center = (min(maxx, max(minx, x)), min(maxy, max(miny, y)))
+
+    def visible_tiles(self):
+        span_x, span_y = self.viewport_span()
+        cx, cy = self.center
+        bbox = (cx - span_x / 2, cy - span_y / 2, cx + span_x / 2, cy + span_y / 2)
+        x0, y0, x1, y1 = self.grid.tile_range(self.zoom, bbox)
+        tile_x, tile_y = self.grid.tile_span(self.zoom)
+        tiles = [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+        def distance(tile):
+            tx, ty, _, _ = self.grid.tile_bbox(self.zoom, *tile)
+            return (tx + tile_x / 2 - cx) ** 2 + (ty + tile_y / 2 - cy) ** 2
+
+        return sorted(tiles, key=distance)
+
+    def load_viewport(self):
+        z = self.zoom
+        for x, y in self.visible_tiles():
+            if (z, x, y) in self.loaded:
+                continue
+            self.loaded.add((z, x, y))
+            self.pool.spawn(self.fetch_tile, z, x, y)
+        self.pool.join()
+
+    def fetch_tile(self, z, x, y):
+        build = wmts_path if self.service == "wmts" else tms_path
+        path = build(self.tileset.name, self.grid, z, x, y, self.extension)
+        response = self.client.get(
+            "/mapcache" + path,
+            name=f"/mapcache/{self.service}/{self.tileset.name}@{self.grid.name}/z{z}",
+        )
+        stats.record(
+            self.service,
+            self.tileset,
+            self.grid,
+            z,
+            x,
+            y,
+            response.headers.get("X-Cache-Status", ""),
+        )
@@ -0,0 +1,356 @@
+"""Content-addressed tile store: every distinct tile image is stored once.
+
+MRMS reflectivity and precipitation tiles are mostly fully transparent, and
+many ocean GFS tiles are a single color. A cache with one file per tile
+(MapCache ``disk``) stores the same bytes thousands of times, one inode
+each. ``TileStore`` keeps everything in one SQLite file:
+
+- ``blobs``: tile image by content hash, with a reference count
+- ``tiles``: (tileset, z, x, y) -> hash, data version, creation time and
+  last use
+
+Tiles of a single RGBA color all map to one sentinel key per color and
+size, ``U`` + RGBA + width + height, whatever bytes the encoder produced.
+The store is bounded by the bytes of its distinct blobs. Above the bound
+the least recently used tiles are dropped, and blobs nobody references
+any more go with them. Entries of another data version (wmsproxy passes
+the mtime of the layers' files) or older than ``max_age`` (MapCache's
+``<expires>``) count as misses, so new data shows up, also after a restart.
+
+wmsproxy uses it behind its in-memory LRU with ``--tile-store``. To see
+what deduplication would save on a MapCache disk cache::
+
+    python -m perflab.tilestore --scan /tmp/cache
+"""
+
+import argparse
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from PIL import Image
+
+from perflab import metrics
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE = 3600
+# Tiles dropped per eviction pass, oldest use first
+EVICT_BATCH = 256
+# Last-use updates are written in batches of this many lookups
+TOUCH_BATCH = 1024
+UNIFORM = b"U"
+# PRAGMA user_version of the schema below; older stores are recreated
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tilesets (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    grid TEXT NOT NULL,
+    UNIQUE (name, grid)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash BLOB PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    refs INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tiles (
+    tileset INTEGER NOT NULL,
+    z INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    hash BLOB NOT NULL,
+    version INTEGER NOT NULL,
+    created REAL NOT NULL,
+    used INTEGER NOT NULL,
+    PRIMARY KEY (tileset, z, x, y)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tiles_used ON tiles (used);
+"""
+
+LOOKUPS = metrics.counter(
+    "perflab_tilestore_lookups_total",
+    "Tile store lookups, by outcome (hit, miss, stale, expired)",
+    ["outcome"],
+)
+PUTS = metrics.counter(
+    "perflab_tilestore_puts_total",
+    "Tiles stored, by kind (new blob, duplicate of a stored blob, uniform)",
+    ["kind"],
+)
+STORE_BYTES = metrics.gauge(
+    "perflab_tilestore_bytes", "Bytes of distinct tile images in the store"
+)
+EVICTIONS = metrics.counter(
+    "perflab_tilestore_evictions_total", "Tiles evicted from the tile store"
+)
+
+
+def uniform_color(data):
+    """``((r, g, b, a), size)`` if every pixel of the image is the same, else None"""
+    with Image.open(io.BytesIO(data)) as image:
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+        extrema = image.getextrema()
+        if any(low != high for low, high in extrema):
+            return None
+        return tuple(low for low, _ in extrema), image.size
+
+
+def content_hash(data):
+    """Store key of a tile image: a sentinel for uniform tiles, else BLAKE2b"""
+    try:
+        uniform = uniform_color(data)
+    except OSError:
+        uniform = None
+    if uniform is not None:
+        (r, g, b, a), (width, height) = uniform
+        return (
+            UNIFORM
+            + bytes((r, g, b, a))
+            + width.to_bytes(2, "big")
+            + height.to_bytes(2, "big")
+        )
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class TileStore:
+    def __init__(self, path, max_bytes, max_age=DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._db.executescript(
+                "DROP TABLE IF EXISTS tiles; DROP TABLE IF EXISTS blobs; "
+                "DROP TABLE IF EXISTS tilesets;"
+            )
+            self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._tilesets = dict(
+            ((name, grid), tileset_id)
+            for tileset_id, name, grid in self._db.execute("SELECT * FROM tilesets")
+        )
+        self.bytes = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM blobs"
+        ).fetchone()[0]
+        # Logical clock for LRU order, persisted through ``tiles.used``
+        self._clock = self._db.execute(
+            "SELECT COALESCE(MAX(used), 0) FROM tiles"
+        ).fetchone()[0]
+        self._touched = {}
+        STORE_BYTES.set(self.bytes)
+
+    def _tileset(self, name, grid):
+        key = (name, grid)
+        if key not in self._tilesets:
+            self._db.execute(
+                "INSERT OR IGNORE INTO tilesets (name, grid) VALUES (?, ?)", key
+            )
+            self._tilesets[key] = self._db.execute(
+                "SELECT id FROM tilesets WHERE name = ? AND grid = ?", key
+            ).fetchone()[0]
+        return self._tilesets[key]
+
+    def get(self, tileset, grid, z, x, y, version=0):
+        """``(image bytes, creation time)``, or None if missing, of another
+        data ``version`` or older than ``max_age``
+        """
+        with self._lock:
+            tileset_id = self._tileset(tileset, grid)
+            row = self._db.execute(
+                "SELECT blobs.data, tiles.version, tiles.created "
+                "FROM tiles JOIN blobs USING (hash) "
+                "WHERE tileset = ? AND z = ? AND x = ? AND y = ?",
+                (tileset_id, z, x, y),
+            ).fetchone()
+            if row is None:
+                LOOKUPS.labels("miss").inc()
+                return None
+            data, stored_version, created = row
+            if stored_version != version:
+                LOOKUPS.labels("stale").inc()
+                return None
+            if created < time.time() - self.max_age:
+                LOOKUPS.labels("expired").inc()
+                return None
+            self._clock += 1
+            self._touched[(tileset_id, z, x, y)] = self._clock
+            if len(self._touched) >= TOUCH_BATCH:
+                self._flush_touched()
+                self._db.commit()
+        LOOKUPS.labels("hit").inc()
+        return data, created
+
+    def put(self, tileset, grid, z, x, y, data, version=0):
+        """Store a tile image; returns the number of tiles evicted"""
+        digest = content_hash(data)
+        with self._lock:
+            tileset_id = self._tileset(tileset, grid)
+            key = (tileset_id, z, x, y)
+            self._release(key)
+            stored = self._db.execute(
+                "SELECT size FROM blobs WHERE hash = ?", (digest,)
+            ).fetchone()
+            if stored is None:
+                self._db.execute(
+                    "INSERT INTO blobs VALUES (?, ?, ?, 1)", (digest, data, len(data))
+                )
+                self.bytes += len(data)
+            elif len(data) < stored[0]:
+                # A uniform tile: keep the smallest encoding of the color
+                self._db.execute(
+                    "UPDATE blobs SET refs = refs + 1, data = ?, size = ? "
+                    "WHERE hash = ?",
+                    (data, len(data), digest),
+                )
+                self.bytes -= stored[0] - len(data)
+            else:
+                self._db.execute(
+                    "UPDATE blobs SET refs = refs + 1 WHERE hash = ?", (digest,)
+                )
+            if digest.startswith(UNIFORM):
+                PUTS.labels("uniform").inc()
+            else:
+                PUTS.labels("duplicate" if stored else "new").inc()
+            self._clock += 1
+            self._touched.pop(key, None)
+            self._db.execute(
+                "INSERT INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                key + (digest, version, time.time(), self._clock),
+            )
+            evicted = self._evict() if self.bytes > self.max_bytes else 0
+            self._db.commit()
+        STORE_BYTES.set(self.bytes)
+        return evicted
+
+    def _release(self, key):
+        """Drop the tile at ``key`` and its blob reference, if any"""
+        row = self._db.execute(
+            "DELETE FROM tiles WHERE tileset = ? AND z = ? AND x = ? AND y = ? "
+            "RETURNING hash",
+            key,
+        ).fetchone()
+        if row is None:
+            return
+        self._db.execute("UPDATE blobs SET refs = refs - 1 WHERE hash = ?", row)
+        freed = self._db.execute(
+            "DELETE FROM blobs WHERE hash = ? AND refs <= 0 RETURNING size", row
+        ).fetchone()
+        if freed:
+            self.bytes -= freed[0]
+
+    def _flush_touched(self):
+        self._db.executemany(
+            "UPDATE tiles SET used = ? WHERE tileset = ? AND z = ? AND x = ? AND y = ?",
+            [(used,) + key for key, used in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def _evict(self):
+        self._flush_touched()
+        evicted = 0
+        while self.bytes > self.max_bytes:
+            keys = self._db.execute(
+                "SELECT tileset, z, x, y FROM tiles ORDER BY used LIMIT ?",
+                (EVICT_BATCH,),
+            ).fetchall()
+            if not keys:
+                break
+            for key in keys:
+                self._release(key)
+                evicted += 1
+                if self.bytes <= self.max_bytes:
+                    break
+        EVICTIONS.inc(evicted)
+        return evicted
+
+    def stats(self):
+        """Tile and blob counts, and bytes with and without deduplication"""
+        with self._lock:
+            tiles, logical, uniform = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), "
+                "COALESCE(SUM(substr(hash, 1, 1) = ?), 0) "
+                "FROM tiles JOIN blobs USING (hash)",
+                (UNIFORM,),
+            ).fetchone()
+            blobs = self._db.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        return {
+            "tiles": tiles,
+            "blobs": blobs,
+            "uniform_tiles": uniform,
+            "tile_bytes": logical,
+            "bytes": self.bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._db.commit()
+            self._db.close()
+
+
+def scan(directory, extensions=(".png", ".jpg", ".jpeg", ".webp")):
+    """What content addressing would save on a one-file-per-tile cache"""
+    files = total = uniform = 0
+    blobs = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            if not name.lower().endswith(extensions) or os.path.islink(path):
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            digest = content_hash(data)
+            files += 1
+            total += len(data)
+            uniform += digest.startswith(UNIFORM)
+            blobs.setdefault(digest, len(data))
+    return {
+        "tiles": files,
+        "blobs": len(blobs),
+        "uniform_tiles": uniform,
+        "tile_bytes": total,
+        "bytes": sum(blobs.values()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--store", help="Print the statistics of a tile store")
+    group.add_argument("--scan", metavar="DIR", help="Analyse a MapCache disk cache")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    if args.scan:
+        stats = scan(args.scan)
+    else:
+        store = TileStore(args.store, max_bytes=float("inf"))
+        stats = store.stats()
+        store.close()
+    print(
+        f"{stats['tiles']} tiles, {stats['blobs']} distinct images "
+        f"({stats['tiles'] / max(stats['blobs'], 1):.1f} tiles per image)"
+    )
+    print(
+        f"{stats['tile_bytes'] / 2**20:.1f} MiB as one file per tile, "
+        f"{stats['bytes'] / 2**20:.1f} MiB content-addressed"
+    )
+    print(f"{stats['uniform_tiles']} tiles of a single color")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,219 @@
+"""Time-slider Locust user: animates GFS layers through their forecast hours.
+
+TimeSliderUser behaves like a viewer's play button. It reads the layers'
+``time`` and ``reference_time`` dimensions from GetCapabilities
+(perflab.ingest.timeindex writes them). It then picks a layer and a view
+and requests one GetMap per timestep of the latest run, f000 through f384,
+at up to ``--time-slider-fps`` frames per second. A frame is not requested
+before the previous one has loaded.
+
+Frames are reported as ``/wms/gfs?time_slider&frames=N``, and every
+complete animation also as an ``ANIM`` row with its total duration. Runs
+with different ``--time-slider-frames`` therefore show how latency scales
+with the number of timesteps.
+"""
+
+import datetime
+import logging
+import re
+import time
+import xml.etree.ElementTree as ET
+from urllib.parse import urlencode
+
+import gevent
+from locust import HttpUser, between, events, task
+from locust.exception import StopUser
+
+from perflab.workload import user_rng
+
+log = logging.getLogger(__name__)
+
+WMS_NS = "{http://www.opengis.net/wms}"
+PERIOD = re.compile(
+    r"^P(?:(?P<days>\d+)D)?(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?"
+    r"(?:(?P<seconds>\d+)S)?)?$"
+)
+VIEWS = [
+    ("-125,25,-65,50", "1024x512"),
+    ("-105,30,-85,45", "768x576"),
+    ("-180,-90,180,90", "1024x512"),
+]
+
+_timelines = {}
+
+
+@events.init_command_line_parser.add_listener
+def _add_arguments(parser):
+    group = parser.add_argument_group("Time slider (TimeSliderUser)")
+    group.add_argument(
+        "--time-slider-frames",
+        type=int,
+        default=0,
+        env_var="TIME_SLIDER_FRAMES",
+        help="Timesteps per animation, from f000 (0 = every timestep)",
+    )
+    group.add_argument(
+        "--time-slider-fps",
+        type=float,
+        default=4.0,
+        env_var="TIME_SLIDER_FPS",
+        help="Maximum frames per second",
+    )
+
+
+def parse_time(value):
+    return datetime.datetime.strptime(value.strip(), "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=datetime.timezone.utc
+    )
+
+
+def format_time(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_period(value):
+    match = PERIOD.match(value.strip())
+    if not match or not any(match.groupdict().values()):
+        raise ValueError(f"unsupported period {value!r}")
+    return datetime.timedelta(
+        **{k: int(v) for k, v in match.groupdict().items() if v is not None}
+    )
+
+
+def expand_extent(extent):
+    """WMS time extent (list and/or ``start/end/period`` ranges) -> sorted datetimes"""
+    times = set()
+    for item in extent.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if "/" not in item:
+            times.add(parse_time(item))
+            continue
+        start, end, period = item.split("/")
+        current, end, step = parse_time(start), parse_time(end), parse_period(period)
+        while current <= end:
+            times.add(current)
+            current += step
+    return sorted(times)
+
+
+def timelines(capabilities):
+    """``{layer: (latest reference time or None, [valid times])}`` from WMS 1.3.0 XML"""
+    result = {}
+    root = ET.fromstring(capabilities)
+    for layer in root.iter(f"{WMS_NS}Layer"):
+        name = layer.findtext(f"{WMS_NS}Name")
+        dimensions = {
+            d.get("name"): (d.text or "", d.get("default"))
+            for d in layer.findall(f"{WMS_NS}Dimension")
+        }
+        if not name or "time" not in dimensions:
+            continue
+        times = expand_extent(dimensions["time"][0])
+        reference = None
+        if "reference_time" in dimensions:
+            extent, default = dimensions["reference_time"]
+            runs = expand_extent(extent)
+            reference = parse_time(default) if default else runs[-1]
+            # Animate the selected run: its valid times start at the reference time
+            times = [t for t in times if t >= reference]
+        if times:
+            result[name] = (reference, times)
+    return result
+
+
+class TimeSliderUser(HttpUser):
+    """Plays forecast-hour animations of the time-enabled GFS layers"""
+
+    wait_time = between(2.0, 6.0)
+    host = "http://nginx"
+    path = "/cgi-bin/mapserv"
+    map_name = "GFS"
+    layers = None  # default: every layer with a time dimension
+
+    def on_start(self):
+        if self.map_name not in _timelines:
+            response = self.client.get(
+                f"{self.path}?"
+                + urlencode(
+                    {
+                        "MAP": self.map_name,
+                        "SERVICE": "WMS",
+                        "VERSION": "1.3.0",
+                        "REQUEST": "GetCapabilities",
+                    }
+                ),
+                name=f"/wms/{self.map_name.lower()}?GetCapabilities",
+            )
+            try:
+                _timelines[self.map_name] = timelines(response.content)
+            except ET.ParseError:
+                _timelines[self.map_name] = {}
+        self.timelines = {
+            name: timeline
+            for name, timeline in _timelines[self.map_name].items()
+            if self.layers is None or name in self.layers
+        }
+        if not self.timelines:
+            log.warning(
+                "No %s layer has a TIME dimension; run perflab.ingest.timeindex "
+                "--rewrite and rebuild mapserver",
+                self.map_name,
+            )
+            raise StopUser()
+        options = self.environment.parsed_options
+        self.max_frames = getattr(options, "time_slider_frames", 0)
+        self.frame_interval = 1.0 / max(0.1, getattr(options, "time_slider_fps", 4.0))
+        self.rng = user_rng(self)
+
+    @task
+    def animate(self):
+        layer = self.rng.choice(sorted(self.timelines))
+        reference, times = self.timelines[layer]
+        if self.max_frames:
+            times = times[: self.max_frames]
+        bbox, size = self.rng.choice(VIEWS)
+        width, height = size.split("x")
+        params = {
+            "MAP": self.map_name,
+            "SERVICE": "WMS",
+            "VERSION": "1.1.1",
+            "REQUEST": "GetMap",
+            "LAYERS": layer,
+            "STYLES": "",
+            "SRS": "EPSG:4326",
+            "BBOX": bbox,
+            "WIDTH": width,
+            "HEIGHT": height,
+            "FORMAT": "image/png",
+            "TRANSPARENT": "TRUE",
+        }
+        if reference is not None:
+            params["DIM_REFERENCE_TIME"] = format_time(reference)
+        name = f"/wms/{self.map_name.lower()}?time_slider&frames={len(times)}"
+
+        start = time.time()
+        failed = None
+        for valid in times:
+            frame_start = time.time()
+            params["TIME"] = format_time(valid)
+            with self.client.get(
+                f"{self.path}?{urlencode(params)}", name=name, catch_response=True
+            ) as response:
+                content_type = response.headers.get("Content-Type", "")
+                if response.ok and not content_type.startswith("image/"):
+                    # MapServer reports a TIME outside the extent as an XML exception
+                    response.failure(f"not an image: {content_type}")
+                    failed = failed or "exception"
+                elif not response.ok:
+                    failed = failed or f"HTTP {response.status_code}"
+            gevent.sleep(max(0.0, self.frame_interval - (time.time() - frame_start)))
+        events.request.fire(
+            request_type="ANIM",
+            name=f"{layer} x{len(times)}",
+            response_time=(time.time() - start) * 1000,
+            response_length=len(times),
+            exception=failed,
+            context={},
+        )
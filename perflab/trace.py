@@ -0,0 +1,184 @@
+"""Sampled per-request render stage timing.
+
+A sampled request carries a ``Trace``. Code on the render path wraps its
+stages in ``trace.stage("warp")``, ``trace.stage("encode")`` and so on. An
+unsampled request gets a no-op trace, so the instrumentation costs almost
+nothing in production and MapServer can run without ``DEBUG 5`` or
+``CPL_DEBUG``.
+
+A fraction PERFLAB_TRACE_SAMPLE of requests is sampled (default 0.01). So
+is every request with an ``X-Perflab-Trace: 1`` header, and that header is
+forwarded upstream so the whole chain traces the same request. A sampled
+request produces:
+
+- a ``Server-Timing`` response header (``warp;dur=12.3, encode;dur=4.1``)
+  that shows up in the browser's network panel and in curl
+- one JSON line on the ``perflab.trace`` logger
+- observations in ``perflab_stage_seconds{component,stage}``
+
+Stages that run in several worker threads for one request (the proxy's
+tile renders) add up, so their sum can exceed the wall-clock ``total``.
+"""
+
+import contextlib
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from perflab import metrics
+
+log = logging.getLogger(__name__)
+
+SAMPLE_HEADER = "X-Perflab-Trace"
+DEFAULT_SAMPLE_RATE = 0.01
+
+STAGE_SECONDS = metrics.histogram(
+    "perflab_stage_seconds",
+    "Time spent per render stage of sampled requests",
+    ["component", "stage"],
+    buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5],
+)
+
+_local = threading.local()
+
+
+def sample_rate():
+    try:
+        return float(os.environ.get("PERFLAB_TRACE_SAMPLE", DEFAULT_SAMPLE_RATE))
+    except ValueError:
+        return DEFAULT_SAMPLE_RATE
+
+
+class Trace:
+    def __init__(self, component):
+        self.component = component
+        self.stages = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return True
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_header(self, value, prefix):
+        """Fold an upstream ``Server-Timing`` header in as ``prefix + stage``"""
+        for item in (value or "").split(","):
+            name, _, params = item.strip().partition(";")
+            for param in params.split(";"):
+                key, _, dur = param.strip().partition("=")
+                if key == "dur" and name != "total":
+                    try:
+                        self.add(prefix + name, float(dur) / 1000)
+                    except ValueError:
+                        pass
+
+    def header(self):
+        total = time.perf_counter() - self.started
+        with self._lock:
+            items = list(self.stages.items())
+        items.append(("total", total))
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in items)
+
+    def finish(self, **fields):
+        """Record the stages in metrics and the trace log"""
+        total = time.perf_counter() - self.started
+        with self._lock:
+            stages = dict(self.stages)
+        for name, seconds in stages.items():
+            STAGE_SECONDS.labels(self.component, name).observe(seconds)
+        log.info(
+            json.dumps(
+                {
+                    "component": self.component,
+                    "total_ms": round(total * 1000, 2),
+                    "stages_ms": {k: round(v * 1000, 2) for k, v in stages.items()},
+                    **fields,
+                },
+                separators=(",", ":"),
+            )
+        )
+
+
+class _NullTrace:
+    component = None
+    stages = {}
+
+    def __bool__(self):
+        return False
+
+    def stage(self, name):
+        return contextlib.nullcontext()
+
+    def add(self, name, seconds):
+        pass
+
+    def add_header(self, value, prefix):
+        pass
+
+    def header(self):
+        return ""
+
+    def finish(self, **fields):
+        pass
+
+
+NULL = _NullTrace()
+
+
+def begin(component, headers=None, rate=None):
+    """Start this thread's trace for a new request; returns it (NULL if unsampled)"""
+    forced = headers is not None and headers.get(SAMPLE_HEADER) == "1"
+    rate = sample_rate() if rate is None else rate
+    _local.trace = Trace(component) if forced or random.random() < rate else NULL
+    return _local.trace
+
+
+def end():
+    _local.trace = NULL
+
+
+def current():
+    return getattr(_local, "trace", NULL)
+
+
+def stage(name):
+    """Context manager timing ``name`` in the current trace"""
+    return current().stage(name)
+
+
+def bind(fn):
+    """Wrap ``fn`` to run under the caller's trace in another thread"""
+    tracer = current()
+    if not tracer:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = current()
+        _local.trace = tracer
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.trace = previous
+
+    return wrapper
+
+
+def upstream_headers():
+    """Headers asking the next hop to trace the current request too"""
+    return {SAMPLE_HEADER: "1"} if current() else {}
@@ -0,0 +1,66 @@
+"""Minimal keep-alive HTTP client for talking to nginx, MapCache and MapServer.
+
+Each thread keeps one persistent connection per Upstream, so worker pools
+reuse TCP connections without pulling in a third-party HTTP library.
+"""
+
+import collections
+import http.client
+import threading
+from urllib.parse import urlsplit
+
+Response = collections.namedtuple("Response", "status headers body")
+# What a keep-alive connection the server has closed fails with. Timeouts are
+# not retried: the request may still be running upstream.
+STALE_CONNECTION = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError)
+
+
+class Upstream:
+    def __init__(self, base_url, timeout=60):
+        parts = urlsplit(base_url)
+        self.base_url = base_url.rstrip("/")
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = (
+                http.client.HTTPSConnection
+                if self.https
+                else http.client.HTTPConnection
+            )
+            conn = cls(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def get(self, path, headers=None):
+        """GET ``path`` below the base URL.
+
+        A keep-alive connection closed by the server (``STALE_CONNECTION``)
+        is retried once on a fresh connection; other errors, timeouts
+        included, propagate.
+        """
+        return self.request("GET", path, headers)
+
+    def request(self, method, path, headers=None):
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, self.prefix + path, headers=headers or {})
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                self._local.conn = None
+                if attempt or not isinstance(e, STALE_CONNECTION):
+                    raise
+                continue
+            if response.will_close:
+                conn.close()
+                self._local.conn = None
+            return Response(response.status, response.headers, body)
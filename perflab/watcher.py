@@ -0,0 +1,352 @@
+"""Invalidate and reseed only the MapCache tilesets whose data changed.
+
+Polls every DATA file referenced by the mapfiles. When a file changes (new
+mtime or size, stable for one poll so half-written downloads are ignored)
+the watcher:
+
+1. maps the file to the layers that read it, and the layers to the
+   tilesets whose MapCache source renders them
+2. moves those tilesets' directories out of the MapCache disk cache, so
+   the next request renders from the new data, and with ``--nginx-cache``
+   deletes their tiles from nginx's proxy_cache too (without it, tiles
+   outside the hot set stay stale for up to ``proxy_cache_valid``, 1h)
+3. re-requests the hottest tiles of each tileset, ranked by frequency in
+   the tail of the nginx access log, with ``X-Cache-Refresh: 1`` so nginx
+   bypasses and replaces its own cached copy
+4. optionally seeds low zoom levels (``--seed-zoom``) for tiles the log
+   has not seen yet
+5. with ``--proxy-url``, drops the layers' tiles from the wmsproxy tile
+   cache (``POST /invalidate``)
+
+Example::
+
+    python -m perflab.watcher --cache-base /tmp/cache \\
+        --access-log /var/log/nginx/access.log --base-url http://nginx
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import glob
+import http.client
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from urllib.parse import parse_qs, parse_qsl, urlencode, urlsplit
+
+from perflab import accesslog, catalog, metrics
+from perflab.mapcache import load_config
+from perflab.seeder import Seeder, parse_zooms, plan
+from perflab.upstream import Upstream
+
+log = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REFRESH_HEADERS = {"X-Cache-Refresh": "1"}
+
+DATA_UPDATES = metrics.counter(
+    "perflab_watcher_data_updates_total", "Data file updates detected", ["path"]
+)
+INVALIDATIONS = metrics.counter(
+    "perflab_watcher_invalidations_total", "Tileset cache invalidations", ["tileset"]
+)
+RESEEDS = metrics.counter(
+    "perflab_watcher_reseed_requests_total",
+    "Hot tiles re-requested after an invalidation",
+    ["tileset", "outcome"],
+)
+REFRESH_SECONDS = metrics.histogram(
+    "perflab_watcher_refresh_seconds",
+    "Time from detecting new data to finishing the hot-tile reseed",
+    ["tileset"],
+    buckets=[1, 5, 10, 30, 60, 120, 300, 600],
+)
+
+
+def data_layers(map_paths):
+    """``{data path: {(MAP name, layer name), ...}}`` for the given mapfiles"""
+    result = collections.defaultdict(set)
+    for layer in catalog.load(map_paths):
+        # A rewritten tile index (perflab.ingest.timeindex) means new timesteps
+        for data in layer.files + ([layer.tileindex] if layer.tileindex else []):
+            result[data].add((layer.map, layer.name))
+    return result
+
+
+def source_layers(config, tileset_name):
+    """``{(MAP name, layer name)}`` rendered by a tileset's source"""
+    tileset = config.tilesets[tileset_name]
+    source = config.sources.get(tileset.source)
+    if source is None:
+        return set()
+    query = parse_qs(urlsplit(source.url).query)
+    map_name = query.get("MAP", [""])[0].upper()
+    layers = source.params.get("LAYERS", "")
+    return {(map_name, layer) for layer in layers.split(",") if layer}
+
+
+def affected_tilesets(config, layers):
+    return sorted(
+        name for name in config.tilesets if source_layers(config, name) & set(layers)
+    )
+
+
+def tileset_of_uri(uri):
+    """Tileset addressed by a /mapcache/ request (WMTS, TMS or WMS)"""
+    parts = urlsplit(uri)
+    segments = parts.path.split("/")
+    # /mapcache/wmts/1.0.0/<tileset>/... and /mapcache/tms/1.0.0/<tileset>@<grid>/...
+    if len(segments) > 4 and segments[2] in ("wmts", "tms") and segments[3] == "1.0.0":
+        return segments[4].split("@")[0]
+    params = {k.upper(): v for k, v in parse_qsl(parts.query)}
+    return params.get("LAYERS") or None
+
+
+def hot_tiles(access_log, window_bytes=64 * 1024 * 1024, limit=500):
+    """``{tileset: [uri, ...]}``, most requested first, from the log's tail"""
+    counts = collections.defaultdict(collections.Counter)
+    try:
+        f = open(access_log, "rb")
+    except OSError:
+        return {}
+    with f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - window_bytes))
+        if f.tell():
+            f.readline()  # skip the partial first line
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") != 200:
+                continue
+            uri = accesslog.request_uri(record)
+            if not uri or not uri.startswith("/mapcache/"):
+                continue
+            tileset = tileset_of_uri(uri)
+            if tileset:
+                counts[tileset][uri] += 1
+    return {
+        tileset: [uri for uri, _ in counter.most_common(limit)]
+        for tileset, counter in counts.items()
+    }
+
+
+def purge_nginx_cache(cache_dir, tilesets):
+    """Delete nginx proxy_cache files of ``tilesets``; returns the count
+
+    Each cache file starts with a binary header and a ``KEY: <key>`` line.
+    nginx treats a missing file as a miss and fetches the tile again.
+    """
+    purged = 0
+    for root, _, names in os.walk(cache_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                with open(path, "rb") as f:
+                    head = f.read(4096)
+            except OSError:
+                continue
+            start = head.find(b"\nKEY: ")
+            if start < 0:
+                continue
+            key = head[start + 6 :].split(b"\n", 1)[0].decode(errors="replace")
+            uri = key[key.find("/mapcache/") :] if "/mapcache/" in key else ""
+            if uri and tileset_of_uri(uri) in tilesets:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                purged += 1
+    return purged
+
+
+def invalidate_tileset(cache_base, tileset):
+    """Move a tileset out of the disk cache and delete it in the background"""
+    path = os.path.join(cache_base, tileset)
+    if not os.path.isdir(path):
+        return False
+    stale = f"{path}.stale-{time.time_ns()}"
+    os.rename(path, stale)
+    threading.Thread(target=shutil.rmtree, args=(stale, True), daemon=True).start()
+    return True
+
+
+class DataWatcher:
+    """Detects changed files by (mtime, size), once they stop changing"""
+
+    def __init__(self, paths):
+        self.paths = sorted(paths)
+        self.signatures = {}
+        self.pending = {}
+
+    @staticmethod
+    def signature(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def poll(self):
+        changed = []
+        for path in self.paths:
+            sig = self.signature(path)
+            if path not in self.signatures:
+                self.signatures[path] = sig
+            elif sig == self.signatures[path]:
+                self.pending.pop(path, None)
+            elif self.pending.get(path) == sig:
+                self.signatures[path] = sig
+                del self.pending[path]
+                if sig is not None:
+                    changed.append(path)
+            else:
+                self.pending[path] = sig
+        return changed
+
+
+class Refresher:
+    def __init__(self, args):
+        self.config = load_config(args.mapcache)
+        self.layers_by_path = data_layers(args.maps)
+        self.cache_base = args.cache_base
+        self.nginx_cache = args.nginx_cache
+        self.access_log = args.access_log
+        self.hot_limit = args.hot
+        self.seed_zoom = args.seed_zoom
+        self.workers = args.workers
+        self.upstream = Upstream(args.base_url)
+        self.mapcache = Upstream(args.base_url + "/mapcache")
+        self.proxy = Upstream(args.proxy_url) if args.proxy_url else None
+
+    def handle(self, paths):
+        detected = time.time()
+        layers = set()
+        for path in paths:
+            DATA_UPDATES.labels(path).inc()
+            layers |= self.layers_by_path.get(path, set())
+        tilesets = affected_tilesets(self.config, layers)
+        log.info("New data in %s -> tilesets %s", ", ".join(paths), tilesets or "none")
+        if self.proxy is not None:
+            self.invalidate_proxy(layers)
+        for tileset in tilesets:
+            if invalidate_tileset(self.cache_base, tileset):
+                INVALIDATIONS.labels(tileset).inc()
+        if not tilesets:
+            return
+        if self.nginx_cache:
+            purged = purge_nginx_cache(self.nginx_cache, set(tilesets))
+            log.info("nginx: purged %d cached tiles", purged)
+
+        hot = (
+            hot_tiles(self.access_log, limit=self.hot_limit) if self.access_log else {}
+        )
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            for tileset in tilesets:
+                uris = hot.get(tileset, [])
+                outcomes = collections.Counter(pool.map(self.refresh, uris))
+                for outcome, count in outcomes.items():
+                    RESEEDS.labels(tileset, outcome).inc(count)
+                log.info(
+                    "%s: refreshed %d hot tiles %s", tileset, len(uris), dict(outcomes)
+                )
+                REFRESH_SECONDS.labels(tileset).observe(time.time() - detected)
+
+        if self.seed_zoom:
+            seeder = Seeder(
+                self.mapcache,
+                self.config,
+                workers=self.workers,
+                headers=REFRESH_HEADERS,
+            )
+            seeder.run(plan(self.config, tilesets, None, self.seed_zoom))
+
+    def invalidate_proxy(self, layers):
+        by_map = collections.defaultdict(list)
+        for map_name, layer in sorted(layers):
+            by_map[map_name].append(layer)
+        for map_name, names in by_map.items():
+            query = urlencode({"MAP": map_name, "LAYERS": ",".join(names)})
+            try:
+                response = self.proxy.request("POST", "/invalidate?" + query)
+            except (OSError, http.client.HTTPException) as e:
+                log.warning("wmsproxy invalidation of %s failed: %s", map_name, e)
+                continue
+            log.info(
+                "wmsproxy: dropped %s cached tiles of %s %s",
+                response.body.decode().strip(),
+                map_name,
+                ",".join(names),
+            )
+
+    def refresh(self, uri):
+        try:
+            response = self.upstream.get(uri, REFRESH_HEADERS)
+        except OSError:
+            return "failed"
+        return "ok" if response.status == 200 else "failed"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--maps", nargs="+", default=sorted(glob.glob(os.path.join(REPO_DIR, "*.map")))
+    )
+    parser.add_argument("--mapcache", help="mapcache.xml path")
+    parser.add_argument(
+        "--cache-base", help="MapCache disk cache <base> (default from mapcache.xml)"
+    )
+    parser.add_argument(
+        "--nginx-cache", help="nginx proxy_cache_path to purge, e.g. /var/cache/nginx"
+    )
+    parser.add_argument("--access-log", default="/var/log/nginx/access.log")
+    parser.add_argument("--base-url", default="http://nginx")
+    parser.add_argument(
+        "--proxy-url", help="wmsproxy to invalidate, e.g. http://wmsproxy:8000"
+    )
+    parser.add_argument(
+        "--hot", type=int, default=500, help="Hot tiles to refresh per tileset"
+    )
+    parser.add_argument(
+        "--seed-zoom", type=parse_zooms, help="Also seed these zooms, e.g. 0-3"
+    )
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--interval", type=float, default=5.0, help="Poll interval (s)")
+    parser.add_argument(
+        "--trigger",
+        nargs="+",
+        metavar="PATH",
+        help="Handle these data files once and exit",
+    )
+    parser.add_argument("--metrics-port", type=int, default=0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    if not args.cache_base:
+        disk = [
+            c for c in load_config(args.mapcache).caches.values() if c["type"] == "disk"
+        ]
+        args.cache_base = disk[0]["base"] if disk else "/tmp/cache"
+    refresher = Refresher(args)
+    if args.trigger:
+        refresher.handle(args.trigger)
+        return 0
+
+    metrics.start_http_server(args.metrics_port)
+    watcher = DataWatcher(refresher.layers_by_path)
+    log.info("Watching %d data files every %.0fs", len(watcher.paths), args.interval)
+    while True:
+        changed = watcher.poll()
+        if changed:
+            refresher.handle(changed)
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
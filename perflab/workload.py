@@ -0,0 +1,219 @@
+"""Declarative workload engine for the Locust users.
+
+Scenarios live in scenarios.json. Each scenario lists weighted tasks whose
+parameters are expanded once, at first use, into prebuilt request URLs. A
+task execution is then a single weighted pick plus an HTTP GET, so the load
+generator spends its CPU on sending requests instead of building them.
+
+Parameter values in a task may be:
+
+- a scalar, sent as-is (``null`` removes a default parameter)
+- a list, one alternative picked uniformly per request
+- a nested list, a group picked uniformly, then an item within the group
+- ``"@NAME"``, a reference to a list in the scenario file's ``sets``
+- ``"@layers:MAP"`` or ``"@layers:MAP:STYLE"``, the matching layer names
+  from the mapfiles (perflab.catalog)
+
+The pseudo-parameter ``SIZE`` takes ``"WIDTHxHEIGHT"`` strings and expands
+into ``WIDTH`` and ``HEIGHT``. Requests with a ``MAP`` parameter must only
+name layers that exist in that mapfile.
+
+With PERFLAB_SEED set, every user draws from its own RNG seeded with the
+seed, its class and its spawn index, so runs replay the same request
+sequence (perflab.bench relies on this).
+"""
+
+import bisect
+import collections
+import itertools
+import json
+import os
+import random
+from urllib.parse import urlencode
+
+from locust import HttpUser, task
+
+from perflab import catalog
+
+DEFAULT_SCENARIO_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scenarios.json"
+)
+
+DEFAULT_STYLES = {"_contour": "contour", "_numbers": "numbers"}
+
+_scenario_cache = {}
+_user_counters = collections.defaultdict(itertools.count)
+
+
+def scenario_file():
+    """Path of the scenario file, overridable with PERFLAB_SCENARIOS"""
+    return os.environ.get("PERFLAB_SCENARIOS", DEFAULT_SCENARIO_FILE)
+
+
+def load_scenarios(path=None):
+    """Load and expand every scenario in a scenario file (cached per path)"""
+    path = path or scenario_file()
+    if path not in _scenario_cache:
+        with open(path) as f:
+            config = json.load(f)
+        sets = config.get("sets", {})
+        defaults = config.get("defaults", {})
+        _scenario_cache[path] = {
+            name: Scenario(name, spec, defaults, sets)
+            for name, spec in config["scenarios"].items()
+        }
+    return _scenario_cache[path]
+
+
+def user_rng(user):
+    """Per-user RNG, reproducible across runs when PERFLAB_SEED is set"""
+    seed = os.environ.get("PERFLAB_SEED")
+    if not seed:
+        return random.Random()
+    name = type(user).__name__
+    return random.Random(f"{seed}:{name}:{next(_user_counters[name])}")
+
+
+def get_scenario(name, path=None):
+    scenarios = load_scenarios(path)
+    if name not in scenarios:
+        raise KeyError(f"Unknown scenario {name!r} in {path or scenario_file()}")
+    return scenarios[name]
+
+
+class Scenario:
+    """A scenario expanded into weighted, prebuilt request templates.
+
+    Each template is a tuple of ``(url, name)`` pairs that are requested in
+    order; plain tasks produce one pair, ``sequence`` tasks several.
+    """
+
+    def __init__(self, name, spec, defaults, sets):
+        self.name = name
+        self.path = spec.get("path", "/cgi-bin/mapserv")
+        self.wait_time = tuple(spec.get("wait_time", (0.5, 1.5)))
+        self.styles = spec.get("styles", DEFAULT_STYLES)
+        self.default_style = spec.get("default_style", "gradient")
+
+        defaults = {**defaults, **spec.get("defaults", {})}
+        self.templates = []
+        weights = []
+        for task_spec in spec["tasks"]:
+            for template, fraction in self._expand_task(task_spec, defaults, sets):
+                self.templates.append(template)
+                weights.append(task_spec.get("weight", 1) * fraction)
+        if not self.templates:
+            raise ValueError(f"Scenario {name!r} has no tasks")
+        self.cum_weights = list(itertools.accumulate(weights))
+        self.total_weight = self.cum_weights[-1]
+
+    def pick(self, rng=random):
+        """Weighted pick of one prebuilt template"""
+        i = bisect.bisect_right(self.cum_weights, rng.random() * self.total_weight)
+        return self.templates[min(i, len(self.templates) - 1)]
+
+    def _expand_task(self, task_spec, defaults, sets):
+        path = task_spec.get("path", self.path)
+        steps = task_spec.get("sequence", [task_spec])
+        expanded = [
+            self._expand_request(step.get("path", path), step, defaults, sets)
+            for step in steps
+        ]
+        for combo in itertools.product(*expanded):
+            template = tuple(request for request, _ in combo)
+            fraction = 1.0
+            for _, f in combo:
+                fraction *= f
+            yield template, fraction
+
+    def _expand_request(self, path, spec, defaults, sets):
+        params = {**defaults, **spec.get("params", {})}
+        keys = []
+        choices = []
+        for key, value in params.items():
+            if value is None:
+                continue
+            keys.append(key)
+            choices.append(_alternatives(value, sets))
+
+        requests = []
+        for combo in itertools.product(*choices):
+            query = {}
+            fraction = 1.0
+            for key, (value, f) in zip(keys, combo):
+                fraction *= f
+                if key == "SIZE":
+                    query["WIDTH"], query["HEIGHT"] = str(value).split("x")
+                else:
+                    query[key] = str(value)
+            _check_layers(query)
+            url = f"{path}?{urlencode(query)}"
+            name = spec["name"].format(**self._name_fields(query))
+            requests.append(((url, name), fraction))
+        return requests
+
+    def _name_fields(self, query):
+        layers = query.get("LAYERS", "")
+        base = layers.split(",")[0]
+        style = self.default_style
+        for suffix, suffix_style in self.styles.items():
+            if base.endswith(suffix):
+                base = base[: -len(suffix)]
+                style = suffix_style
+                break
+        return {
+            "layer": layers,
+            "base": base,
+            "style": style,
+            "map": query.get("MAP", "").lower(),
+        }
+
+
+def _check_layers(query):
+    if "MAP" not in query or "LAYERS" not in query:
+        return
+    layers = catalog.load()
+    unknown = [
+        name
+        for name in query["LAYERS"].split(",")
+        if layers.get(query["MAP"], name) is None
+    ]
+    if unknown:
+        raise ValueError(f"Unknown {query['MAP']} layers {unknown} in scenario")
+
+
+def _alternatives(value, sets):
+    """Expand a parameter value into ``(value, probability)`` pairs"""
+    if isinstance(value, str) and value.startswith("@layers:"):
+        value = catalog.load().reference(value[len("@layers:") :])
+    elif isinstance(value, str) and value.startswith("@"):
+        value = sets[value[1:]]
+    if not isinstance(value, list):
+        return [(value, 1.0)]
+    result = []
+    for item in value:
+        for v, f in _alternatives(item, sets):
+            result.append((v, f / len(value)))
+    return result
+
+
+class ScenarioUser(HttpUser):
+    """Base user that replays the weighted templates of one scenario"""
+
+    abstract = True
+    host = "http://nginx"
+    scenario = None
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        self.workload = get_scenario(self.scenario)
+        self.rng = user_rng(self)
+
+    def wait_time(self):
+        low, high = self.workload.wait_time
+        return low + self.rng.random() * (high - low)
+
+    @task
+    def run_scenario(self):
+        for url, name in self.workload.pick(self.rng):
+            self.client.get(url, name=name)
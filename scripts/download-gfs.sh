@@ -29,33 +29,25 @@ RUN_HOUR=$(printf "%02d" $RUN_HOUR)
 echo "Attempting to download GFS run: ${DATE} ${RUN_HOUR}Z"
 echo ""
 
-# Download a few forecast hours for the t2m (2m temperature) variable
-# Using the 0.25 degree resolution pgrb2 files
-for FORECAST in 000 003 006; do
-    FILENAME="gfs.t${RUN_HOUR}z.pgrb2.0p25.f${FORECAST}"
-    URL="${BASE_URL}/gfs.${DATE}/${RUN_HOUR}/atmos/${FILENAME}"
-    
-    if [ -f "${FILENAME}.grb2" ]; then
-        echo "  [skip] ${FILENAME}.grb2 already exists"
-    else
-        echo "  [download] ${FILENAME} ..."
-        # Download only the TMP:2 m above ground variable to reduce file size
-        # Full file would be ~300MB, filtered is ~1MB
-        curl -s -f "${URL}" -o "${FILENAME}.grb2" 2>/dev/null || {
-            echo "  [warn] Failed to download ${FILENAME}, trying alternate URL..."
-            # Try alternate: filter for 2m temperature only using NOMADS filter
-            FILTER_URL="https://nomads.ncep.noaa.gov/cgi-bin/filter_gfs_0p25.pl?file=${FILENAME}&var_TMP=on&lev_2_m_above_ground=on&dir=%2Fgfs.${DATE}%2F${RUN_HOUR}%2Fatmos"
-            curl -s -f "${FILTER_URL}" -o "${FILENAME}.grb2" 2>/dev/null || {
-                echo "  [error] Could not download ${FILENAME}"
-            }
-        }
-    fi
+# Download a few forecast hours of the 0.25 degree pgrb2 files. Only the
+# GRIB2 messages the mapfiles use are fetched, by byte range from the .idx
+# inventory (perflab.ingest.subset): a few MB per hour instead of ~500MB.
+# GFS_FORECAST_HOURS="$(seq -f %03g 0 3 384)" fetches the full animation range
+URLS=()
+for FORECAST in ${GFS_FORECAST_HOURS:-000 003 006}; do
+    URLS+=("${BASE_URL}/gfs.${DATE}/${RUN_HOUR}/atmos/gfs.t${RUN_HOUR}z.pgrb2.0p25.f${FORECAST}")
 done
+docker compose -f "$PROJECT_DIR/docker-compose.yaml" run --rm ingest \
+    python3 -m perflab.ingest.subset --dest /data --keep-existing "${URLS[@]}" || \
+    echo "  [warn] Some GFS files could not be downloaded"
 
 echo ""
 echo "=== Download Complete ==="
 ls -la *.grb2 2>/dev/null || echo "No .grb2 files downloaded"
 echo ""
-echo "Tip: For better performance, create GDAL overviews:"
-echo "  docker run --rm -v \$(pwd):/data osgeo/gdal gdaladdo -ro /data/*.grb2 2 4 8 16"
+
+# Extract the bands the mapfiles use into tiled COGs, then trace contours
+echo "=== Building COGs and contours ==="
+docker compose -f "$PROJECT_DIR/docker-compose.yaml" run --rm ingest || \
+    echo "[warn] COG ingest failed; layers reading /data/cog or /data/contours will render empty"
 echo ""
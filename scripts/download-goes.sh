@@ -114,50 +114,11 @@ echo "=== GOES Download Complete ==="
 ls -la *.nc 2>/dev/null || echo "No .nc files downloaded"
 echo ""
 
-# Convert NetCDF to GeoTIFF and reproject to EPSG:4326
-echo "=== Converting to GeoTIFF and Reprojecting to EPSG:4326 ==="
-echo ""
-
-if command -v docker &> /dev/null; then
-    for NC_FILE in *.nc; do
-        if [ -f "$NC_FILE" ]; then
-            BASE_NAME="${NC_FILE%.nc}"
-            TIFF_FILE="${BASE_NAME}.tif"
-            TIFF_4326="${BASE_NAME}_4326.tif"
-            
-            echo "Processing $NC_FILE..."
-            
-            # Step 1: Convert NetCDF to GeoTIFF (native projection)
-            docker run --rm -v "$DATA_DIR:/data" \
-                ghcr.io/osgeo/gdal:ubuntu-full-latest \
-                gdal_translate -q -of GTiff \
-                "NETCDF:/data/$NC_FILE:CMI" \
-                "/data/$TIFF_FILE" 2>/dev/null || {
-                    echo "  [error] NetCDF conversion failed for $NC_FILE"
-                    continue
-                }
-            
-            # Step 2: Reproject to EPSG:4326 for MapServer compatibility
-            docker run --rm -v "$DATA_DIR:/data" \
-                ghcr.io/osgeo/gdal:ubuntu-full-latest \
-                gdalwarp -q -t_srs EPSG:4326 -r bilinear \
-                "/data/$TIFF_FILE" \
-                "/data/$TIFF_4326" 2>/dev/null || {
-                    echo "  [error] Reprojection failed for $TIFF_FILE"
-                    continue
-                }
-            
-            SIZE=$(ls -lh "$TIFF_4326" 2>/dev/null | awk '{print $5}')
-            echo "  [ok] $TIFF_4326 ($SIZE)"
-            
-            # Clean up intermediate file
-            rm -f "$TIFF_FILE"
-        fi
-    done
-else
-    echo "[warn] Docker not available for GDAL conversion"
-    echo "Install Docker or manually convert GOES files to GeoTIFF EPSG:4326"
-fi
+# Resample the fixed-grid scans to EPSG:4326 through cached lookup tables
+# (perflab.ingest.goes), then build the 3857 copies and the rest
+echo "=== Resampling to EPSG:4326 ==="
+docker compose -f "$PROJECT_DIR/docker-compose.yaml" run --rm ingest || \
+    echo "[warn] GOES ingest failed; goes.map layers will render stale or empty"
 
 echo ""
 echo "=== Final Files ==="
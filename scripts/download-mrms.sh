@@ -26,33 +26,24 @@ declare -A PRODUCTS=(
 echo "Downloading latest MRMS products..."
 echo ""
 
+# One gzipped GRIB2 message per product: fetched concurrently over
+# keep-alive connections, gunzipped and verified by perflab.ingest.subset
+ITEMS=()
 for KEY in "${!PRODUCTS[@]}"; do
     PRODUCT="${PRODUCTS[$KEY]}"
-    OUTPUT_FILE="${KEY}_latest.grib2"
-    
-    echo "[$KEY] $PRODUCT"
-    
-    # Use the .latest file (always current)
-    DOWNLOAD_URL="${BASE_URL}/${PRODUCT}/MRMS_${PRODUCT}.latest.grib2.gz"
-    
-    echo "  [download] MRMS_${PRODUCT}.latest.grib2.gz"
-    
-    if curl -sL -f "$DOWNLOAD_URL" 2>/dev/null | gunzip > "$OUTPUT_FILE" 2>/dev/null; then
-        if [ -s "$OUTPUT_FILE" ]; then
-            SIZE=$(ls -lh "$OUTPUT_FILE" | awk '{print $5}')
-            echo "  [ok] Saved as $OUTPUT_FILE ($SIZE)"
-        else
-            echo "  [error] Downloaded file is empty"
-            rm -f "$OUTPUT_FILE"
-        fi
-    else
-        echo "  [error] Failed to download $PRODUCT"
-        rm -f "$OUTPUT_FILE"
-    fi
-    
-    echo ""
+    ITEMS+=("${KEY}_latest.grib2=${BASE_URL}/${PRODUCT}/MRMS_${PRODUCT}.latest.grib2.gz")
 done
+docker compose -f "$PROJECT_DIR/docker-compose.yaml" run --rm ingest \
+    python3 -m perflab.ingest.subset --dest /data/mrms "${ITEMS[@]}" || \
+    echo "  [warn] Some MRMS products could not be downloaded"
+echo ""
 
 echo "=== MRMS Download Complete ==="
 ls -la *.grib2 2>/dev/null || echo "No .grib2 files downloaded"
 echo ""
+
+# Extract the bands the mapfiles use into tiled COGs, then trace contours
+echo "=== Building COGs and contours ==="
+docker compose -f "$PROJECT_DIR/docker-compose.yaml" run --rm ingest || \
+    echo "[warn] COG ingest failed; layers reading /data/cog or /data/contours will render empty"
+echo ""
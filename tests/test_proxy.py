@@ -0,0 +1,42 @@
+import http.client
+import threading
+
+from perflab import proxy
+from perflab.mapcache import load_config
+from perflab.upstream import Response
+
+
+class FakeUpstream:
+    def __init__(self, response):
+        self.response = response
+        self.paths = []
+
+    def get(self, path, headers=None):
+        self.paths.append(path)
+        return self.response
+
+
+def serve(tile_proxy):
+    handler = type("Handler", (proxy.ProxyHandler,), {"proxy": tile_proxy})
+    server = proxy.ProxyServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_passthrough_returns_upstream_response():
+    upstream = FakeUpstream(
+        Response(200, {"Content-Type": "text/xml"}, b"<WMS_Capabilities/>")
+    )
+    server = serve(proxy.TileProxy(upstream, load_config(), 1024 * 1024))
+    try:
+        connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+        connection.request("GET", "/?MAP=GFS&SERVICE=WMS&REQUEST=GetCapabilities")
+        response = connection.getresponse()
+        assert response.status == 200
+        assert response.getheader("Content-Type") == "text/xml"
+        assert response.getheader("X-Tile-Proxy").startswith("passthrough")
+        assert response.read() == b"<WMS_Capabilities/>"
+        assert len(upstream.paths) == 1
+    finally:
+        server.shutdown()
+        server.server_close()